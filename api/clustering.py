@@ -1,14 +1,17 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint
 from sklearn.cluster import KMeans
 import numpy as np
+from sgai.services import admission, codecs, metrics
 
 bp = Blueprint('clustering', __name__)
 
 @bp.route('/cluster', methods=['POST'])
 def cluster():
-    data = request.get_json()
-    X = np.array(data['features'])
+    data = codecs.read_payload('features')
+    X = np.asarray(data['features'])
+    admission.check_cells(X.size)
     n_clusters = int(data.get('n_clusters', 3))
     kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    labels = kmeans.fit_predict(X)
-    return jsonify({'labels': labels.tolist()})
+    with metrics.phase('infer'):
+        labels = kmeans.fit_predict(X)
+    return codecs.respond({'labels': labels}, 'labels')
@@ -5,22 +5,42 @@ from tensorflow.keras.applications.mobilenet_v2 import preprocess_input, decode_
 from PIL import Image
 import numpy as np
 import io
+import time
+from sgai.services import admission, metrics, image_cache
 
 bp = Blueprint('diagnostic', __name__)
 
+_load_start = time.perf_counter()
 model = MobileNetV2(weights='imagenet')
+metrics.record_model_load('mobilenet_v2', time.perf_counter() - _load_start, 0)
 
 @bp.route('/detect_disease', methods=['POST'])
 def detect_disease():
     if 'image' not in request.files:
         return jsonify({'error': 'No image uploaded'}), 400
-    file = request.files['image']
-    img = Image.open(file.stream).convert('RGB').resize((224, 224))
-    arr = np.array(img)
-    arr = np.expand_dims(arr, axis=0)
-    arr = preprocess_input(arr)
-    preds = model.predict(arr)
+    data = request.files['image'].read()
+    # Doublon exact : résultat servi sans décoder l'image
+    key = image_cache.content_key(data)
+    cached = image_cache.lookup_exact(key)
+    if cached is not None:
+        return jsonify({'predictions': cached, 'cache_hit': True, 'cache_match': 'exact'})
+    with metrics.phase('preprocess'):
+        img = Image.open(io.BytesIO(data))
+        # Dimensions lues dans l'en-tête : une image géante est refusée avant décodage
+        admission.check_pixels(img)
+        img = img.convert('RGB')
+        # Image quasi identique (recompressée, redimensionnée) : pas de passe MobileNetV2
+        cached, phash = image_cache.lookup_similar(img)
+        if cached is not None:
+            image_cache.put(key, phash, cached)
+            return jsonify({'predictions': cached, 'cache_hit': True, 'cache_match': 'perceptual'})
+        img = img.resize((224, 224))
+        arr = np.array(img)
+        arr = np.expand_dims(arr, axis=0)
+        arr = preprocess_input(arr)
+    with metrics.phase('infer'):
+        preds = model.predict(arr)
     decoded = decode_predictions(preds, top=3)[0]
-    return jsonify({'predictions': [
-        {'label': label, 'prob': float(prob)} for (_, label, prob) in decoded
-    ]})
+    predictions = [{'label': label, 'prob': float(prob)} for (_, label, prob) in decoded]
+    image_cache.put(key, phash, predictions)
+    return jsonify({'predictions': predictions, 'cache_hit': False})
@@ -1,15 +1,20 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint
 from scipy.optimize import linprog
 import numpy as np
+from sgai.services import admission, codecs, metrics
 
 bp = Blueprint('optimization', __name__)
 
 @bp.route('/optimize', methods=['POST'])
 def optimize():
-    data = request.get_json()
-    c = np.array(data['costs'])
-    A_ub = np.array(data['A_ub'])
-    b_ub = np.array(data['b_ub'])
+    data = codecs.read_payload('A_ub')
+    c = np.asarray(data['costs'])
+    A_ub = np.asarray(data['A_ub'])
+    admission.check_cells(A_ub.size)
+    b_ub = np.asarray(data['b_ub'])
     bounds = data.get('bounds', None)
-    res = linprog(c, A_ub=A_ub, b_ub=b_ub, bounds=bounds)
-    return jsonify({'success': res.success, 'x': res.x.tolist(), 'fun': res.fun})
+    if isinstance(bounds, np.ndarray):
+        bounds = bounds.tolist()
+    with metrics.phase('infer'):
+        res = linprog(c, A_ub=A_ub, b_ub=b_ub, bounds=bounds)
+    return codecs.respond({'success': res.success, 'x': res.x, 'fun': res.fun}, 'x')
@@ -0,0 +1,188 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from datetime import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
+import logging
+import numpy as np
+from sgai.ml import production
+from sgai.ml.engine import engine
+from sgai.services import admission, codecs
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('production', __name__)
+
+
+def _is_loaded():
+    return engine.is_loaded(production.ENGINE_NAME)
+
+
+@bp.route('/health', methods=['GET'])
+def health_check():
+    """Point de santé de l'API"""
+    return jsonify({
+        'status': 'healthy',
+        'model_loaded': _is_loaded(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+@bp.route('/load_model', methods=['POST'])
+@jwt_required()
+def load_model():
+    """Charge le modèle ; s'il est déjà servi, le recharge à chaud sans interrompre les prédictions"""
+    try:
+        if not _is_loaded():
+            predictor = production.get_predictor()
+            return jsonify({
+                'success': True,
+                'message': 'Modèle chargé avec succès',
+                'metadata': predictor.metadata
+            })
+
+        # ?wait=1 : attendre la fin du rechargement au lieu de répondre 202
+        status = production.reload(wait=request.args.get('wait') == '1')
+        if status['state'] == 'failed':
+            return jsonify({
+                'success': False,
+                'message': f"Échec du rechargement, la version courante reste en service: {status['error']}",
+                'swap': status
+            }), 500
+        ready = status['state'] == 'ready'
+        return jsonify({
+            'success': True,
+            'message': 'Nouvelle version du modèle en service' if ready else 'Rechargement du modèle en cours',
+            'swap': status,
+            'metadata': production.get_predictor().metadata
+        }), 200 if ready else 202
+    except Exception as e:
+        logger.error(f"Erreur lors du chargement du modèle: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Erreur lors du chargement du modèle: {str(e)}'
+        }), 500
+
+
+@bp.route('/predict', methods=['POST'])
+@jwt_required()
+def predict():
+    """Endpoint de prédiction"""
+    try:
+        if not _is_loaded():
+            return jsonify({
+                'success': False,
+                'message': 'Modèle non chargé. Veuillez d\'abord charger le modèle.'
+            }), 400
+
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'success': False,
+                'message': 'Données d\'entrée manquantes'
+            }), 400
+
+        prediction = float(production.predict_many([data])[0])
+
+        return jsonify({
+            'success': True,
+            'prediction': prediction,
+            'input_data': data,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"Erreur lors de la prédiction: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Erreur lors de la prédiction: {str(e)}'
+        }), 500
+
+
+@bp.route('/model_info', methods=['GET'])
+@jwt_required()
+def model_info():
+    """Retourne les informations sur le modèle"""
+    if not _is_loaded():
+        return jsonify({
+            'success': False,
+            'message': 'Modèle non chargé'
+        }), 400
+
+    predictor = production.get_predictor()
+    return jsonify({
+        'success': True,
+        'metadata': predictor.metadata,
+        'feature_names': predictor.feature_names,
+        'model_loaded': True,
+        'version': engine.status(production.ENGINE_NAME)
+    })
+
+
+@bp.route('/predict_batch', methods=['POST'])
+@jwt_required()
+def predict_batch():
+    """Prédictions en lot (un seul appel au modèle pour tout le lot)"""
+    try:
+        if not _is_loaded():
+            return jsonify({
+                'success': False,
+                'message': 'Modèle non chargé'
+            }), 400
+
+        data = codecs.read_payload('batch')
+        if not data or 'batch' not in data:
+            return jsonify({
+                'success': False,
+                'message': 'Format de données invalide. Attendu: {"batch": [...]}'
+            }), 400
+
+        batch_data = data['batch']
+        admission.check_cells(len(batch_data) * max(1, len(production.get_predictor().feature_names)))
+        if codecs.response_format() != codecs.JSON or not isinstance(batch_data, list):
+            # Formats binaires : lot tabulaire, prédictions renvoyées en un seul tableau
+            rows = codecs.to_frame(batch_data, production.get_predictor().feature_names)
+            values = np.asarray(production.predict_many(rows), dtype=float).ravel()
+            return codecs.respond({
+                'success': True,
+                'predictions': values,
+                'total_processed': len(values),
+                'timestamp': datetime.now().isoformat()
+            }, 'predictions')
+
+        try:
+            values = production.predict_many(batch_data)
+            predictions = [
+                {'input': item, 'prediction': float(pred), 'success': True}
+                for item, pred in zip(batch_data, values)
+            ]
+        except Exception:
+            # Un élément invalide fait échouer le lot : on isole les erreurs élément par élément
+            predictions = []
+            for item in batch_data:
+                try:
+                    predictions.append({
+                        'input': item,
+                        'prediction': float(production.predict_many([item])[0]),
+                        'success': True
+                    })
+                except Exception as e:
+                    predictions.append({
+                        'input': item,
+                        'error': str(e),
+                        'success': False
+                    })
+
+        return jsonify({
+            'success': True,
+            'predictions': predictions,
+            'total_processed': len(predictions),
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Erreur lors des prédictions en lot: {str(e)}'
+        }), 500
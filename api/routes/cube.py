@@ -0,0 +1,38 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from sgai.ml import cube
+from sgai.services import metrics
+
+bp = Blueprint('cube', __name__)
+
+@bp.route('/api/cube', methods=['GET'])
+@jwt_required()
+def cube_schema():
+    """Dimensions (avec leurs membres), mesures et agrégats disponibles"""
+    return jsonify(cube.get().describe())
+
+@bp.route('/api/cube/query', methods=['POST'])
+@jwt_required()
+def cube_query():
+    """
+    Agrégats précalculés, ex :
+    {"measures": ["production"], "group_by": ["region", "year"],
+     "filters": {"group": "Céréales", "year": [2016, 2017]}, "rollup": true}
+    Dimensions : region, crop, group, year. Sans region, chiffres nationaux.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Corps attendu : {"measures": [...], "group_by": [...], "filters": {...}}'}), 400
+    with metrics.phase('build'):
+        data_cube = cube.get()
+    with metrics.phase('query'):
+        try:
+            result = data_cube.query(
+                measures=data.get('measures'),
+                group_by=data.get('group_by', []),
+                filters=data.get('filters'),
+                rollup=bool(data.get('rollup', False)),
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify({'rows': cube.to_records(result), 'count': len(result)})
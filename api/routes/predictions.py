@@ -2,89 +2,255 @@
 
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
+from werkzeug.exceptions import RequestEntityTooLarge
 from sgai.ml import models
 import pandas as pd
 import numpy as np
+import os
+from sgai.ml import families, prediction_table, sweep
+from sgai.ml.engine import engine
+from sgai.services import admission, codecs, metrics
 from .validation import validate_and_prepare_features
 
 bp = Blueprint('predictions', __name__)
 
+# Quantiles renvoyés par défaut avec "interval": true (intervalle à 90 %)
+DEFAULT_QUANTILES = [0.05, 0.95]
+
 @bp.route('/api/predict/production', methods=['POST'])
 @jwt_required()
 def predict_production():
     import joblib
-    data = request.get_json()
-    X = pd.DataFrame([data['features']])
-    meta = joblib.load('models/meta_production_model.joblib')
+    data = codecs.read_payload('features')
+    with metrics.phase('load'):
+        meta = joblib.load('models/meta_production_model.joblib')
     expected_columns = meta['features']
     encoders = meta.get('encoders', None)
     try:
-        x_valid = validate_and_prepare_features(X, expected_columns, encoders)
+        X = codecs.to_frame(data['features'], expected_columns)
+        with metrics.phase('preprocess'):
+            x_valid = validate_and_prepare_features(X, expected_columns, encoders)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
     y_pred = models.predict_production(x_valid)
-    return jsonify({'prediction': float(y_pred[0])})
+    return codecs.respond({'prediction': float(y_pred[0])}, 'prediction')
 
 @bp.route('/api/predict/costs', methods=['POST'])
 @jwt_required()
 def predict_costs():
     import joblib
-    data = request.get_json()
-    X = pd.DataFrame([data['features']])
-    meta = joblib.load('models/meta_cost_model.joblib')
+    data = codecs.read_payload('features')
+    with metrics.phase('load'):
+        meta = joblib.load('models/meta_cost_model.joblib')
     expected_columns = meta['features']
     encoders = meta.get('encoders', None)
     try:
-        x_valid = validate_and_prepare_features(X, expected_columns, encoders)
+        X = codecs.to_frame(data['features'], expected_columns)
+        with metrics.phase('preprocess'):
+            x_valid = validate_and_prepare_features(X, expected_columns, encoders)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
     y_pred = models.predict_cost_variation(x_valid)
-    return jsonify({'prediction': float(y_pred[0])})
+    return codecs.respond({'prediction': float(y_pred[0])}, 'prediction')
 
 @bp.route('/api/predict/weather', methods=['POST'])
 @jwt_required()
 def predict_weather():
     import joblib
-    data = request.get_json()
-    X = pd.DataFrame([data['features']])
-    meta = joblib.load('models/meta_weather_model.joblib')
+    data = codecs.read_payload('features')
+    with metrics.phase('load'):
+        meta = joblib.load('models/meta_weather_model.joblib')
     expected_columns = meta['features']
     encoders = meta.get('encoders', None)
     try:
-        x_valid = validate_and_prepare_features(X, expected_columns, encoders)
+        X = codecs.to_frame(data['features'], expected_columns)
+        with metrics.phase('preprocess'):
+            x_valid = validate_and_prepare_features(X, expected_columns, encoders)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
     y_pred = models.predict_weather(x_valid)
-    return jsonify({'prediction': float(y_pred[0])})
+    return codecs.respond({'prediction': float(y_pred[0])}, 'prediction')
 
 @bp.route('/api/predict/inflation', methods=['POST'])
 @jwt_required()
 def predict_inflation():
     import joblib
-    data = request.get_json()
-    X = pd.DataFrame([data['features']])
-    meta = joblib.load('models/meta_inflation_model.joblib')
+    data = codecs.read_payload('features')
+    with metrics.phase('load'):
+        meta = joblib.load('models/meta_inflation_model.joblib')
     expected_columns = meta['features']
     encoders = meta.get('encoders', None)
     try:
-        x_valid = validate_and_prepare_features(X, expected_columns, encoders)
+        X = codecs.to_frame(data['features'], expected_columns)
+        with metrics.phase('preprocess'):
+            x_valid = validate_and_prepare_features(X, expected_columns, encoders)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
     y_pred = models.predict_inflation(x_valid)
-    return jsonify({'prediction': float(y_pred[0])})
+    return codecs.respond({'prediction': float(y_pred[0])}, 'prediction')
 
 @bp.route('/api/predict/volatility', methods=['POST'])
 @jwt_required()
 def predict_volatility():
     import joblib
-    data = request.get_json()
-    X = pd.DataFrame([data['features']])
-    meta = joblib.load('models/meta_volatility_model.joblib')
+    data = codecs.read_payload('features')
+    with metrics.phase('load'):
+        meta = joblib.load('models/meta_volatility_model.joblib')
     expected_columns = meta['features']
     encoders = meta.get('encoders', None)
     try:
-        x_valid = validate_and_prepare_features(X, expected_columns, encoders)
+        X = codecs.to_frame(data['features'], expected_columns)
+        with metrics.phase('preprocess'):
+            x_valid = validate_and_prepare_features(X, expected_columns, encoders)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
     y_pred = models.predict_volatility(x_valid)
-    return jsonify({'prediction': float(y_pred[0])})
+    return codecs.respond({'prediction': float(y_pred[0])}, 'prediction')
+
+@bp.route('/api/predict/rf/<model_name>', methods=['POST'])
+@jwt_required()
+def predict_rf(model_name):
+    """
+    Prédiction par un modèle RF de models/ (table précalculée, puis inférence live hors grille).
+    Avec "interval": true ou {"quantiles": [0.05, 0.95]}, ajoute l'écart-type et les quantiles
+    des prédictions des arbres de la forêt (toujours calculés en live).
+    """
+    if model_name not in models.list_rf_models():
+        return jsonify({'error': f"Modèle inconnu: {model_name}"}), 404
+    data = codecs.read_payload('features')
+    if not isinstance(data, dict) or 'features' not in data:
+        return jsonify({'error': 'Corps attendu : {"features": [...]}'}), 400
+    try:
+        interval = data.get('interval')
+        features = models.load_rf_bundle(model_name)['meta']['features']
+        X = codecs.to_frame(data['features'], features)
+        admission.check_cells(X.size)
+        if interval:
+            quantiles = interval.get('quantiles', DEFAULT_QUANTILES) if isinstance(interval, dict) else DEFAULT_QUANTILES
+            quantiles = [float(q) for q in quantiles]
+            if not all(0.0 <= q <= 1.0 for q in quantiles):
+                raise ValueError("Les quantiles doivent être compris entre 0 et 1")
+            y_pred, std, bounds = models.predict_rf_intervals(model_name, X, quantiles)
+            return codecs.respond({
+                'predictions': y_pred, 'std': std, 'quantiles': quantiles, 'intervals': bounds,
+                'precomputed': 0,
+            }, 'predictions')
+        y_pred, hits = prediction_table.predict_with_table(model_name, X)
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    return codecs.respond({'predictions': np.asarray(y_pred, dtype=float), 'precomputed': hits}, 'predictions')
+
+@bp.route('/api/predict/rf/<model_name>/explain', methods=['POST'])
+@jwt_required()
+def explain_rf(model_name):
+    """
+    Explication de chaque prédiction d'un modèle RF par décomposition des chemins des arbres :
+    prédiction = biais + somme des contributions des features.
+    """
+    if model_name not in models.list_rf_models():
+        return jsonify({'error': f"Modèle inconnu: {model_name}"}), 404
+    data = codecs.read_payload('features')
+    try:
+        features = models.load_rf_bundle(model_name)['meta']['features']
+        X = codecs.to_frame(data['features'], features)
+        admission.check_cells(X.size)
+        features, bias, y_pred, contributions = models.explain_rf(model_name, X)
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    return codecs.respond({
+        'features': list(features), 'bias': bias, 'predictions': y_pred, 'contributions': contributions,
+    }, 'contributions')
+
+@bp.route('/api/predict/rf/<model_name>/sweep', methods=['POST'])
+@jwt_required()
+def sweep_rf(model_name):
+    """
+    Balayage what-if d'un modèle RF en un seul appel vectorisé.
+    Corps : {"grid": {"Superficie": {"start": 0, "stop": 1e5, "num": 50}}, "base": {...}}
+    ou, en dépendance partielle, {"mode": "partial_dependence", "grid": ..., "background": [...] | "sample": 200, "ice": false}
+    """
+    if model_name not in models.list_rf_models():
+        return jsonify({'error': f"Modèle inconnu: {model_name}"}), 404
+    data = codecs.read_payload('background')
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Corps attendu : {"grid": {...}, "base": {...}}'}), 400
+    mode = data.get('mode', 'curve')
+    try:
+        if mode == 'partial_dependence':
+            background = data.get('background')
+            background = codecs.to_frame(background) if background is not None else None
+            grids, y_pred, curves, n_background = sweep.partial_dependence(
+                model_name, data['grid'], background, int(data.get('sample', sweep.DEFAULT_BACKGROUND_SIZE)),
+                bool(data.get('ice'))
+            )
+            extra = {'background_size': n_background}
+            if curves is not None:
+                extra['ice'] = curves
+        elif mode == 'curve':
+            grids, y_pred = sweep.sweep(model_name, data.get('base') or {}, data['grid'])
+            extra = {}
+        else:
+            return jsonify({'error': f"Mode inconnu: {mode} (curve ou partial_dependence)"}), 400
+    except KeyError as e:
+        return jsonify({'error': f"Champ manquant: {e}"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return codecs.respond({
+        'mode': mode,
+        'features': list(grids),
+        'grid': {feature: values for feature, values in grids.items()},
+        'predictions': y_pred,
+        **extra,
+    }, 'predictions')
+
+@bp.route('/api/predict/rf-families', methods=['GET'])
+@jwt_required()
+def list_rf_families():
+    """Familles de modèles RF par année et leurs membres"""
+    return jsonify({family: sorted(members) for family, members in families.families().items()})
+
+@bp.route('/api/predict/rf-family/<family>', methods=['POST'])
+@jwt_required()
+def predict_rf_family(family):
+    """Prédictions de tous les modèles annuels d'une famille en une requête (colonnes = années)"""
+    if family not in families.families():
+        return jsonify({'error': f"Famille inconnue: {family}"}), 404
+    data = codecs.read_payload('features')
+    try:
+        X = codecs.to_frame(data['features'])
+        admission.check_cells(X.size)
+        years = [int(year) for year in data.get('years') or []]
+        result_years, y_pred, skipped = families.predict_family(family, X, years)
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    return codecs.respond({
+        'family': family,
+        'years': result_years,
+        'predictions': y_pred,
+        'skipped': {str(year): missing for year, missing in skipped.items()},
+    }, 'predictions')
+
+@bp.route('/api/predict/rf/<model_name>/reload', methods=['POST'])
+@jwt_required()
+def reload_rf(model_name):
+    """Recharge à chaud les artefacts d'un modèle RF (202 tant que la nouvelle version n'est pas en service)"""
+    if model_name not in models.list_rf_models():
+        return jsonify({'error': f"Modèle inconnu: {model_name}"}), 404
+    status = models.reload_rf(model_name, wait=request.args.get('wait') == '1')
+    if status['state'] == 'failed':
+        return jsonify({'error': status['error'], 'swap': status}), 500
+    return jsonify({'swap': status}), 200 if status['state'] == 'ready' else 202
+
+@bp.route('/api/predict/rf/<model_name>/status', methods=['GET'])
+@jwt_required()
+def rf_status(model_name):
+    """Version servie, requêtes en cours et dernier rechargement d'un modèle RF, pour le worker qui répond"""
+    if model_name not in models.list_rf_models():
+        return jsonify({'error': f"Modèle inconnu: {model_name}"}), 404
+    return jsonify(dict(engine.status(models.rf_engine_name(model_name)), pid=os.getpid()))
@@ -1,8 +1,8 @@
-
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, send_file, url_for
 from flask_jwt_extended import jwt_required
-from sgai.services import report_generator
+from sgai.services import report_generator, report_jobs, report_cache
 import pandas as pd
+import itertools
 import os
 
 bp = Blueprint('report', __name__)
@@ -11,21 +11,111 @@ bp = Blueprint('report', __name__)
 @jwt_required()
 def generate_csv():
     data = request.get_json()
-    df = pd.DataFrame(data['data'])
-    output_path = data.get('output_path', 'results/rapport_auto.csv')
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    report_generator.generate_csv_report(df, output_path)
-    return jsonify({'status': 'ok', 'path': output_path})
+    if 'output_path' in data:
+        output_path = data['output_path']
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        report_generator.generate_csv_report(pd.DataFrame(data['data']), output_path)
+        return jsonify({'status': 'ok', 'path': output_path})
+    # Sans chemin explicite : stockage adressé par contenu, un seul rendu par contenu
+    key = report_cache.report_key('csv', data['data'])
+    path, cached = report_cache.store.get_or_render(
+        key, 'csv', lambda tmp_path: report_generator.generate_csv_report(pd.DataFrame(data['data']), tmp_path)
+    )
+    return jsonify({'status': 'ok', 'path': path, 'cached': cached})
 
 @bp.route('/api/report/docx', methods=['POST'])
 @jwt_required()
 def generate_docx():
+    """
+    Planifie un rapport DOCX en tâche de fond.
+    - plots : chemins d'images déjà rendues
+    - charts : graphiques à rendre côté serveur, ex: {"kind": "line", "x": "Année", "y": "Production"}
+    Sans output_path, un rapport identique déjà généré (ou en cours) est réutilisé.
+    """
     data = request.get_json()
     df = pd.DataFrame(data['data'])
     summary = data.get('summary', '')
     interpretation = data.get('interpretation', '')
     plots = data.get('plots', [])
-    output_path = data.get('output_path', 'results/rapport_auto.docx')
+    charts = data.get('charts', [])
+    output_path = data.get('output_path')
+    cache_key = None
+    if output_path is None:
+        cache_key = report_cache.report_key('docx', data['data'], summary, interpretation, plots, charts)
+    job_id = report_jobs.submit_docx(
+        df, summary=summary, plots=plots, interpretation=interpretation, charts=charts,
+        output_path=output_path, cache_key=cache_key,
+    )
+    job = report_jobs.get_job(job_id)
+    return jsonify({
+        'status': job['status'],
+        'cached': job['cached'],
+        'job_id': job_id,
+        'status_url': url_for('report.report_job', job_id=job_id),
+        'download_url': url_for('report.download_report', job_id=job_id),
+    }), 202
+
+@bp.route('/api/report/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def report_job(job_id):
+    job = report_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Tâche inconnue'}), 404
+    return jsonify(dict(job, job_id=job_id))
+
+@bp.route('/api/report/jobs/<job_id>/download', methods=['GET'])
+@jwt_required()
+def download_report(job_id):
+    job = report_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Tâche inconnue'}), 404
+    if job['status'] != 'done':
+        return jsonify({'status': job['status'], 'error': job['error']}), 409
+    return send_file(os.path.abspath(job['path']), as_attachment=True)
+
+@bp.route('/api/report/stream', methods=['POST'])
+@jwt_required()
+def generate_stream():
+    """
+    Rapport en flux pour les gros volumes.
+    - Corps NDJSON (application/x-ndjson, éventuellement en Transfer-Encoding: chunked)
+      ou JSON {"data": [...]}.
+    - ?format=csv|csv.gz|parquet
+    - ?download=1 renvoie le rapport en réponse chunkée au lieu de l'écrire sur disque.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in report_generator.STREAM_FORMATS:
+        return jsonify({'error': f"Format inconnu: {fmt}. Formats: {list(report_generator.STREAM_FORMATS)}"}), 400
+    extension, mimetype = report_generator.STREAM_FORMATS[fmt]
+    chunk_size = request.args.get('chunk_size', '10000')
+    if not chunk_size.isdigit() or int(chunk_size) < 1:
+        return jsonify({'error': f"chunk_size invalide: {chunk_size} (entier strictement positif attendu)"}), 400
+    chunk_size = int(chunk_size)
+    if request.mimetype == 'application/json':
+        chunks = report_generator.iter_record_chunks(request.get_json()['data'], chunk_size)
+    else:
+        chunks = report_generator.iter_ndjson_chunks(request.stream, chunk_size)
+    if request.args.get('download'):
+        # Premier chunk lu avant d'envoyer les en-têtes : une erreur dans les premières lignes donne
+        # un 400 ; plus loin, le transfert chunké est interrompu (sans le chunk final)
+        chunks = iter(chunks)
+        try:
+            first = next(chunks, None)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if first is not None:
+            chunks = itertools.chain([first], chunks)
+        body = stream_with_context(report_generator.iter_report_bytes(chunks, fmt))
+        return Response(body, mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename=rapport_auto.{extension}'
+        })
+    output_path = request.args.get('output_path', f'results/rapport_auto.{extension}')
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    report_generator.generate_docx_report(df, output_path, summary, plots, interpretation)
-    return jsonify({'status': 'ok', 'path': output_path})
+    try:
+        rows = report_generator.write_streaming_report(chunks, output_path, fmt)
+    except ValueError as e:
+        # Rapport incomplet : pas de fichier tronqué laissé sur disque
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'status': 'ok', 'path': output_path, 'rows': rows})
@@ -27,7 +27,8 @@ def validate_and_prepare_features(X, expected_columns, encoders=None, fillna_str
             X[col] = X[col].fillna(fill_value)
     # Conversion des types
     for col in X.columns:
-        if X[col].dtype == object:
+        # pandas >= 3 infère un dtype chaîne dédié (StringDtype) au lieu de object
+        if X[col].dtype == object or pd.api.types.is_string_dtype(X[col]):
             if encoders and col in encoders:
                 X[col] = encoders[col].transform(X[col].astype(str))
             else:
@@ -0,0 +1 @@
+# Ce fichier rend le dossier benchmarks importable comme package Python
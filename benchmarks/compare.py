@@ -0,0 +1,58 @@
+"""
+Compare deux fichiers de résultats de benchmarks/run.py.
+
+Usage :
+    python -m sgai.benchmarks.compare ancien.json nouveau.json [--metric p95_ms] [--threshold 0.10]
+
+Le code de sortie vaut 1 si une mesure régresse au-delà du seuil.
+"""
+import sys
+import json
+import argparse
+
+
+def _rows(report, metric):
+    for endpoint, levels in report.get('endpoints', {}).items():
+        for level, summary in levels.items():
+            if isinstance(summary, dict) and metric in summary:
+                yield f'{endpoint} @c={level}', summary[metric]
+    for name, summary in report.get('micro', {}).items():
+        if metric in summary:
+            yield f'micro:{name}', summary[metric]
+
+
+def compare(old, new, metric='p95_ms', threshold=0.10):
+    """Liste (mesure, ancien, nouveau, variation relative, régression)"""
+    old_rows = dict(_rows(old, metric))
+    results = []
+    for key, value in _rows(new, metric):
+        if key not in old_rows or not old_rows[key]:
+            continue
+        change = (value - old_rows[key]) / old_rows[key]
+        # Pour le débit, plus haut est meilleur
+        regression = -change > threshold if metric == 'throughput_rps' else change > threshold
+        results.append((key, old_rows[key], value, change, regression))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare deux résultats de benchmarks')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--metric', default='p95_ms')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args(argv)
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    results = compare(old, new, args.metric, args.threshold)
+    print(f"{old.get('commit')} -> {new.get('commit')} ({args.metric})")
+    for key, before, after, change, regression in results:
+        flag = '  REGRESSION' if regression else ''
+        print(f'{key:60s} {before:>12.3f} {after:>12.3f} {change:>+8.1%}{flag}')
+    return 1 if any(r[-1] for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
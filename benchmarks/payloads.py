@@ -0,0 +1,103 @@
+"""
+Charges synthétiques réalistes pour les benchmarks.
+
+Les features des modèles RF viennent des meta_*.joblib ; les valeurs
+catégorielles sont tirées parmi les classes des encodeurs et les valeurs
+numériques dans l'intervalle observé dans les CSV de data/.
+"""
+import io
+import os
+import json
+import joblib
+import numpy as np
+import pandas as pd
+from sgai.ml import prediction_table
+from sgai.ml.models import MODELS_DIR
+
+
+def rf_rows(name, rows=1, seed=0):
+    """Enregistrements de features brutes pour le modèle RF `name`"""
+    rng = np.random.default_rng(seed)
+    meta = joblib.load(os.path.join(MODELS_DIR, f'meta_{name}.joblib'))
+    encoders = meta.get('encoders') or {}
+    source = prediction_table.source_frame(name)
+    columns = {}
+    for feature in meta['features']:
+        if feature in encoders:
+            columns[feature] = rng.choice(encoders[feature].classes_, size=rows)
+        else:
+            values = pd.to_numeric(source[feature], errors='coerce').dropna() if source is not None else pd.Series(dtype=float)
+            low, high = (values.min(), values.max()) if len(values) else (0.0, 1000.0)
+            columns[feature] = rng.uniform(low, high, size=rows).round(2)
+    return pd.DataFrame(columns).to_dict('records')
+
+
+def production_rows(rows=1, seed=0):
+    """Enregistrements pour le modèle Keras de production (features de model_metadata.json)"""
+    rng = np.random.default_rng(seed)
+    metadata_path = os.path.join(MODELS_DIR, 'model_metadata.json')
+    feature_names = []
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            feature_names = json.load(f).get('feature_names', [])
+    return [
+        {feature: float(rng.normal()) for feature in feature_names}
+        for _ in range(rows)
+    ]
+
+
+def rendement_features(seed=0):
+    """Vecteur pour /predict_rendement (features encodées de superficie_production)"""
+    row = rf_rows('superficie_production', 1, seed)[0]
+    meta = joblib.load(os.path.join(MODELS_DIR, 'meta_superficie_production.joblib'))
+    encoders = meta.get('encoders') or {}
+    return [
+        float(encoders[f].transform([str(row[f])])[0]) if f in encoders else float(row[f])
+        for f in meta['features']
+    ]
+
+
+def cluster_payload(rows=1000, features=8, n_clusters=4, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-10, 10, size=(n_clusters, features))
+    X = centers[rng.integers(0, n_clusters, size=rows)] + rng.normal(size=(rows, features))
+    return {'features': X.round(4).tolist(), 'n_clusters': n_clusters}
+
+
+def optimize_payload(variables=50, constraints=30, seed=0):
+    """Programme linéaire borné et réalisable : maximiser un revenu sous contraintes de ressources"""
+    rng = np.random.default_rng(seed)
+    return {
+        'costs': (-rng.uniform(1, 10, size=variables)).round(3).tolist(),
+        'A_ub': rng.uniform(0, 5, size=(constraints, variables)).round(3).tolist(),
+        'b_ub': rng.uniform(50, 200, size=constraints).round(3).tolist(),
+        'bounds': [[0, 20]] * variables,
+    }
+
+
+def image_bytes(width=640, height=480, seed=0):
+    """Photo synthétique (dégradé végétal bruité) encodée en JPEG"""
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([
+        40 + 60 * x / width,
+        90 + 120 * y / height,
+        30 + 40 * (x + y) / (width + height),
+    ], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 25, size=base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def report_rows(rows=1000, seed=0):
+    """Lignes de rapport au format long (Groupes, Cultures, Année, Production)"""
+    rng = np.random.default_rng(seed)
+    prod = pd.read_csv(os.path.join(prediction_table.DATA_DIR, prediction_table.PROD_CSV))
+    picks = prod.iloc[rng.integers(0, len(prod), size=rows)]
+    return [
+        {'Groupes': g, 'Cultures': c, 'Année': int(a), 'Production': float(p)}
+        for g, c, a, p in zip(picks['Groupes'], picks['Cultures'],
+                              rng.integers(2014, 2019, size=rows), rng.uniform(1e3, 3e6, size=rows).round(1))
+    ]
@@ -0,0 +1,298 @@
+"""
+Suite de benchmarks hors-ligne des API SGAI.
+
+Démarre l'application de main.py et celle de backend/app.py sur des ports
+locaux, les charge avec des requêtes synthétiques (voir payloads.py) à
+plusieurs niveaux de concurrence, puis mesure des micro-benchmarks des
+étapes coûteuses. Les résultats sont écrits en JSON pour comparer deux
+commits avec benchmarks/compare.py.
+
+Usage :
+    python -m sgai.benchmarks.run [--requests 200] [--concurrency 1,4,16] [--output FICHIER]
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from sgai.benchmarks import payloads
+from sgai.services import metrics
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+class Endpoint:
+    """Une route à charger : corps précalculé une fois pour ne mesurer que le serveur"""
+
+    def __init__(self, name, app, method, path, body=None, content_type='application/json', auth=False):
+        self.name = name
+        self.app = app
+        self.method = method
+        self.path = path
+        self.body = body
+        self.content_type = content_type
+        self.auth = auth
+
+
+def _json(payload):
+    return json.dumps(payload).encode('utf-8')
+
+
+def _multipart(field, filename, content, mimetype):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {mimetype}\r\n\r\n'
+    ).encode('utf-8') + content + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def _npy(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+def _arrow(rows):
+    import pyarrow as pa
+    table = pa.Table.from_pandas(pd.DataFrame(rows), preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def build_endpoints():
+    from sgai.ml import models
+    endpoints = [
+        Endpoint('predict_rendement', 'main', 'POST', '/predict_rendement',
+                 _json({'features': payloads.rendement_features()}), auth=True),
+        Endpoint('cluster', 'main', 'POST', '/cluster', _json(payloads.cluster_payload())),
+        Endpoint('cluster_npy', 'main', 'POST', '/cluster?n_clusters=4',
+                 _npy(np.array(payloads.cluster_payload()['features'])), content_type='application/x-npy'),
+        Endpoint('optimize', 'main', 'POST', '/optimize', _json(payloads.optimize_payload())),
+        Endpoint('report_csv', 'main', 'POST', '/api/report/csv',
+                 _json({'data': payloads.report_rows(1000)}), auth=True),
+        Endpoint('report_stream_csv', 'main', 'POST', '/api/report/stream?format=csv&download=1',
+                 b''.join(_json(r) + b'\n' for r in payloads.report_rows(10000)),
+                 content_type='application/x-ndjson', auth=True),
+        Endpoint('metrics', 'main', 'GET', '/metrics'),
+    ]
+    image, content_type = _multipart('image', 'plante.jpg', payloads.image_bytes(), 'image/jpeg')
+    endpoints.append(Endpoint('detect_disease', 'main', 'POST', '/detect_disease', image, content_type))
+    for name in models.list_rf_models():
+        endpoints.append(Endpoint(f'rf/{name}', 'main', 'POST', f'/api/predict/rf/{name}',
+                                  _json({'features': payloads.rf_rows(name, 1)}), auth=True))
+    endpoints.append(Endpoint('rf_batch_1000/superficie_prix_production', 'main', 'POST',
+                              '/api/predict/rf/superficie_prix_production',
+                              _json({'features': payloads.rf_rows('superficie_prix_production', 1000)}), auth=True))
+    endpoints.append(Endpoint('rf_batch_1000_arrow/superficie_prix_production', 'main', 'POST',
+                              '/api/predict/rf/superficie_prix_production',
+                              _arrow(payloads.rf_rows('superficie_prix_production', 1000)),
+                              content_type='application/vnd.apache.arrow.stream', auth=True))
+    endpoints += [
+        Endpoint('backend_predict', 'backend', 'POST', '/predict', _json(payloads.production_rows(1)[0]), auth=True),
+        Endpoint('backend_predict_batch', 'backend', 'POST', '/predict_batch',
+                 _json({'batch': payloads.production_rows(256)}), auth=True),
+    ]
+    return endpoints
+
+
+def serve(app):
+    """Démarre l'application WSGI sur un port libre dans un thread"""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def start_apps():
+    """Importe et démarre les deux applications ; une application indisponible est notée, pas fatale"""
+    apps, errors = {}, {}
+    try:
+        from sgai.main import app as main_app
+        from flask_jwt_extended import create_access_token
+        with main_app.app_context():
+            token = create_access_token(identity='benchmark')
+        apps['main'] = (serve(main_app), token)
+    except Exception as e:
+        errors['main'] = f'{type(e).__name__}: {e}'
+    try:
+        # Application autonome : clé JWT obligatoire, une clé de session suffit pour le benchmark
+        os.environ.setdefault('JWT_SECRET_KEY', uuid.uuid4().hex + uuid.uuid4().hex)
+        from sgai.backend.app import app as backend_app
+        from sgai.ml import production
+        from flask_jwt_extended import create_access_token
+        production.get_predictor()
+        with backend_app.app_context():
+            token = create_access_token(identity='benchmark')
+        apps['backend'] = (serve(backend_app), token)
+    except Exception as e:
+        errors['backend'] = f'{type(e).__name__}: {e}'
+    return apps, errors
+
+
+def _request(base_url, endpoint, token):
+    request = urllib.request.Request(base_url + endpoint.path, data=endpoint.body, method=endpoint.method)
+    if endpoint.body is not None:
+        request.add_header('Content-Type', endpoint.content_type)
+    if endpoint.auth and token:
+        request.add_header('Authorization', f'Bearer {token}')
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            ok = response.status < 400
+    except (urllib.error.HTTPError, urllib.error.URLError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def _summary(latencies, wall, errors):
+    latencies_ms = np.asarray(latencies) * 1000.0
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 3),
+        'mean_ms': round(float(latencies_ms.mean()), 3),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+    }
+
+
+def load_test(base_url, endpoint, token, n_requests, concurrency, warmup=5):
+    for _ in range(warmup):
+        _request(base_url, endpoint, token)
+    rss_before = metrics.rss_bytes()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _request(base_url, endpoint, token), range(n_requests)))
+    wall = time.perf_counter() - start
+    summary = _summary([lat for lat, _ in results], wall, sum(1 for _, ok in results if not ok))
+    # Serveur et client partagent le processus : RSS indicatif du worker sous charge
+    summary['rss_bytes'] = metrics.rss_bytes()
+    summary['rss_delta_bytes'] = summary['rss_bytes'] - rss_before
+    return summary
+
+
+def _time(fn, repeat):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    summary = _summary(timings, sum(timings), 0)
+    summary['runs'] = summary.pop('requests')
+    del summary['errors'], summary['throughput_rps']
+    return summary
+
+
+def micro_benchmarks(repeat=20):
+    """Étapes coûteuses mesurées hors HTTP"""
+    from sklearn.cluster import KMeans
+    from scipy.optimize import linprog
+    from sgai.api.routes.validation import validate_and_prepare_features
+    from sgai.ml import models, production
+    results = {}
+
+    name = 'superficie_prix_production'
+    bundle = models.load_rf_bundle(name)
+    X = pd.DataFrame(payloads.rf_rows(name, 1000)).astype({'Année': str})
+    results['validate_and_prepare_features_1000'] = _time(
+        lambda: validate_and_prepare_features(X.copy(), bundle['meta']['features'], bundle['meta']['encoders']),
+        repeat)
+
+    try:
+        predictor = production.get_predictor()
+        rows = payloads.production_rows(1000)
+        results['preprocess_input_1'] = _time(lambda: predictor.preprocess_input(rows[0]), repeat)
+        results['preprocess_batch_1000'] = _time(lambda: predictor.preprocess(rows), repeat)
+    except Exception as e:
+        results['preprocess_input_1'] = {'skipped': f'{type(e).__name__}: {e}'}
+
+    cluster = payloads.cluster_payload(rows=5000)
+    features = np.array(cluster['features'])
+    results['kmeans_5000x8'] = _time(
+        lambda: KMeans(n_clusters=cluster['n_clusters'], random_state=42).fit_predict(features), repeat)
+
+    lp = payloads.optimize_payload(variables=200, constraints=100)
+    results['linprog_200x100'] = _time(
+        lambda: linprog(np.array(lp['costs']), A_ub=np.array(lp['A_ub']), b_ub=np.array(lp['b_ub']),
+                        bounds=lp['bounds']), repeat)
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__), text=True
+        ).strip()
+    except Exception:
+        return 'unknown'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks hors-ligne des API SGAI')
+    parser.add_argument('--requests', type=int, default=200, help='requêtes par niveau de concurrence')
+    parser.add_argument('--concurrency', default='1,4,16', help='niveaux de concurrence, séparés par des virgules')
+    parser.add_argument('--only', default=None, help='sous-chaîne filtrant les endpoints')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+    levels = [int(c) for c in args.concurrency.split(',')]
+    commit = _commit()
+
+    apps, app_errors = start_apps()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {'requests': args.requests, 'concurrency': levels},
+        'endpoints': {},
+        'micro': {},
+    }
+    for endpoint in build_endpoints():
+        if args.only and args.only not in endpoint.name:
+            continue
+        if endpoint.app not in apps:
+            report['endpoints'][endpoint.name] = {'skipped': app_errors[endpoint.app]}
+            continue
+        (server, base_url), token = apps[endpoint.app]
+        print(f'[BENCH] {endpoint.name}')
+        report['endpoints'][endpoint.name] = {
+            str(c): load_test(base_url, endpoint, token, args.requests, c) for c in levels
+        }
+    if not args.skip_micro:
+        print('[BENCH] micro-benchmarks')
+        report['micro'] = micro_benchmarks()
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Résultats sauvegardés : {output}')
+    for (server, _), _ in apps.values():
+        server.shutdown()
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,135 @@
+"""
+Mémoire du chargement et du nettoyage du jeu combiné de train_model.py.
+
+Compare, sur data/ et sur une version synthétique agrandie (chaque CSV
+répété N fois, libellés suffixés pour que les catégories grandissent aussi),
+les représentations de load_all_data :
+- wide    : union large des CSV en float64/objets (comportement historique) ;
+- compact : colonnes numériques creuses avant l'union, types réduits, catégories ;
+- long    : compact + colonnes année/région dépivotées en (Année | Région, Valeur).
+
+Chaque variante est mesurée dans un processus séparé (chargement, sélection
+de la cible, clean_data) : pic tracemalloc (tas Python et numpy), pic RSS et
+taille finale des DataFrames.
+
+Usage :
+    python -m sgai.benchmarks.training_memory [--factor 100] [--output FICHIER]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data'))
+VARIANTS = {
+    'wide': {'compact': False, 'layout': 'wide'},
+    'compact': {'compact': True, 'layout': 'wide'},
+    'long': {'compact': True, 'layout': 'long'},
+}
+
+
+def synthetic_dataset(source_dir, target_dir, factor, seed=0):
+    """Copie agrandie de data/ : chaque fichier répété `factor` fois, mesures perturbées de ±20 %"""
+    from sgai.train_model import pivot_kind
+    rng = np.random.default_rng(seed)
+    os.makedirs(target_dir, exist_ok=True)
+    for name in os.listdir(source_dir):
+        if not name.endswith('.csv'):
+            continue
+        df = pd.read_csv(os.path.join(source_dir, name))
+        copies = []
+        for k in range(factor):
+            copy = df.copy()
+            for col in copy.columns:
+                if pd.api.types.is_numeric_dtype(copy[col]) and pivot_kind(col):
+                    copy[col] = (copy[col] * rng.uniform(0.8, 1.2, len(copy))).round()
+                elif not pd.api.types.is_numeric_dtype(copy[col]) and k:
+                    copy[col] = copy[col].astype(str) + f' #{k}'
+            copies.append(copy)
+        pd.concat(copies, ignore_index=True).to_csv(os.path.join(target_dir, name), index=False)
+    return target_dir
+
+
+def measure(data_dir, variant):
+    """Pic mémoire de load_all_data + select_target_column + clean_data (processus courant)"""
+    from sgai import train_model
+    from sgai.train.checkpoints import _PeakRss
+    options = VARIANTS[variant]
+    tracemalloc.start()
+    started = time.perf_counter()
+    with _PeakRss() as rss, contextlib.redirect_stdout(io.StringIO()):
+        df = train_model.load_all_data(data_dir, compact=options['compact'], layout=options['layout'])
+        loaded_bytes = int(df.memory_usage(deep=True).sum())
+        shape = df.shape
+        target_col = train_model.select_target_column(df)
+        df_clean, target_col = train_model.clean_data(df, target_col)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'variant': variant,
+        'rows': shape[0],
+        'columns': shape[1],
+        'seconds': round(time.perf_counter() - started, 3),
+        'loaded_frame_bytes': loaded_bytes,
+        'clean_frame_bytes': int(df_clean.memory_usage(deep=True).sum()),
+        'traced_peak_bytes': traced_peak,
+        'peak_rss_increase_bytes': rss.peak - rss.start,
+    }
+
+
+def _measure_subprocess(data_dir, variant):
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'sgai.benchmarks.training_memory', '--measure', variant, '--data', data_dir],
+        text=True,
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mémoire du jeu combiné de train_model.py')
+    parser.add_argument('--factor', type=int, default=100, help='facteur de la version synthétique')
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'training_memory.json'))
+    parser.add_argument('--measure', choices=list(VARIANTS), help=argparse.SUPPRESS)
+    parser.add_argument('--data', default=DATA_DIR, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print(json.dumps(measure(args.data, args.measure)))
+        return
+
+    workdir = tempfile.mkdtemp(prefix='sgai-data-')
+    try:
+        datasets = {
+            'data': DATA_DIR,
+            f'synthetic_x{args.factor}': synthetic_dataset(DATA_DIR, os.path.join(workdir, 'data'), args.factor),
+        }
+        report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'datasets': {}}
+        for dataset, path in datasets.items():
+            report['datasets'][dataset] = {}
+            for variant in VARIANTS:
+                result = _measure_subprocess(path, variant)
+                report['datasets'][dataset][variant] = result
+                print(f"[BENCH] {dataset:<16} {variant:<8} {result['rows']:>7} lignes x {result['columns']:>3} col. "
+                      f"pic {result['traced_peak_bytes'] / 2**20:8.1f} Mo (RSS +{result['peak_rss_increase_bytes'] / 2**20:.1f} Mo), "
+                      f"chargé {result['loaded_frame_bytes'] / 2**20:7.1f} Mo, nettoyé {result['clean_frame_bytes'] / 2**20:7.1f} Mo")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'[BENCH] Résultats : {args.output}')
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -2,12 +2,19 @@ import secrets
 from flask_jwt_extended import JWTManager
 from flask import Flask
 
+from sgai.services import threads
+# Avant TensorFlow, sklearn et les modèles : les pools natifs sont dimensionnés à leur chargement
+threads.configure()
+
 from sgai.api.predict import bp as predict_bp
 from sgai.api.diagnostic import bp as diagnostic_bp
 from sgai.api.clustering import bp as clustering_bp
 from sgai.api.optimization import bp as optimization_bp
+from sgai.api.production import bp as production_bp
 from sgai.api.routes.predictions import bp as predictions_bp
 from sgai.api.routes.report import bp as report_bp
+from sgai.api.routes.cube import bp as cube_bp
+from sgai.services import admission, metrics, profiling
 
 
 # Génère une clé secrète JWT sécurisée à chaque démarrage (à fixer en prod !)
@@ -22,8 +29,14 @@ app.register_blueprint(predict_bp)
 app.register_blueprint(diagnostic_bp)
 app.register_blueprint(clustering_bp)
 app.register_blueprint(optimization_bp)
+app.register_blueprint(production_bp)
 app.register_blueprint(predictions_bp)
 app.register_blueprint(report_bp)
+app.register_blueprint(cube_bp)
+metrics.init_app(app)
+profiling.init_app(app)
+threads.init_app(app)
+admission.init_app(app)
 
 @app.route('/')
 def index():
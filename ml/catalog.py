@@ -0,0 +1,387 @@
+"""
+Catalogue persistant des schémas des CSV de data/.
+
+Pour chaque fichier, le catalogue enregistre l'encodage, le séparateur, les
+colonnes (brutes et normalisées), leurs types, le nombre de lignes et, pour
+les colonnes identifiantes, leur cardinalité et leurs valeurs normalisées.
+Les clés de jointure candidates entre fichiers sont déduites de ces valeurs
+(recouvrement des libellés, années communes), sans relire les fichiers.
+
+Le catalogue est mis à jour de façon incrémentale : un fichier dont la taille
+et la date n'ont pas changé n'est pas rouvert ; sinon son empreinte SHA-256
+est comparée à celle enregistrée et il n'est profilé à nouveau que si son
+contenu a changé.
+
+Usage :
+    from sgai.ml import catalog
+    catalog.read_options('Prix moyens (2014-2016).csv')  # {'encoding': ..., 'sep': ...}
+    catalog.join_keys('Production des principales cultures (2015-2018).csv', 'Prix moyens (2014-2016).csv')
+
+    python -m sgai.ml.catalog [--data DOSSIER] [--refresh]
+"""
+import os
+import re
+import csv
+import json
+import hashlib
+import argparse
+import itertools
+import threading
+import unicodedata
+import pandas as pd
+
+BASE_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+# À côté du cache des jeux de données (ml/datasets.py), hors de results/cache/ (rapports, évincés par taille)
+CATALOG_PATH = os.path.join(BASE_DIR, 'results', 'datasets_cache', 'data_catalog.json')
+CATALOG_VERSION = 1
+
+ENCODINGS = ['utf-8-sig', 'cp1252', 'latin1']
+DELIMITERS = ',;\t|'
+SNIFF_BYTES = 64 * 1024
+# Valeurs conservées par colonne identifiante (au-delà : cardinalité seulement)
+MAX_KEY_VALUES = 1000
+# Part minimale des libellés du plus petit fichier retrouvés dans l'autre
+MIN_CONTAINMENT = 0.3
+MAX_KEY_WIDTH = 3
+
+YEAR_COLUMN = re.compile(r'^(19|20)\d{2}$')
+YEAR_NAMES = {'annee', 'year'}
+
+
+def normalize_name(s):
+    """Forme de comparaison d'un nom de colonne ou d'un libellé (sans accents, casse ni ponctuation)"""
+    if not isinstance(s, str):
+        s = str(s)
+    s = unicodedata.normalize('NFKD', s).encode('ASCII', 'ignore').decode('utf-8')
+    return re.sub(r'[^a-z0-9]', '', s.lower().strip())
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def detect_encoding(sample):
+    """Premier encodage qui décode l'échantillon ('utf-8-sig' couvre l'UTF-8 avec ou sans BOM)"""
+    for encoding in ENCODINGS:
+        try:
+            sample.decode(encoding)
+        except UnicodeDecodeError as e:
+            # Échantillon coupé au milieu d'un caractère multi-octets
+            if encoding != 'latin1' and e.start >= len(sample) - 3:
+                return encoding
+            continue
+        return encoding
+    return 'latin1'
+
+
+def detect_delimiter(text):
+    header = text.splitlines()[0] if text else ''
+    try:
+        return csv.Sniffer().sniff(text, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        # Une seule ligne ou lignes irrégulières : séparateur le plus fréquent de l'en-tête
+        counts = {d: header.count(d) for d in DELIMITERS}
+        best = max(counts, key=counts.get)
+        return best if counts[best] else ','
+
+
+def column_role(name, series):
+    """'pivot' (colonne année d'un tableau croisé), 'key' (libellé ou année) ou 'measure'"""
+    if YEAR_COLUMN.match(str(name).strip()):
+        return 'pivot'
+    if normalize_name(name) in YEAR_NAMES:
+        return 'key'
+    if pd.api.types.is_numeric_dtype(series):
+        return 'measure'
+    # Colonne textuelle surtout numérique ('-' pour les valeurs absentes) : mesure
+    numeric = pd.to_numeric(series.dropna().astype(str).str.replace(' ', ''), errors='coerce')
+    if len(numeric) and numeric.notna().mean() >= 0.5:
+        return 'measure'
+    return 'key'
+
+
+def primary_key(df, keys):
+    """Plus petite combinaison de colonnes identifiantes unique sur toutes les lignes"""
+    for width in range(1, min(MAX_KEY_WIDTH, len(keys)) + 1):
+        for combo in itertools.combinations(keys, width):
+            subset = df[list(combo)]
+            if subset.notna().all(axis=None) and not subset.duplicated().any():
+                return list(combo)
+    return None
+
+
+def profile_file(path):
+    """Profil complet d'un fichier (le seul endroit où le fichier est lu)"""
+    with open(path, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
+    encoding = detect_encoding(sample)
+    text = sample.decode(encoding, errors='ignore')
+    sep = detect_delimiter(text)
+    df = pd.read_csv(path, encoding=encoding, sep=sep, on_bad_lines='skip')
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        role = column_role(name, series)
+        column = {
+            'name': name,
+            'normalized': normalize_name(name),
+            'dtype': str(series.dtype),
+            'role': role,
+            'nulls': int(series.isna().sum()),
+            'distinct': int(series.nunique()),
+        }
+        if role == 'key':
+            values = sorted({normalize_name(v) for v in series.dropna()})
+            column['values'] = values if len(values) <= MAX_KEY_VALUES else None
+        columns.append(column)
+    keys = [c['name'] for c in columns if c['role'] == 'key']
+    return {
+        'encoding': encoding,
+        'sep': sep,
+        'line_terminator': '\r\n' if b'\r\n' in sample else '\n',
+        'rows': len(df),
+        'columns': columns,
+        'primary_key': primary_key(df, keys),
+        'years': sorted(int(c['name']) for c in columns if c['role'] == 'pivot'),
+    }
+
+
+def _years(entry):
+    """Années couvertes par un fichier : colonnes pivot ou valeurs d'une colonne année"""
+    years = set(entry['years'])
+    for column in entry['columns']:
+        if column['role'] == 'key' and column['normalized'] in YEAR_NAMES and column.get('values'):
+            years.update(int(v) for v in column['values'] if v.isdigit())
+    return years
+
+
+def join_candidates(left, right):
+    """Paires de colonnes identifiantes dont les libellés se recouvrent, et années communes"""
+    keys = []
+    for a in left['columns']:
+        for b in right['columns']:
+            if a['role'] != 'key' or b['role'] != 'key' or not a.get('values') or not b.get('values'):
+                continue
+            overlap = len(set(a['values']).intersection(b['values']))
+            if not overlap:
+                continue
+            containment = overlap / min(len(a['values']), len(b['values']))
+            if containment < MIN_CONTAINMENT:
+                continue
+            keys.append({
+                'left': a['name'], 'right': b['name'],
+                'overlap': overlap, 'containment': round(containment, 3),
+                'same_name': a['normalized'] == b['normalized'],
+            })
+    keys.sort(key=lambda k: (-k['containment'], -k['overlap'], k['left'], k['right']))
+    return {'keys': keys, 'shared_years': sorted(_years(left) & _years(right))}
+
+
+class Catalog:
+    """Schémas des CSV d'un répertoire, persistés en JSON (path=None : en mémoire seulement)"""
+
+    def __init__(self, data_dir=DATA_DIR, path=CATALOG_PATH):
+        self.data_dir = data_dir
+        self.path = path
+        self.files = {}
+        self.joins = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _load(self):
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        if stored.get('version') == CATALOG_VERSION:
+            self.files = stored.get('files', {})
+            self.joins = stored.get('joins', {})
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f'{self.path}.tmp-{os.getpid()}'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': CATALOG_VERSION, 'files': self.files, 'joins': self.joins},
+                      f, indent=1, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def refresh(self, force=False):
+        """
+        Met à jour les fichiers ajoutés, modifiés ou supprimés (tous avec `force`) ;
+        retourne les noms reprofilés.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if force:
+                self.files = {}
+            names = sorted(f for f in os.listdir(self.data_dir) if f.endswith('.csv')) \
+                if os.path.isdir(self.data_dir) else []
+            removed = set(self.files) - set(names)
+            for name in removed:
+                del self.files[name]
+            changed, dirty = [], set(removed)
+            for name in names:
+                path = os.path.join(self.data_dir, name)
+                stat = os.stat(path)
+                entry = self.files.get(name)
+                if entry and (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                digest = file_hash(path)
+                if not entry or entry['sha256'] != digest:
+                    entry = profile_file(path)
+                    changed.append(name)
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=digest)
+                self.files[name] = entry
+                dirty.add(name)
+            if changed or removed:
+                self._update_joins()
+            if dirty:
+                self._save()
+            return changed
+
+    def _update_joins(self):
+        self.joins = {}
+        for left, right in itertools.combinations(sorted(self.files), 2):
+            candidates = join_candidates(self.files[left], self.files[right])
+            if candidates['keys']:
+                self.joins[f'{left}|{right}'] = {'files': [left, right], **candidates}
+
+    def entry(self, file):
+        """Profil d'un fichier (nom ou chemin dans data_dir) ; KeyError s'il n'existe pas"""
+        self.refresh()
+        return self._entry(file)
+
+    def _entry(self, file):
+        name = os.path.basename(file)
+        if name not in self.files:
+            raise KeyError(f"Fichier absent du catalogue {self.data_dir}: {name}")
+        return self.files[name]
+
+    def names(self):
+        self.refresh()
+        return list(self.files)
+
+    def columns(self, file):
+        return [column['name'] for column in self.entry(file)['columns']]
+
+    def read_options(self, file):
+        """Arguments de pd.read_csv pour ce fichier (encodage et séparateur détectés)"""
+        entry = self.entry(file)
+        return {'encoding': entry['encoding'], 'sep': entry['sep']}
+
+    def missing_columns(self, files, columns):
+        """{fichier: colonnes absentes} (vide si tous les fichiers ont toutes les colonnes)"""
+        self.refresh()
+        missing = {}
+        for file in files:
+            present = {column['name'] for column in self._entry(file)['columns']}
+            absent = [c for c in columns if c not in present]
+            if absent:
+                missing[os.path.basename(file)] = absent
+        return missing
+
+    def join_keys(self, left, right):
+        """Clés de jointure candidates entre deux fichiers, les plus sûres d'abord"""
+        self.refresh()
+        return self._join_keys(left, right)
+
+    def _join_keys(self, left, right):
+        left, right = os.path.basename(left), os.path.basename(right)
+        pair = self.joins.get(f'{left}|{right}') or self.joins.get(f'{right}|{left}')
+        if pair is None:
+            return {'keys': [], 'shared_years': []}
+        if pair['files'][0] == left:
+            return {'keys': pair['keys'], 'shared_years': pair['shared_years']}
+        swapped = [dict(k, left=k['right'], right=k['left']) for k in pair['keys']]
+        return {'keys': swapped, 'shared_years': pair['shared_years']}
+
+    def plan_merge(self, files, on=None):
+        """
+        Plan de jointure successive des fichiers, établi depuis le catalogue :
+        pour chaque fichier après le premier, les paires (colonne gauche, colonne droite)
+        retenues. Avec `on`, vérifie seulement que les colonnes existent partout.
+        """
+        if on is not None:
+            on = [on] if isinstance(on, str) else list(on)
+            missing = self.missing_columns(files, on)
+            if missing:
+                raise ValueError(f"Colonnes de jointure absentes : {missing}")
+            return [{'file': os.path.basename(f), 'on': [(c, c) for c in on]} for f in files[1:]]
+        self.refresh()
+        for file in files:
+            self._entry(file)  # KeyError si un fichier est absent du catalogue
+        plan = []
+        for file in files[1:]:
+            keys = self._join_keys(files[0], file)['keys']
+            chosen, used = [], set()
+            for key in keys:
+                if key['left'] not in used and key['right'] not in {r for _, r in chosen}:
+                    chosen.append((key['left'], key['right']))
+                    used.add(key['left'])
+            if not chosen:
+                raise ValueError(f"Aucune clé de jointure entre {os.path.basename(files[0])} et {os.path.basename(file)}")
+            plan.append({'file': os.path.basename(file), 'on': chosen})
+        return plan
+
+
+catalog = Catalog()
+_catalogs = {}
+
+
+def for_dir(data_dir):
+    """Catalogue persistant de data/, catalogue en mémoire pour un autre répertoire"""
+    if os.path.normpath(os.path.abspath(data_dir)) == os.path.normpath(catalog.data_dir):
+        return catalog
+    key = os.path.normpath(os.path.abspath(data_dir))
+    if key not in _catalogs:
+        _catalogs[key] = Catalog(key, path=None)
+    return _catalogs[key]
+
+
+def read_options(file, data_dir=None):
+    return for_dir(data_dir or os.path.dirname(file) or DATA_DIR).read_options(file)
+
+
+def join_keys(left, right, data_dir=DATA_DIR):
+    return for_dir(data_dir).join_keys(left, right)
+
+
+def report(data_dir=DATA_DIR):
+    """Résumé texte du catalogue : fichiers, schémas et clés de jointure candidates"""
+    cat = for_dir(data_dir)
+    cat.refresh()
+    lines = []
+    for name, entry in cat.files.items():
+        keys = [f"{c['name']} ({c['distinct']})" for c in entry['columns'] if c['role'] == 'key']
+        measures = [c['name'] for c in entry['columns'] if c['role'] != 'key']
+        lines.append(f"\nFichier: {name}")
+        lines.append(f"  {entry['rows']} lignes, encodage {entry['encoding']}, séparateur {entry['sep']!r}")
+        lines.append(f"  Clés: {', '.join(keys) or '-'}  (unique : {entry['primary_key']})")
+        lines.append(f"  Mesures: {', '.join(measures) or '-'}")
+    lines.append("\nJointures candidates :")
+    for pair in cat.joins.values():
+        keys = ', '.join(f"{k['left']} ~ {k['right']} ({k['containment']:.0%})" for k in pair['keys'][:3])
+        years = f", années communes {pair['shared_years']}" if pair['shared_years'] else ''
+        lines.append(f"  {pair['files'][0]} <-> {pair['files'][1]} : {keys}{years}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Catalogue des schémas des CSV de data/')
+    parser.add_argument('--data', default=DATA_DIR)
+    parser.add_argument('--refresh', action='store_true', help='reprofile tous les fichiers')
+    args = parser.parse_args()
+    print(f"Fichiers reprofilés : {for_dir(args.data).refresh(force=args.refresh)}")
+    print(report(args.data))
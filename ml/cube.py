@@ -0,0 +1,301 @@
+"""
+Cube OLAP en mémoire sur les CSV de data/.
+
+Les fichiers (tableaux croisés par année ou par région, voir ml/catalog.py)
+sont dépivotés en une table de faits unique :
+    région × culture × groupe × année × mesure -> valeur
+- mesures : production (t), superficie (ha), prix, et les mesures des
+  produits industriels (exportation, cours...) ;
+- groupe : déduit des fichiers qui donnent Groupes/Cultures (ex : Céréales) ;
+- région : les 10 régions, et 'Total' pour les chiffres nationaux (colonne
+  Total des fichiers régionaux, fichiers nationaux, sinon somme des régions).
+Une même cellule présente dans plusieurs fichiers n'est comptée qu'une fois.
+
+Les agrégats (somme, nombre, min, max) sont précalculés pour chacune des 16
+combinaisons de dimensions : une requête (group-by, filtres, roll-up) lit le
+plus petit agrégat qui contient ses dimensions et ne fait qu'un dernier
+regroupement sur quelques lignes. Sans région dans le group-by ni dans les
+filtres, les chiffres sont nationaux ('Total') ; groupés par région, 'Total'
+n'apparaît que s'il est demandé dans les filtres.
+
+Le cube est construit à la première requête et reconstruit quand le contenu
+d'un CSV change (empreintes du catalogue).
+"""
+import re
+import time
+import itertools
+import threading
+import numpy as np
+import pandas as pd
+from sgai.ml import catalog, datasets
+
+DIMENSIONS = ['region', 'crop', 'group', 'year']
+AGGREGATES = ['sum', 'count', 'mean', 'min', 'max']
+TOTAL = 'Total'
+OTHER_GROUP = 'Autres'
+REGIONS = ['ADAMAOUA', 'CENTRE', 'EST', 'EXTREME NORD', 'LITTORAL', 'NORD',
+           'NORD OUEST', 'OUEST', 'SUD', 'SUD OUEST']
+# Valeur de remplissage des fichiers sources là où la donnée manque (cellule vide ailleurs)
+MISSING_SENTINELS = {111}
+
+# Rôle des colonnes identifiantes, par nom normalisé
+CROP_COLUMNS = {'cultures', 'culture', 'produit', 'produits', 'libelles'}
+GROUP_COLUMNS = {'groupes', 'groupesdeproduits'}
+REGION_COLUMNS = {'region', 'regions'}
+YEAR_COLUMNS = {'annee', 'year'}
+MEASURE_COLUMNS = {'mesure', 'metrique'}
+YEAR_PIVOT = re.compile(r'^(19|20)\d{2}$')
+
+
+def measure_name(label):
+    """Nom canonique d'une mesure ('Production (t)' -> 'production', 'Superficie (ha)' -> 'superficie')"""
+    key = catalog.normalize_name(label)
+    for name in ('production', 'superficie', 'prix', 'exportation'):
+        if key.startswith(name):
+            return name
+    if key.startswith('cours'):
+        return 'cours'
+    return key
+
+
+def crop_key(label):
+    """Clé d'une culture : nom normalisé, au singulier ('Arachides' = 'Arachide', 'Maïs' = 'Mais')"""
+    key = catalog.normalize_name(label)
+    return key[:-1] if key.endswith('s') and len(key) > 3 else key
+
+
+def member_key(dim, value):
+    return crop_key(value) if dim == 'crop' else catalog.normalize_name(value)
+
+
+def file_measure(file):
+    """Mesure d'un fichier sans colonne Mesure, déduite de son nom"""
+    key = catalog.normalize_name(file)
+    for name in ('prix', 'superficie', 'production'):
+        if name in key:
+            return name
+    return None
+
+
+def _role(column):
+    key = catalog.normalize_name(column)
+    for role, names in (('crop', CROP_COLUMNS), ('group', GROUP_COLUMNS), ('region', REGION_COLUMNS),
+                        ('year', YEAR_COLUMNS), ('measure', MEASURE_COLUMNS)):
+        if key in names:
+            return role
+    return None
+
+
+def file_facts(df, file):
+    """Faits (region, crop, group, year, measure, value) d'un fichier, ou None s'il n'a pas de culture"""
+    if not isinstance(df.index, pd.RangeIndex):
+        # Une colonne de plus que l'en-tête : pandas en fait l'index (groupes du fichier des vivrières)
+        df = df.reset_index(names='Groupes')
+    region_keys = {catalog.normalize_name(r) for r in REGIONS + [TOTAL]}
+    roles = {col: _role(col) for col in df.columns}
+    year_pivots = [col for col in df.columns if YEAR_PIVOT.match(str(col).strip())]
+    region_pivots = [col for col in df.columns if catalog.normalize_name(col) in region_keys]
+    if 'crop' not in roles.values() or not (year_pivots or region_pivots):
+        return None
+    id_vars = [col for col, role in roles.items() if role]
+    pivot, var = (year_pivots, 'year') if year_pivots else (region_pivots, 'region')
+    long = df[id_vars + pivot].melt(id_vars=id_vars, var_name=var, value_name='value')
+    long = long.rename(columns={col: role for col, role in roles.items() if role})
+    if 'measure' in long.columns:
+        long['measure'] = long['measure'].map(measure_name)
+    else:
+        long['measure'] = file_measure(file)
+    if 'region' not in long.columns:
+        long['region'] = TOTAL
+    if 'group' not in long.columns:
+        long['group'] = None
+    long['value'] = pd.to_numeric(long['value'].astype(str).str.replace(' ', ''), errors='coerce')
+    long['year'] = pd.to_numeric(long['year'], errors='coerce')
+    long = long.dropna(subset=['value', 'year', 'crop', 'measure'])
+    long = long[~long['value'].isin(MISSING_SENTINELS)]
+    long['region'] = long['region'].map(lambda r: next(
+        (name for name in REGIONS + [TOTAL] if catalog.normalize_name(name) == catalog.normalize_name(r)), r))
+    long['source'] = file
+    return long[['region', 'crop', 'group', 'year', 'measure', 'value', 'source']]
+
+
+def build_facts(data_dir=datasets.DATA_DIR):
+    """Table de faits dédoublonnée de tous les CSV de data_dir"""
+    schemas = catalog.for_dir(data_dir)
+    engine = datasets.engine if data_dir == datasets.engine.data_dir else datasets.DatasetEngine(data_dir)
+    frames = []
+    for file in schemas.names():
+        facts = file_facts(engine.raw(file), file)
+        if facts is None or facts.empty:
+            continue
+        frames.append(facts)
+    facts = pd.concat(frames, ignore_index=True)
+    facts['year'] = facts['year'].astype(int)
+
+    # Libellés harmonisés : 'Maïs' et 'Mais', 'Arachide' et 'Arachides' sont la même culture
+    # (premier libellé rencontré)
+    keys = facts['crop'].map(crop_key)
+    labels = facts.groupby(keys, sort=False)['crop'].first()
+    facts['crop'] = keys.map(labels)
+    groups = facts.dropna(subset=['group']).assign(key=keys).groupby('key', sort=False)['group'].first()
+    facts['group'] = keys.map(groups).fillna(OTHER_GROUP)
+
+    # Une cellule fournie par plusieurs fichiers (ex : arachide régionale) n'est gardée qu'une fois
+    facts = facts.drop_duplicates(subset=['region', 'crop', 'year', 'measure'], keep='first')
+
+    # Chiffre national absent : somme des régions (hors prix, qui ne s'additionnent pas)
+    regional = facts[(facts['region'] != TOTAL) & (facts['measure'] != 'prix')]
+    sums = regional.groupby(['crop', 'group', 'year', 'measure'], as_index=False)['value'].sum()
+    national = facts[facts['region'] == TOTAL].set_index(['crop', 'year', 'measure']).index
+    sums = sums[~sums.set_index(['crop', 'year', 'measure']).index.isin(national)]
+    facts = pd.concat([facts, sums.assign(region=TOTAL, source='somme des régions')], ignore_index=True)
+
+    for col in ['region', 'crop', 'group', 'measure', 'source']:
+        facts[col] = facts[col].astype('category')
+    return facts
+
+
+class Cube:
+    """Faits et agrégats précalculés pour toutes les combinaisons de dimensions"""
+
+    def __init__(self, facts):
+        self.facts = facts
+        self.measures = sorted(facts['measure'].cat.categories)
+        self.members = {dim: sorted(facts[dim].dropna().unique().tolist()) for dim in DIMENSIONS}
+        self._keys = {dim: {member_key(dim, m): i for i, m in enumerate(self.members[dim])}
+                      for dim in DIMENSIONS}
+        national = facts[facts['region'] == TOTAL]
+        self.cuboids = {}
+        for width in range(len(DIMENSIONS) + 1):
+            for dims in itertools.combinations(DIMENSIONS, width):
+                # Sans la dimension région, seuls les chiffres nationaux (pas de double comptage)
+                source = facts if 'region' in dims else national
+                self.cuboids[dims] = self._aggregate(source, list(dims))
+
+    def _aggregate(self, facts, dims):
+        """Agrégat d'une combinaison de dimensions, en colonnes numpy (membres codés par leur rang)"""
+        table = facts.groupby(dims + ['measure'], observed=True)['value'].agg(['sum', 'count', 'min', 'max'])
+        table = table.reset_index()
+        cells = {dim: table[dim].map({m: i for i, m in enumerate(self.members[dim])}).to_numpy(np.int64)
+                 for dim in dims}
+        cells['measure'] = table['measure'].map({m: i for i, m in enumerate(self.measures)}).to_numpy(np.int64)
+        for agg in ('sum', 'count', 'min', 'max'):
+            cells[agg] = table[agg].to_numpy(np.float64)
+        return cells
+
+    def _match(self, dim, values):
+        """Codes des membres de `dim` désignés par le filtre (noms comparés sans accents ni casse)"""
+        values = values if isinstance(values, (list, tuple, set)) else [values]
+        keys = self._keys[dim]
+        unknown = [v for v in values if member_key(dim, v) not in keys]
+        if unknown:
+            raise ValueError(f"Valeurs inconnues pour {dim}: {unknown}")
+        codes = np.array(sorted({keys[member_key(dim, v)] for v in values}), dtype=np.int64)
+        if dim == 'region' and len(codes) > 1 and self.members['region'].index(TOTAL) in codes:
+            # Le total national contient déjà les régions : les deux ensemble seraient comptés deux fois
+            raise ValueError(f"'{TOTAL}' ne se combine pas avec des régions dans un filtre region")
+        return codes
+
+    def query(self, measures=None, group_by=(), filters=None, rollup=False):
+        """
+        Agrégats de `measures` groupés par `group_by`, restreints par `filters`
+        ({dimension: valeur ou liste}). Avec `rollup`, ajoute les sous-totaux de chaque
+        préfixe de group_by (dimensions retirées à None), jusqu'au total général.
+        Retourne un DataFrame : dimensions, measure, sum, count, mean, min, max.
+        """
+        if isinstance(measures, str):
+            measures = [measures]
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        if not isinstance(measures, (list, tuple, type(None))) or not isinstance(group_by, (list, tuple, type(None))):
+            raise ValueError('measures et group_by sont des listes, ex : {"group_by": ["region", "year"]}')
+        if not isinstance(filters, (dict, type(None))):
+            raise ValueError('filters est un objet {dimension: valeur ou liste}, ex : {"year": [2016, 2017]}')
+        group_by = list(group_by or [])
+        filters = dict(filters or {})
+        unknown = [d for d in group_by + list(filters) if d not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Dimensions inconnues: {unknown}. Dimensions : {', '.join(DIMENSIONS)}")
+        measures = list(measures or self.measures)
+        missing = [m for m in measures if m not in self.measures]
+        if missing:
+            raise ValueError(f"Mesures inconnues: {missing}. Mesures : {', '.join(self.measures)}")
+        codes = {dim: self._match(dim, values) for dim, values in filters.items()}
+        codes['measure'] = np.array([self.measures.index(m) for m in measures], dtype=np.int64)
+        levels = [group_by[:k] for k in range(len(group_by), -1, -1)] if rollup else [group_by]
+        return pd.concat([self._level(level, codes) for level in levels], ignore_index=True)
+
+    def _level(self, group_by, codes):
+        dims = tuple(d for d in DIMENSIONS if d in group_by or d in codes)
+        cells = self.cuboids[dims]
+        mask = np.ones(len(cells['measure']), dtype=bool)
+        for dim, wanted in codes.items():
+            mask &= np.isin(cells[dim], wanted)
+        if 'region' in group_by and 'region' not in codes:
+            mask &= cells['region'] != self.members['region'].index(TOTAL)
+        keys = group_by + ['measure']
+        key_codes = np.stack([cells[k][mask] for k in keys], axis=1)
+        # Roll-up des dimensions filtrées mais non groupées : quelques cellules précalculées à fusionner
+        groups, inverse = np.unique(key_codes, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        n = len(groups)
+        total = np.bincount(inverse, weights=cells['sum'][mask], minlength=n)
+        count = np.bincount(inverse, weights=cells['count'][mask], minlength=n)
+        low = np.full(n, np.inf)
+        np.minimum.at(low, inverse, cells['min'][mask])
+        high = np.full(n, -np.inf)
+        np.maximum.at(high, inverse, cells['max'][mask])
+        result = {}
+        for i, dim in enumerate(DIMENSIONS):
+            column = keys.index(dim) if dim in group_by else None
+            result[dim] = [self.members[dim][c] for c in groups[:, column]] if column is not None else [None] * n
+        result['measure'] = [self.measures[c] for c in groups[:, -1]]
+        result.update(sum=total, count=count.astype(np.int64), mean=total / np.maximum(count, 1), min=low, max=high)
+        return pd.DataFrame(result, columns=DIMENSIONS + ['measure'] + AGGREGATES)
+
+    def describe(self):
+        """Dimensions, membres, mesures et taille du cube"""
+        return {
+            'dimensions': {dim: self.members[dim] for dim in DIMENSIONS},
+            'measures': self.measures,
+            'aggregates': AGGREGATES,
+            'facts': len(self.facts),
+            'cuboids': len(self.cuboids),
+            'cells': int(sum(len(c) for c in self.cuboids.values())),
+        }
+
+
+_lock = threading.Lock()
+_state = {'key': None, 'cube': None}
+
+
+def _data_key(data_dir):
+    schemas = catalog.for_dir(data_dir)
+    schemas.refresh()
+    return tuple(sorted((name, entry['sha256']) for name, entry in schemas.files.items()))
+
+
+def get(data_dir=datasets.DATA_DIR):
+    """Cube des CSV de data_dir, construit une fois puis reconstruit seulement si un fichier change"""
+    key = (data_dir, _data_key(data_dir))
+    if _state['key'] != key:
+        with _lock:
+            if _state['key'] != key:
+                started = time.perf_counter()
+                _state['cube'] = Cube(build_facts(data_dir))
+                _state['key'] = key
+                print(f"[CUBE] {len(_state['cube'].facts)} faits, construit en {time.perf_counter() - started:.2f} s")
+    return _state['cube']
+
+
+def query(measures=None, group_by=(), filters=None, rollup=False):
+    return get().query(measures, group_by, filters, rollup)
+
+
+def to_records(result):
+    """Lignes JSON : années en int, valeurs manquantes à None"""
+    result = result.astype(object).where(result.notna(), None)
+    return [
+        {k: (int(v) if k in ('year', 'count') and v is not None else v) for k, v in row.items()}
+        for row in result.to_dict(orient='records')
+    ]
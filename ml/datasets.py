@@ -0,0 +1,219 @@
+"""
+Jeux de données fusionnés des modèles RF, décrits de façon déclarative.
+
+Chaque source (SOURCES) est un CSV de data/ au format large (une colonne par
+année), dépivoté une seule fois en table longue (Groupes, Cultures, Année,
+mesure) avec des clés harmonisées (ex : `Groupes de produits` -> `Groupes`).
+Les fusions (FUSIONS) joignent ces tables longues sur leurs clés :
+- les CSV bruts et les tables longues sont mis en cache (mémoire, et Parquet
+  sur disque pour les tables longues), invalidés par taille et date du fichier ;
+- les tables longues sont indexées et triées sur les clés, les jointures se
+  font index contre index ;
+- l'ordre des lignes est celui de la première source, comme avec pd.merge.
+
+Usage :
+    from sgai.ml import datasets
+    df, target = datasets.fusion('superficie_prix_production')
+    df = datasets.fuse(['Production', 'Prix'], how='left')
+"""
+import os
+import hashlib
+import threading
+import pandas as pd
+from sgai.ml import catalog
+
+BASE_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+# Répertoire propre : results/cache/ est le stockage LRU des rapports (services/report_cache.py)
+CACHE_DIR = os.path.join(BASE_DIR, 'results', 'datasets_cache')
+
+PROD_CSV = 'Production des principales cultures (2015-2018).csv'
+SURF_CSV = 'Superficie des cultures (2014-2018).csv'
+PRIX_CSV = 'Prix moyens (2014-2016).csv'
+
+KEYS = ['Groupes', 'Cultures', 'Année']
+ROW = '_ligne'
+
+
+class Source:
+    """CSV large à dépivoter : colonnes identifiantes, renommages vers les clés communes, mesure"""
+
+    def __init__(self, file, measure, id_vars, rename=None, var_name='Année'):
+        self.file = file
+        self.measure = measure
+        self.id_vars = list(id_vars)
+        self.rename = dict(rename or {})
+        self.var_name = var_name
+
+    def spec(self):
+        return repr((self.file, self.measure, self.id_vars, sorted(self.rename.items()), self.var_name))
+
+
+class Fusion:
+    """Jeu d'entraînement fusionné : cible et sources, dans l'ordre de jointure"""
+
+    def __init__(self, target, sources, how='inner'):
+        self.target = target
+        self.sources = list(sources)
+        self.how = how
+
+
+SOURCES = {
+    'Production': Source(PROD_CSV, 'Production', ['Groupes', 'Cultures']),
+    'Superficie': Source(SURF_CSV, 'Superficie', ['Groupes', 'Cultures']),
+    'Prix': Source(PRIX_CSV, 'Prix', ['Groupes de produits', 'Cultures'], rename={'Groupes de produits': 'Groupes'}),
+}
+
+# Modèles fusionnés de models/train_model.py (rf_model_<nom>.pkl)
+FUSIONS = {
+    'superficie_production': Fusion('Production', ['Production', 'Superficie']),
+    'prix_production': Fusion('Production', ['Production', 'Prix']),
+    'prix_superficie': Fusion('Superficie', ['Superficie', 'Prix']),
+    'superficie_prix_production': Fusion('Production', ['Production', 'Superficie', 'Prix']),
+}
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def join_indexed(frames, how='inner'):
+    """
+    Jointure successive de DataFrames indexés sur les mêmes clés (index triés) ;
+    l'ordre des lignes de la première table est conservé via la colonne ROW.
+    """
+    joined = frames[0]
+    for frame in frames[1:]:
+        joined = joined.join(frame.drop(columns=[ROW], errors='ignore'), how=how, lsuffix='_x', rsuffix='_y')
+    if ROW in joined.columns:
+        joined = joined.sort_values(ROW, kind='stable').drop(columns=[ROW])
+    return joined
+
+
+class DatasetEngine:
+    """Cache des CSV bruts, des tables longues et des fusions d'un répertoire de données"""
+
+    def __init__(self, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self._raw = {}
+        self._long = {}
+        self._fused = {}
+        self._lock = threading.RLock()
+
+    def path(self, file):
+        return file if os.path.isabs(file) else os.path.join(self.data_dir, file)
+
+    def raw(self, file):
+        """CSV brut, lu une seule fois tant que le fichier ne change pas (copie)"""
+        path = self.path(file)
+        signature = file_signature(path)
+        with self._lock:
+            cached = self._raw.get(path)
+            if cached is None or cached[0] != signature:
+                options = catalog.for_dir(os.path.dirname(path)).read_options(path)
+                cached = (signature, pd.read_csv(path, **options))
+                self._raw[path] = cached
+            return cached[1].copy()
+
+    def _disk_path(self, source, signature):
+        digest = hashlib.sha256(f'{source.spec()}|{signature}'.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'{source.measure}-{digest}.parquet')
+
+    def long(self, name):
+        """Table longue d'une source, indexée et triée sur KEYS (non copiée : lecture seule)"""
+        source = SOURCES[name]
+        signature = file_signature(self.path(source.file))
+        with self._lock:
+            cached = self._long.get(name)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+            disk_path = self._disk_path(source, signature) if self.cache_dir else None
+            if disk_path and os.path.exists(disk_path):
+                table = pd.read_parquet(disk_path)
+            else:
+                table = self._melt(source)
+                if disk_path:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    table.to_parquet(disk_path)
+            self._long[name] = (signature, table)
+            # Les fusions qui dépendent de cette source sont recalculées
+            self._fused = {key: value for key, value in self._fused.items() if name not in key[0]}
+            return table
+
+    def _melt(self, source):
+        df = self.raw(source.file)
+        table = df.melt(id_vars=source.id_vars, var_name=source.var_name, value_name=source.measure)
+        table = table.rename(columns=source.rename)
+        table[ROW] = range(len(table))
+        return table.set_index(KEYS).sort_index()
+
+    def fuse(self, sources, how='inner'):
+        """Jointure des tables longues des sources (colonnes KEYS + une mesure par source)"""
+        key = (tuple(sources), how)
+        with self._lock:
+            tables = [self.long(name) for name in sources]
+            fused = self._fused.get(key)
+            if fused is None:
+                fused = join_indexed(tables, how=how).reset_index()
+                self._fused[key] = fused
+            return fused.copy()
+
+    def fusion(self, name):
+        """(DataFrame, cible) du modèle fusionné `name`"""
+        spec = FUSIONS[name]
+        return self.fuse(spec.sources, spec.how), spec.target
+
+    def available(self, name):
+        """Vrai si tous les fichiers sources de la fusion sont présents avec leurs colonnes identifiantes"""
+        schemas = catalog.for_dir(self.data_dir)
+        names = schemas.names()
+        for source in (SOURCES[s] for s in FUSIONS[name].sources):
+            if source.file not in names or schemas.missing_columns([source.file], source.id_vars):
+                return False
+        return True
+
+    def merge_files(self, files, on=None, how='inner'):
+        """
+        Jointure de CSV bruts (lus une fois) sur les colonnes `on`, ou, sans `on`,
+        sur les clés de jointure planifiées par le catalogue (catalog.plan_merge)
+        """
+        # Plan établi et colonnes vérifiées dans le catalogue avant de lire les fichiers
+        paths = [self.path(file) for file in files]
+        plan = catalog.for_dir(os.path.dirname(paths[0])).plan_merge(paths, on)
+        first = self.raw(paths[0])
+        columns = list(first.columns)
+        if not plan:
+            return first
+        first[ROW] = range(len(first))
+        keys = [left for left, _ in plan[0]['on']]
+        if all(step['on'] == [(key, key) for key in keys] for step in plan):
+            # Mêmes colonnes partout : jointure index contre index
+            frames = [first.set_index(keys).sort_index()]
+            frames += [self.raw(path).set_index(keys).sort_index() for path in paths[1:]]
+            joined = join_indexed(frames, how=how).reset_index()
+        else:
+            joined = first
+            for path, step in zip(paths[1:], plan):
+                left_on, right_on = (list(side) for side in zip(*step['on']))
+                joined = joined.merge(self.raw(path), left_on=left_on, right_on=right_on, how=how,
+                                      suffixes=('_x', '_y'))
+            joined = joined.sort_values(ROW, kind='stable').drop(columns=[ROW])
+        # Colonnes dans l'ordre de pd.merge : celles du premier fichier, puis les autres
+        return joined[[c for c in columns if c in joined.columns] + [c for c in joined.columns if c not in columns]]
+
+
+engine = DatasetEngine()
+
+
+def raw(file):
+    return engine.raw(file)
+
+
+def fuse(sources, how='inner'):
+    return engine.fuse(sources, how)
+
+
+def fusion(name):
+    return engine.fusion(name)
@@ -0,0 +1,272 @@
+"""
+Distillation des modèles lourds en élèves à faible latence.
+
+Le maître (forêt de 200 arbres de models/, ou MLP Keras de train_model.py)
+étiquette son jeu d'entraînement et des échantillons synthétiques ; plusieurs
+élèves sont entraînés sur ces prédictions :
+- gbm    : gradient boosting peu profond ;
+- forest : petite forêt (peu d'arbres, profondeur bornée) ;
+- pruned : sous-ensemble des arbres du maître choisi glouton (maîtres RF seulement) ;
+- mlp    : perceptron à une couche cachée.
+
+Pour chaque élève sont mesurés la fidélité au maître, la précision sur les
+lignes de test du maître (jamais vues par le maître ni par les élèves) et la
+latence (une ligne, lot de 1000 lignes). Parmi les élèves assez fidèles, le
+plus rapide (à latence comparable, le plus fidèle) est enregistré dans
+models/student_<nom>.pkl ; le compromis complet est écrit dans
+results/distillation.json. L'élève n'est servi que sur les
+endpoints configurés dans models.SERVING.
+
+Usage hors-ligne :
+    python -m sgai.ml.distill [--model NOM] [--synthetic 2000] [--min-fidelity 0.95]
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.compose import TransformedTargetRegressor
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+from sklearn.neural_network import MLPRegressor
+from sklearn.preprocessing import StandardScaler
+
+BASE_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+RECORD_PATH = os.path.join(BASE_DIR, 'results', 'distillation.json')
+
+SYNTHETIC_ROWS = 2000
+# Fidélité minimale (R2 élève vs maître) pour qu'un élève puisse être servi
+MIN_FIDELITY = 0.95
+PRUNED_TREES = 20
+# Colonnes à peu de valeurs distinctes (catégories encodées, années) : rééchantillonnées sans bruit
+DISCRETE_MAX_VALUES = 20
+LATENCY_REPEATS = 50
+LATENCY_BATCH = 1000
+
+
+def student_candidates(seed=0):
+    """Élèves génériques : {nom: fabrique d'estimateur}"""
+    return {
+        'gbm': lambda: GradientBoostingRegressor(n_estimators=100, max_depth=3, random_state=seed),
+        'forest': lambda: RandomForestRegressor(n_estimators=20, max_depth=10, random_state=seed),
+        'mlp': lambda: TransformedTargetRegressor(
+            regressor=MLPRegressor(hidden_layer_sizes=(32,), max_iter=2000, random_state=seed),
+            transformer=StandardScaler(),
+        ),
+    }
+
+
+def synthetic_samples(X, n, seed=0, swap=0.3, noise=0.05):
+    """
+    Lignes proches des données réelles : chaque ligne part d'une ligne réelle dont une
+    part `swap` des colonnes est remplacée par la valeur d'une autre ligne ; les colonnes
+    continues reçoivent un bruit gaussien de `noise` écart-type.
+    """
+    X = np.asarray(X, dtype=float)
+    if not n or not len(X):
+        return np.empty((0, X.shape[1]))
+    rng = np.random.default_rng(seed)
+    samples = X[rng.integers(len(X), size=n)]
+    swapped = rng.random(samples.shape) < swap
+    donors = X[rng.integers(len(X), size=n)]
+    samples[swapped] = donors[swapped]
+    continuous = np.array([len(np.unique(X[:, j])) > DISCRETE_MAX_VALUES for j in range(X.shape[1])])
+    if continuous.any():
+        scale = X[:, continuous].std(axis=0) * noise
+        samples[:, continuous] += rng.normal(size=(n, continuous.sum())) * scale
+    return samples
+
+
+def prune_forest(forest, per_tree, target, n_trees=PRUNED_TREES):
+    """
+    Sous-forêt de `n_trees` arbres choisis glouton : à chaque étape, l'arbre dont l'ajout
+    rapproche le plus la moyenne des arbres retenus de `target` (prédictions du maître).
+    """
+    n_trees = min(n_trees, per_tree.shape[1])
+    chosen = []
+    total = np.zeros(len(per_tree))
+    for k in range(1, n_trees + 1):
+        errors = (((total[:, None] + per_tree) / k - target[:, None]) ** 2).mean(axis=0)
+        errors[chosen] = np.inf
+        best = int(errors.argmin())
+        chosen.append(best)
+        total += per_tree[:, best]
+    pruned = copy.copy(forest)
+    pruned.estimators_ = [forest.estimators_[i] for i in chosen]
+    pruned.n_estimators = len(chosen)
+    return pruned
+
+
+def measure_latency(predict, X, repeats=LATENCY_REPEATS, batch=LATENCY_BATCH):
+    """Latence médiane d'une prédiction d'une ligne et temps par ligne d'un lot (microsecondes)"""
+    X = np.asarray(X)
+    single = []
+    for i in range(repeats):
+        row = X[i % len(X):i % len(X) + 1]
+        started = time.perf_counter()
+        predict(row)
+        single.append(time.perf_counter() - started)
+    rows = X[np.arange(batch) % len(X)]
+    started = time.perf_counter()
+    predict(rows)
+    batch_seconds = time.perf_counter() - started
+    return {
+        'single_row_us': round(float(np.median(single)) * 1e6, 1),
+        'batch_row_us': round(batch_seconds / batch * 1e6, 2),
+    }
+
+
+def _scores(y_true, y_pred):
+    return {'mse': float(mean_squared_error(y_true, y_pred)), 'r2': float(r2_score(y_true, y_pred))}
+
+
+def distill(teacher_predict, X_train, X_test, y_test, synthetic=SYNTHETIC_ROWS, forest=None,
+            tree_predictions=None, seed=0):
+    """
+    Entraîne les élèves sur les prédictions du maître (lignes d'entraînement + synthétiques).
+    `forest`/`tree_predictions` (maîtres RF) ajoutent l'élève 'pruned'. Retourne
+    ({nom: élève}, compte rendu : précision, fidélité et latence du maître et de chaque élève).
+    """
+    X_train = np.asarray(X_train, dtype=float)
+    X_test = np.asarray(X_test, dtype=float)
+    X_synthetic = synthetic_samples(X_train, synthetic, seed)
+    # Une part des lignes synthétiques sert à mesurer la fidélité hors entraînement
+    if len(X_synthetic) >= 10:
+        X_synthetic, X_check = train_test_split(X_synthetic, test_size=0.2, random_state=seed)
+    else:
+        X_check = np.empty((0, X_train.shape[1]))
+    X_fit = np.vstack([X_train, X_synthetic])
+    y_fit = np.asarray(teacher_predict(X_fit), dtype=float)
+    X_fidelity = np.vstack([X_test, X_check])
+    teacher_fidelity = np.asarray(teacher_predict(X_fidelity), dtype=float)
+
+    record = {
+        'rows': {'train': len(X_train), 'synthetic': len(X_synthetic), 'test': len(X_test),
+                 'fidelity_check': len(X_fidelity)},
+        'teacher': {**_scores(y_test, teacher_predict(X_test)), **measure_latency(teacher_predict, X_fidelity)},
+        'students': {},
+    }
+    factories = student_candidates(seed)
+    if forest is not None and tree_predictions is not None:
+        factories['pruned'] = lambda: prune_forest(forest, tree_predictions(X_fit), y_fit)
+    students = {}
+    for kind, factory in factories.items():
+        started = time.perf_counter()
+        student = factory()
+        if kind != 'pruned':
+            student.fit(X_fit, y_fit)
+        fit_seconds = time.perf_counter() - started
+        fidelity = _scores(teacher_fidelity, student.predict(X_fidelity))
+        record['students'][kind] = {
+            **_scores(y_test, student.predict(X_test)),
+            'fidelity_r2': fidelity['r2'],
+            'fidelity_mse': fidelity['mse'],
+            'fit_seconds': round(fit_seconds, 3),
+            **measure_latency(student.predict, X_fidelity),
+        }
+        students[kind] = student
+    return students, record
+
+
+def select_student(record, min_fidelity=MIN_FIDELITY, latency_tolerance=1.2):
+    """
+    Parmi les élèves dont la fidélité atteint min_fidelity, les plus rapides (une ligne, à
+    `latency_tolerance` près du plus rapide) ; le plus fidèle d'entre eux, sinon None.
+    """
+    eligible = {kind: s for kind, s in record['students'].items() if s['fidelity_r2'] >= min_fidelity}
+    if not eligible:
+        return None
+    fastest = min(s['single_row_us'] for s in eligible.values())
+    near = {kind: s for kind, s in eligible.items() if s['single_row_us'] <= fastest * latency_tolerance}
+    return max(near, key=lambda kind: near[kind]['fidelity_r2'])
+
+
+def write_record(name, record, path=RECORD_PATH):
+    records = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            records = json.load(f)
+    records[name] = dict(record, timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(records, f, indent=2)
+
+
+def rf_split(name):
+    """
+    Lignes d'entraînement et de test du maître RF `name`, prétraitées : mêmes imputations
+    et même découpage que models/train_model.py::train_rf_model.
+    """
+    from sgai.ml import models, prediction_table
+    frame = prediction_table.training_frame(name)
+    if frame is None:
+        return None
+    df, target = frame
+    bundle = models.load_rf_bundle(name)
+    df = df.copy()
+    df[target] = df[target].fillna(df[target].mean())
+    X = df.drop(columns=[target])
+    for col in X.columns:
+        if X[col].isnull().any() and pd.api.types.is_numeric_dtype(X[col]):
+            X[col] = X[col].fillna(X[col].mean())
+    X_scaled = models.prepare_rf_features(name, X[bundle['meta']['features']])
+    return train_test_split(X_scaled, df[target], test_size=0.2, random_state=42)
+
+
+def distill_rf(name, synthetic=SYNTHETIC_ROWS, min_fidelity=MIN_FIDELITY, seed=0):
+    """Distille le modèle RF `name` ; enregistre l'élève retenu et retourne le compte rendu"""
+    from sgai.ml import models
+    split = rf_split(name)
+    if split is None:
+        print(f"[INFO] Pas de jeu d'entraînement connu pour {name}, ignoré.")
+        return None
+    X_train, X_test, _, y_test = split
+    with models.engine.use(models.rf_engine_name(name)) as version:
+        teacher = version.backend
+        students, record = distill(teacher.model.predict, X_train, X_test, y_test, synthetic,
+                                   forest=teacher.model, tree_predictions=teacher.tree_predictions, seed=seed)
+    record['teacher']['n_trees'] = len(teacher.model.estimators_)
+    selected = select_student(record, min_fidelity)
+    record.update(selected=selected, min_fidelity=min_fidelity)
+    path = os.path.join(models.MODELS_DIR, f'student_{name}.pkl')
+    if selected:
+        # Version du maître distillé : l'élève n'est plus servi si le maître change (models.student_matches)
+        joblib.dump({'model': students[selected], 'teacher': teacher.signature}, path)
+    elif os.path.exists(path):
+        # Aucun élève assez fidèle : un ancien élève ne doit plus être servi
+        os.remove(path)
+    write_record(name, record)
+    _print_record(name, record)
+    return record
+
+
+def _print_record(name, record):
+    teacher = record['teacher']
+    print(f"\n[DISTILL] {name} : maître R2 {teacher['r2']:.3f}, {teacher['single_row_us']:.0f} µs/ligne seule, "
+          f"{teacher['batch_row_us']:.1f} µs/ligne en lot")
+    for kind, student in record['students'].items():
+        mark = '*' if kind == record.get('selected') else ' '
+        print(f"  {mark} {kind:<7} R2 {student['r2']:.3f}, fidélité {student['fidelity_r2']:.3f}, "
+              f"{student['single_row_us']:.0f} µs/ligne seule, {student['batch_row_us']:.1f} µs/ligne en lot")
+
+
+def main(argv=None):
+    from sgai.ml import models
+    parser = argparse.ArgumentParser(description='Distillation des modèles RF de models/ en élèves rapides')
+    parser.add_argument('--model', action='append', help='modèle RF à distiller (défaut : tous)')
+    parser.add_argument('--synthetic', type=int, default=SYNTHETIC_ROWS, help='lignes synthétiques étiquetées par le maître')
+    parser.add_argument('--min-fidelity', type=float, default=MIN_FIDELITY,
+                        help="R2 minimal de l'élève par rapport au maître pour être retenu")
+    args = parser.parse_args(argv)
+    for name in args.model or models.list_rf_models():
+        distill_rf(name, args.synthetic, args.min_fidelity)
+    print(f"\nCompromis précision / latence : {RECORD_PATH}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,399 @@
+"""
+Moteur d'inférence partagé par toutes les familles de modèles (sklearn, dont les
+XGBoost sérialisés avec joblib, et Keras).
+
+Chaque modèle est enregistré sous un nom avec son backend ; il est chargé une
+seule fois à la première utilisation, ses prédictions sont découpées en lots
+de taille bornée, et le nombre d'appels simultanés est limité par modèle.
+Un micro-batching regroupe les petites requêtes concurrentes en un seul appel
+au modèle (par défaut pour Keras seulement ; fenêtre par famille réglable par
+SGAI_BATCH_WINDOW_MS, ex : "keras=5,sklearn=0").
+
+Les modèles sont versionnés : swap() charge et valide une nouvelle version en
+arrière-plan puis la publie atomiquement ; chaque requête utilise une seule
+version de bout en bout (prétraitement et inférence), et une version
+remplacée n'est libérée qu'après la fin des requêtes qui l'utilisent.
+"""
+import os
+import time
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+import joblib
+import numpy as np
+from sgai.services import metrics, threads
+
+logger = logging.getLogger(__name__)
+
+# Appels simultanés par défaut selon la famille (None = illimité)
+DEFAULT_CONCURRENCY = {'sklearn': None, 'keras': 2}
+# Fenêtre de micro-batching par défaut selon la famille (ms, 0 = appel direct) : un appel
+# Keras a un coût fixe élevé, une prédiction sklearn sur quelques lignes non
+DEFAULT_BATCH_WINDOW_MS = {'sklearn': 0, 'keras': 2}
+
+
+def _parse_batch_windows(spec):
+    """'famille=ms,...' -> {famille: ms} ; une entrée mal formée est ignorée (avertissement)"""
+    windows = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        family, _, value = item.partition('=')
+        try:
+            if family.strip() not in DEFAULT_BATCH_WINDOW_MS:
+                raise ValueError(f"famille inconnue (familles : {', '.join(DEFAULT_BATCH_WINDOW_MS)})")
+            windows[family.strip()] = max(0.0, float(value))
+        except ValueError as e:
+            logger.warning(f"[ENGINE] Entrée SGAI_BATCH_WINDOW_MS ignorée: {item.strip()!r} ({e})")
+    return windows
+
+
+DEFAULT_BATCH_WINDOW_MS.update(_parse_batch_windows(os.environ.get('SGAI_BATCH_WINDOW_MS', '')))
+
+
+class SklearnBackend:
+    """Estimateur sklearn sérialisé avec joblib"""
+    family = 'sklearn'
+
+    def __init__(self, path):
+        self.path = path
+        self.model = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Modèle introuvable: {self.path}")
+        self.model = joblib.load(self.path)
+        if hasattr(self.model, 'n_jobs'):
+            # Parallélisme de prédiction borné par le budget du worker
+            self.model.n_jobs = threads.n_jobs()
+        return self
+
+    def fresh(self):
+        """Nouvelle instance non chargée (nouvelle version lors d'un remplacement à chaud)"""
+        return type(self)(self.path)
+
+    def smoke_input(self):
+        """Entrée de la prédiction de contrôle avant remplacement (None : pas de contrôle)"""
+        return None
+
+    def preprocess(self, X):
+        return X
+
+    def predict(self, X):
+        return np.asarray(self.model.predict(X))
+
+
+class KerasBackend(SklearnBackend):
+    """Modèle Keras (.h5 ou SavedModel), sortie aplatie en 1D pour une cible unique"""
+    family = 'keras'
+
+    # En dessous, un appel direct évite le coût fixe de model.predict()
+    DIRECT_CALL_ROWS = 256
+
+    def load(self):
+        import tensorflow as tf
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Modèle introuvable: {self.path}")
+        self.model = tf.keras.models.load_model(self.path)
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X, dtype='float32')
+        if len(X) <= self.DIRECT_CALL_ROWS:
+            y = self.model(X, training=False).numpy()
+        else:
+            y = self.model.predict(X, batch_size=self.DIRECT_CALL_ROWS, verbose=0)
+        return y[:, 0] if y.ndim == 2 and y.shape[1] == 1 else y
+
+
+class _MicroBatcher:
+    """Regroupe les requêtes concurrentes d'un modèle pendant une courte fenêtre"""
+
+    def __init__(self, predict, max_batch_size, window_ms):
+        self._predict = predict
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, X):
+        future = Future()
+        self._queue.put((np.asarray(X), future))
+        return future.result()
+
+    def stop(self):
+        self._queue.put(None)
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            items = [item]
+            rows = len(items[0][0])
+            deadline = time.monotonic() + self.window
+            while rows < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Arrêt demandé : on termine le lot en cours puis on sort
+                    self._queue.put(None)
+                    break
+                items.append(item)
+                rows += len(item[0])
+            try:
+                y = self._predict(np.concatenate([X for X, _ in items]))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for X, future in items:
+                future.set_result(y[start:start + len(X)])
+                start += len(X)
+
+
+class _Version:
+    """Une version chargée d'un modèle et le nombre de requêtes qui l'utilisent"""
+
+    def __init__(self, backend, number):
+        self.backend = backend
+        self.number = number
+        self.loaded_at = time.time()
+        self.inflight = 0
+        self.retired = False
+        self.batcher = None
+
+
+class _Entry:
+    def __init__(self, backend, max_concurrency, max_batch_size, batch_window_ms):
+        self.backend = backend
+        self.current = None
+        self.versions = 0
+        # Versions remplacées, encore utilisées par des requêtes en cours
+        self.draining = []
+        self.load_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.swap_lock = threading.Lock()
+        self.swap_status = None
+        self.swap_done = threading.Event()
+        self.semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.max_batch_size = max_batch_size
+        self.batch_window_ms = batch_window_ms
+
+
+class InferenceEngine:
+    """Registre des modèles servis par le processus"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, backend, max_concurrency=-1, max_batch_size=4096, batch_window_ms=-1):
+        """Déclare un modèle ; max_concurrency/batch_window_ms=-1 prennent la valeur par défaut de sa famille"""
+        if max_concurrency == -1:
+            max_concurrency = DEFAULT_CONCURRENCY.get(backend.family)
+        if batch_window_ms == -1:
+            batch_window_ms = DEFAULT_BATCH_WINDOW_MS.get(backend.family, 0)
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(backend, max_concurrency, max_batch_size, batch_window_ms)
+        return self._entries[name]
+
+    def names(self):
+        return sorted(self._entries)
+
+    def _entry(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Modèle non enregistré: {name}")
+        return entry
+
+    def _install(self, name, entry, backend, seconds):
+        """Publie `backend` comme version courante (remplacement atomique de la référence)"""
+        with entry.lock:
+            entry.versions += 1
+            previous = entry.current
+            entry.current = _Version(backend, entry.versions)
+            if previous is not None:
+                previous.retired = True
+                entry.draining.append(previous)
+                drained = previous.inflight == 0
+        metrics.record_model_load(name, seconds, metrics.path_size(backend.path), entry.versions)
+        if previous is not None and drained:
+            self._release(entry, previous)
+        return entry.current
+
+    def _release(self, entry, version):
+        """Libère une version remplacée dont toutes les requêtes sont terminées"""
+        with entry.lock:
+            if version not in entry.draining:
+                return
+            entry.draining.remove(version)
+        if version.batcher is not None:
+            version.batcher.stop()
+        version.backend = None
+
+    def model(self, name):
+        """Backend chargé du modèle (chargement unique, même sous requêtes concurrentes)"""
+        entry = self._entry(name)
+        if entry.current is None:
+            with entry.load_lock:
+                if entry.current is None:
+                    start = time.perf_counter()
+                    with metrics.phase('load'):
+                        backend = entry.backend.fresh().load()
+                    self._install(name, entry, backend, time.perf_counter() - start)
+        return entry.current.backend
+
+    def family(self, name):
+        """Famille du backend d'un modèle (sklearn, keras)"""
+        return self._entry(name).backend.family
+
+    def preload(self, names=None, families=None):
+        """
+        Charge d'avance les modèles (tous par défaut, ou ceux des familles données) ;
+        retourne {nom: erreur} pour les échecs
+        """
+        errors = {}
+        for name in names or self.names():
+            if families is not None and self.family(name) not in families:
+                continue
+            try:
+                self.model(name)
+            except Exception as e:
+                errors[name] = f'{type(e).__name__}: {e}'
+        return errors
+
+    def is_loaded(self, name):
+        return self._entry(name).current is not None
+
+    @contextmanager
+    def use(self, name):
+        """
+        Version courante du modèle, réservée pendant le bloc : un remplacement
+        concurrent ne la libère qu'une fois ce bloc terminé.
+        """
+        entry = self._entry(name)
+        self.model(name)
+        with entry.lock:
+            version = entry.current
+            version.inflight += 1
+        try:
+            yield version
+        finally:
+            with entry.lock:
+                version.inflight -= 1
+                drained = version.retired and version.inflight == 0
+            if drained:
+                self._release(entry, version)
+
+    def swap(self, name, backend=None, smoke_input=None, wait=False, on_ready=None):
+        """
+        Charge une nouvelle version du modèle en arrière-plan, la chauffe et la valide
+        par une prédiction de contrôle, puis la substitue atomiquement à la version
+        courante. Les requêtes en cours terminent sur l'ancienne version, libérée
+        ensuite. on_ready() est appelé une fois la nouvelle version en service, avant
+        que le remplacement ne soit signalé terminé (ex : recalcul des prédictions
+        précalculées). Retourne l'état du remplacement (voir swap_status).
+        """
+        entry = self._entry(name)
+        # État et événement publiés avec la prise du verrou : un appel concurrent les voit toujours
+        with entry.lock:
+            started = entry.swap_lock.acquire(blocking=False)
+            if started:
+                entry.swap_status = {'state': 'loading', 'started_at': time.time(), 'error': None,
+                                     'version': entry.versions}
+                entry.swap_done = threading.Event()
+            done = entry.swap_done
+        if not started:
+            # Un remplacement est déjà en cours : on le suit au lieu d'en lancer un second
+            if wait:
+                done.wait()
+            return dict(entry.swap_status)
+
+        def run():
+            try:
+                start = time.perf_counter()
+                fresh = (backend or entry.backend.fresh()).load()
+                X = smoke_input if smoke_input is not None else fresh.smoke_input()
+                if X is not None:
+                    # Prédiction de contrôle : chauffe le modèle et vérifie la cohérence des artefacts
+                    y = np.asarray(fresh.predict(fresh.preprocess(X)), dtype=float)
+                    if len(y) != len(X) or not np.all(np.isfinite(y)):
+                        raise ValueError(f"Prédiction de contrôle invalide: {y[:5]}")
+                version = self._install(name, entry, fresh, time.perf_counter() - start)
+                if on_ready is not None:
+                    try:
+                        on_ready()
+                    except Exception as e:
+                        # La nouvelle version est déjà en service : le remplacement reste réussi
+                        entry.swap_status['on_ready_error'] = f'{type(e).__name__}: {e}'
+                entry.swap_status.update(state='ready', version=version.number,
+                                         seconds=round(time.perf_counter() - start, 3))
+            except Exception as e:
+                entry.swap_status.update(state='failed', error=f'{type(e).__name__}: {e}')
+            finally:
+                done.set()
+                entry.swap_lock.release()
+
+        threading.Thread(target=run, daemon=True, name=f'swap-{name}').start()
+        if wait:
+            done.wait()
+        return dict(entry.swap_status)
+
+    def status(self, name):
+        """Version courante, requêtes en cours et dernier remplacement d'un modèle"""
+        entry = self._entry(name)
+        with entry.lock:
+            current = entry.current
+            return {
+                'version': current.number if current else None,
+                'loaded_at': current.loaded_at if current else None,
+                'inflight': current.inflight if current else 0,
+                'draining': [{'version': v.number, 'inflight': v.inflight} for v in entry.draining],
+                'swap': dict(entry.swap_status) if entry.swap_status else None,
+            }
+
+    def _predict_chunks(self, entry, backend, X):
+        if len(X) <= entry.max_batch_size:
+            return backend.predict(X)
+        return np.concatenate([
+            backend.predict(X[start:start + entry.max_batch_size])
+            for start in range(0, len(X), entry.max_batch_size)
+        ])
+
+    def _run(self, entry, backend, X):
+        if entry.semaphore is None:
+            return self._predict_chunks(entry, backend, X)
+        with entry.semaphore:
+            return self._predict_chunks(entry, backend, X)
+
+    def predict(self, name, X):
+        """Prétraite X avec le backend du modèle puis prédit (même version de bout en bout)"""
+        entry = self._entry(name)
+        with self.use(name) as version:
+            backend = version.backend
+            with metrics.phase('preprocess'):
+                features = backend.preprocess(X)
+            with metrics.phase('infer'):
+                if entry.batch_window_ms:
+                    if version.batcher is None:
+                        with entry.lock:
+                            if version.batcher is None:
+                                version.batcher = _MicroBatcher(
+                                    lambda batch: self._run(entry, backend, batch),
+                                    entry.max_batch_size, entry.batch_window_ms
+                                )
+                    return version.batcher.submit(features)
+                return self._run(entry, backend, features)
+
+
+engine = InferenceEngine()
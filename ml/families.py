@@ -0,0 +1,100 @@
+"""
+Familles de modèles RF par année (models/train_model.py : un modèle par année
+cible, entraîné sur les autres années du même CSV).
+
+Une famille regroupe les modèles `rf_model_<fichier>.csv_<année>.pkl` d'un
+même fichier, ex : "Superficie des cultures (2014-2018)" -> 2014..2018.
+predict_family() évalue tous les membres en une requête : les colonnes
+catégorielles sont encodées une seule fois pour toute la famille, la mise à
+l'échelle est partagée entre membres de même schéma (mêmes features, même
+scaler), et les membres sont évalués en parallèle.
+"""
+import re
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from sgai.api.routes.validation import validate_and_prepare_features
+from sgai.ml import models
+from sgai.ml.engine import engine
+from sgai.services import threads
+
+MEMBER_PATTERN = re.compile(r'^(?P<family>.+)\.csv_(?P<year>\d{4})$')
+
+_pool = ThreadPoolExecutor(max_workers=threads.cpu_budget(), thread_name_prefix='rf-family')
+
+
+def families():
+    """{famille: {année: nom du modèle}} pour les modèles RF de models/"""
+    result = {}
+    for name in models.list_rf_models():
+        match = MEMBER_PATTERN.match(name)
+        if match:
+            result.setdefault(match.group('family'), {})[int(match.group('year'))] = name
+    return {family: dict(sorted(members.items())) for family, members in sorted(result.items())}
+
+
+def _encode_shared(X, bundles):
+    """Encode chaque colonne catégorielle une seule fois pour toute la famille"""
+    X = X.copy()
+    encoded = {}
+    for bundle in bundles:
+        for col, encoder in (bundle.meta.get('encoders') or {}).items():
+            if col not in X.columns:
+                continue
+            classes = tuple(encoder.classes_)
+            if col in encoded:
+                if encoded[col] != classes:
+                    raise ValueError(f"Encodeurs différents pour la colonne {col} dans la famille")
+                continue
+            X[col] = encoder.transform(X[col].astype(str))
+            encoded[col] = classes
+    return X
+
+
+def predict_family(family, X, years=None):
+    """
+    Prédictions de chaque membre de la famille sur le DataFrame large X.
+    Retourne (années, matrice lignes x années, membres ignorés {année: features manquantes}).
+    """
+    members = families().get(family)
+    if not members:
+        raise KeyError(f"Famille de modèles inconnue: {family}")
+    if years:
+        unknown = [year for year in years if year not in members]
+        if unknown:
+            raise ValueError(f"Années absentes de la famille {family}: {unknown}")
+        members = {year: members[year] for year in years}
+
+    with ExitStack() as stack:
+        # Une version de chaque membre est réservée pour toute la requête (remplacement à chaud sûr)
+        bundles = {
+            year: stack.enter_context(engine.use(models.rf_engine_name(name))).backend
+            for year, name in members.items()
+        }
+        skipped = {}
+        groups = {}
+        for year, bundle in bundles.items():
+            missing = [f for f in bundle.meta['features'] if f not in X.columns]
+            if missing:
+                skipped[year] = missing
+            else:
+                groups.setdefault(bundle.fingerprint, []).append(year)
+        if not groups:
+            return [], np.empty((len(X), 0)), skipped
+
+        X_encoded = _encode_shared(X, [bundles[group[0]] for group in groups.values()])
+
+        def scale(group_years):
+            bundle = bundles[group_years[0]]
+            features = bundle.meta['features']
+            x_valid = validate_and_prepare_features(X_encoded[features].copy(), features)
+            return bundle.scaler.transform(x_valid)
+
+        scaled = dict(zip(groups, _pool.map(scale, groups.values())))
+        order = [(year, key) for key, group_years in groups.items() for year in group_years]
+        columns = list(_pool.map(lambda item: bundles[item[0]].predict(scaled[item[1]]), order))
+
+    order_years = [year for year, _ in order]
+    result_years = sorted(order_years)
+    predictions = np.column_stack([columns[order_years.index(year)] for year in result_years])
+    return result_years, predictions, skipped
@@ -1,25 +1,352 @@
+import os
+import time
 import joblib
+import threading
+import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
 from xgboost import XGBRegressor
+from sgai.api.routes.validation import validate_and_prepare_features
+from sgai.ml.engine import engine, SklearnBackend
+from sgai.services import metrics
 # ... autres imports nécessaires
 
+MODELS_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'models'))
+
+# Modèle servi par endpoint : 'teacher' (modèle d'origine) ou 'student' (élève distillé par
+# ml/distill.py, utilisé seulement s'il existe). Surcharge : SGAI_SERVING="sweep_rf=student,..."
+SERVING = {
+    'predict_rf': 'teacher',
+    'sweep_rf': 'teacher',
+}
+
+
+def _apply_serving_overrides(spec):
+    for item in spec.split(','):
+        endpoint, _, choice = item.partition('=')
+        if endpoint.strip() and choice.strip() in ('teacher', 'student'):
+            SERVING[endpoint.strip()] = choice.strip()
+
+
+_apply_serving_overrides(os.environ.get('SGAI_SERVING', ''))
+
+engine.register('production', SklearnBackend('models/production_model.pkl'))
+engine.register('cost', SklearnBackend('models/cost_model.pkl'))
+engine.register('weather', SklearnBackend('models/weather_model.pkl'))
+engine.register('inflation', SklearnBackend('models/inflation_model.pkl'))
+engine.register('volatility', SklearnBackend('models/volatility_model.pkl'))
+
 def predict_production(X):
-    model = joblib.load('models/production_model.pkl')
-    return model.predict(X)
+    return engine.predict('production', X)
 
 def predict_cost_variation(X):
-    model = joblib.load('models/cost_model.pkl')
-    return model.predict(X)
+    return engine.predict('cost', X)
 
 def predict_weather(X):
-    model = joblib.load('models/weather_model.pkl')
-    return model.predict(X)
+    return engine.predict('weather', X)
 
 def predict_inflation(X):
-    model = joblib.load('models/inflation_model.pkl')
-    return model.predict(X)
+    return engine.predict('inflation', X)
 
 def predict_volatility(X):
-    model = joblib.load('models/volatility_model.pkl')
-    return model.predict(X)
+    return engine.predict('volatility', X)
+
+# --- Modèles RF entraînés par models/train_model.py (rf_model_<nom>.pkl) ---
+
+class RandomForestBundle(SklearnBackend):
+    """Modèle RF avec son scaler et ses métadonnées (features, encoders)"""
+
+    def __init__(self, name):
+        super().__init__(os.path.join(MODELS_DIR, f'rf_model_{name}.pkl'))
+        self.name = name
+        self.scaler = None
+        self.meta = None
+        self.fingerprint = None
+        self.signature = None
+        self.tree_offsets = None
+        self.node_values = None
+        self.node_contributions = None
+        self.bias = None
+
+    def fresh(self):
+        return RandomForestBundle(self.name)
+
+    def load(self):
+        # Version des fichiers du maître chargée (un élève n'est servi qu'avec la version dont il est distillé)
+        self.signature = rf_signature(self.name)
+        super().load()
+        self.scaler = joblib.load(os.path.join(MODELS_DIR, f'scaler_{self.name}.pkl'))
+        self.meta = joblib.load(os.path.join(MODELS_DIR, f'meta_{self.name}.joblib'))
+        # Identifie le schéma d'entrée : deux modèles de même empreinte partagent leur prétraitement
+        self.fingerprint = joblib.hash((self.meta['features'], self.scaler))
+        self._index_trees()
+        return self
+
+    def _index_trees(self):
+        """Valeurs des nœuds de tous les arbres concaténées, avec le décalage de chaque arbre"""
+        self.tree_offsets = None
+        self.node_values = None
+        self.node_contributions = None
+        self.bias = None
+        estimators = getattr(self.model, 'estimators_', None)
+        if not estimators or not hasattr(self.model, 'apply'):
+            return
+        trees = [estimator.tree_ for estimator in estimators]
+        self.tree_offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+        self.node_values = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+        self._index_contributions(trees)
+
+    def _index_contributions(self, trees):
+        """
+        Décomposition par chemin (biais + contributions) précalculée pour chaque nœud :
+        en descendant d'un parent vers un enfant, l'écart de valeur est attribué à la
+        feature du test du parent ; chaque nœud porte la somme de ces écarts depuis la racine.
+        Les nœuds sont traités niveau par niveau, tous arbres confondus.
+        """
+        n_features = self.model.n_features_in_
+        total = len(self.node_values)
+        parent = np.full(total, -1)
+        depth = np.zeros(total, dtype=int)
+        for tree, offset in zip(trees, self.tree_offsets):
+            for children in (tree.children_left, tree.children_right):
+                nodes = np.flatnonzero(children >= 0)
+                parent[offset + children[nodes]] = offset + nodes
+        # Les indices des enfants sont toujours supérieurs à celui du parent
+        for node in np.flatnonzero(parent >= 0):
+            depth[node] = depth[parent[node]] + 1
+        split_feature = np.concatenate([tree.feature for tree in trees])
+        contributions = np.zeros((total, n_features))
+        for level in range(1, depth.max() + 1):
+            nodes = np.flatnonzero(depth == level)
+            parents = parent[nodes]
+            contributions[nodes] = contributions[parents]
+            contributions[nodes, split_feature[parents]] += self.node_values[nodes] - self.node_values[parents]
+        self.node_contributions = contributions
+        self.bias = float(self.node_values[self.tree_offsets].mean())
+
+    def tree_predictions(self, X):
+        """
+        Prédiction de chaque arbre pour chaque ligne (lignes x arbres) : apply() donne la
+        feuille atteinte dans tous les arbres en un appel, puis une seule indexation vectorisée.
+        """
+        if self.node_values is None:
+            raise ValueError(f"Le modèle {self.name} n'expose pas ses arbres (intervalles indisponibles)")
+        return self.node_values[self.tree_offsets + self.model.apply(X)]
+
+    def explain(self, X, chunk_cells=4_000_000):
+        """
+        Contributions de chaque feature (lignes x features) : moyenne sur les arbres des
+        contributions précalculées de la feuille atteinte. biais + somme des contributions
+        = prédiction de la forêt.
+        """
+        if self.node_contributions is None:
+            raise ValueError(f"Le modèle {self.name} n'expose pas ses arbres (explications indisponibles)")
+        leaves = self.tree_offsets + self.model.apply(X)
+        # Par blocs de lignes pour borner le tableau intermédiaire lignes x arbres x features
+        step = max(1, chunk_cells // (leaves.shape[1] * self.node_contributions.shape[1]))
+        return np.concatenate([
+            self.node_contributions[leaves[start:start + step]].mean(axis=1)
+            for start in range(0, len(leaves), step)
+        ]) if len(leaves) else np.empty((0, self.node_contributions.shape[1]))
+
+    def smoke_input(self):
+        """Une ligne valide : première classe de chaque encodeur, 0 pour les features numériques"""
+        encoders = self.meta.get('encoders') or {}
+        return pd.DataFrame([{
+            feature: encoders[feature].classes_[0] if feature in encoders else 0.0
+            for feature in self.meta['features']
+        }])
+
+    def preprocess(self, X):
+        """Valide, encode et met à l'échelle un DataFrame de features brutes"""
+        encoders = self.meta.get('encoders') or {}
+        X = X.copy()
+        # Les colonnes encodées (ex: Année) ont été apprises sous forme de chaînes
+        for col in encoders:
+            if col in X.columns:
+                X[col] = X[col].astype(str)
+        x_valid = validate_and_prepare_features(X, self.meta['features'], encoders)
+        return self.scaler.transform(x_valid)
+
+class StudentBundle(RandomForestBundle):
+    """Élève distillé d'un modèle RF (student_<nom>.pkl) : mêmes scaler et métadonnées que le maître"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.path = os.path.join(MODELS_DIR, f'student_{name}.pkl')
+
+    def fresh(self):
+        return StudentBundle(self.name)
+
+    def load(self):
+        super().load()
+        # {'model': élève, 'teacher': rf_signature du maître distillé} ; ancien format : élève seul
+        saved = self.model
+        self.model, self.teacher = (saved['model'], saved['teacher']) if isinstance(saved, dict) else (saved, None)
+        return self
+
+    def _index_trees(self):
+        # Pas d'intervalles ni d'explications : ces endpoints restent servis par le maître
+        pass
+
+def rf_signature(name):
+    """Taille et date de modification du modèle, du scaler et des métadonnées d'un modèle RF"""
+    paths = [f'rf_model_{name}.pkl', f'scaler_{name}.pkl', f'meta_{name}.joblib']
+    return tuple((stat.st_size, stat.st_mtime_ns) for stat in (os.stat(os.path.join(MODELS_DIR, p)) for p in paths))
+
+def list_rf_models():
+    """Liste les noms des modèles RF disponibles (sans préfixe rf_model_ ni extension)"""
+    return sorted(
+        f[len('rf_model_'):-len('.pkl')] for f in os.listdir(MODELS_DIR)
+        if f.startswith('rf_model_') and f.endswith('.pkl')
+    )
+
+# Serveur préforké : un rechargement demandé à un worker est signalé aux autres en réécrivant
+# results/reloads/<modèle>, vérifié au plus une fois par RELOAD_CHECK_INTERVAL et par modèle
+RELOADS_DIR = os.path.join('results', 'reloads')
+RELOAD_CHECK_INTERVAL = float(os.environ.get('SGAI_RELOAD_CHECK_S', '1'))
+_reloads_seen = {}
+_reloads_checked = {}
+_reloads_lock = threading.Lock()
+
+def _reload_signal(name):
+    """(inode, mtime_ns) du fichier de signal, None si le modèle n'a jamais été rechargé"""
+    try:
+        stat = os.stat(os.path.join(RELOADS_DIR, name))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+def _signal_reload(name):
+    # os.replace : nouvel inode à chaque signal, distinct même avec une horloge de fichiers grossière
+    os.makedirs(RELOADS_DIR, exist_ok=True)
+    path = os.path.join(RELOADS_DIR, name)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(time.time()))
+    os.replace(tmp_path, path)
+    return _reload_signal(name)
+
+def _follow_reload(name):
+    """Applique en arrière-plan un rechargement signalé par un autre worker"""
+    from sgai.ml import prediction_table
+    now = time.monotonic()
+    if now - _reloads_checked.get(name, 0.0) < RELOAD_CHECK_INTERVAL:
+        return
+    _reloads_checked[name] = now
+    signal = _reload_signal(name)
+    with _reloads_lock:
+        if signal == _reloads_seen.get(name):
+            return
+        _reloads_seen[name] = signal
+    engine_name = f'rf/{name}'
+    # Pas encore chargé par ce worker : son premier chargement lira les nouveaux artefacts
+    if engine.status(engine_name)['version'] is None:
+        return
+    if f'rf/{name}/student' in engine.names():
+        engine.swap(f'rf/{name}/student')
+    # La table est recalculée par le worker qui a reçu la demande ; d'ici là, ses lignes sont servies en live
+    signaled_at = signal[1] / 1e9 if signal else None
+    engine.swap(engine_name, on_ready=lambda: prediction_table.table.forget(name, since=signaled_at))
+
+def rf_engine_name(name):
+    """Nom d'enregistrement d'un modèle RF dans le moteur d'inférence"""
+    engine_name = f'rf/{name}'
+    if engine_name not in engine.names():
+        engine.register(engine_name, RandomForestBundle(name))
+        # Enregistré (éventuellement par le maître, avant le fork) avec les artefacts actuels
+        _reloads_seen[name] = _reload_signal(name)
+        _reloads_checked[name] = time.monotonic()
+    else:
+        _follow_reload(name)
+    return engine_name
+
+def register_rf_models():
+    """Enregistre dans le moteur tous les modèles RF présents dans models/"""
+    return [rf_engine_name(name) for name in list_rf_models()]
+
+def load_rf_bundle(name):
+    """Modèle RF, scaler et métadonnées, chargés une seule fois par le moteur"""
+    if not os.path.exists(os.path.join(MODELS_DIR, f'rf_model_{name}.pkl')):
+        raise FileNotFoundError(f"Modèle RF introuvable: {name}")
+    bundle = engine.model(rf_engine_name(name))
+    return {'model': bundle.model, 'scaler': bundle.scaler, 'meta': bundle.meta}
+
+def has_student(name):
+    return os.path.exists(os.path.join(MODELS_DIR, f'student_{name}.pkl'))
+
+def student_engine_name(name):
+    """Nom d'enregistrement de l'élève distillé d'un modèle RF"""
+    engine_name = f'rf/{name}/student'
+    if engine_name not in engine.names():
+        engine.register(engine_name, StudentBundle(name))
+    return engine_name
+
+def student_matches(name):
+    """Vrai si l'élève chargé a été distillé de la version du maître actuellement servie"""
+    teacher = engine.model(rf_engine_name(name)).signature
+    return engine.model(student_engine_name(name)).teacher == teacher
+
+def serving_engine_name(name, endpoint=None):
+    """
+    Modèle servi pour `endpoint` selon SERVING : l'élève s'il est demandé, disponible et
+    distillé du maître servi (sinon, ex : maître réentraîné depuis, le maître lui-même)
+    """
+    if endpoint and SERVING.get(endpoint) == 'student' and has_student(name) and student_matches(name):
+        return student_engine_name(name)
+    return rf_engine_name(name)
+
+def reload_rf(name, wait=False):
+    """
+    Recharge à chaud les artefacts d'un modèle RF et de son élève éventuel (voir InferenceEngine.swap).
+    Les prédictions précalculées du modèle sont recalculées avec la nouvelle version. Les autres
+    workers du serveur préforké rechargent le modèle à leur prochaine requête sur celui-ci.
+    """
+    from sgai.ml import prediction_table
+    if not os.path.exists(os.path.join(MODELS_DIR, f'rf_model_{name}.pkl')):
+        raise FileNotFoundError(f"Modèle RF introuvable: {name}")
+    rf_engine_name(name)
+    with _reloads_lock:
+        _reloads_seen[name] = _signal_reload(name)
+    if has_student(name) and f'rf/{name}/student' in engine.names():
+        engine.swap(student_engine_name(name), wait=wait)
+    return engine.swap(rf_engine_name(name), wait=wait,
+                       on_ready=lambda: prediction_table.table.rematerialize(name))
+
+def predict_rf_intervals(name, X, quantiles=(0.05, 0.95)):
+    """
+    Prédiction moyenne, écart-type et quantiles de la distribution des prédictions des arbres.
+    Retourne (moyenne, écart-type, matrice lignes x quantiles).
+    """
+    load_rf_bundle(name)
+    with engine.use(rf_engine_name(name)) as version:
+        bundle = version.backend
+        with metrics.phase('preprocess'):
+            features = bundle.preprocess(X)
+        with metrics.phase('infer'):
+            per_tree = bundle.tree_predictions(features)
+    return per_tree.mean(axis=1), per_tree.std(axis=1), np.quantile(per_tree, quantiles, axis=1).T
+
+def explain_rf(name, X):
+    """
+    Explication par chemin des prédictions d'un modèle RF.
+    Retourne (features, biais, prédictions, contributions lignes x features).
+    """
+    load_rf_bundle(name)
+    with engine.use(rf_engine_name(name)) as version:
+        bundle = version.backend
+        with metrics.phase('preprocess'):
+            features = bundle.preprocess(X)
+        with metrics.phase('infer'):
+            contributions = bundle.explain(features)
+    return bundle.meta['features'], bundle.bias, bundle.bias + contributions.sum(axis=1), contributions
+
+def prepare_rf_features(name, X):
+    """Valide, encode et met à l'échelle X selon les artefacts du modèle RF"""
+    load_rf_bundle(name)
+    return engine.model(rf_engine_name(name)).preprocess(X)
+
+def predict_rf(name, X, endpoint=None):
+    """Prédiction live d'un modèle RF (ou de son élève, voir SERVING) sur un DataFrame de features brutes"""
+    load_rf_bundle(name)
+    return engine.predict(serving_engine_name(name, endpoint), X)
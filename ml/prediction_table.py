@@ -0,0 +1,188 @@
+"""
+Table de prédictions précalculées pour la grille finie des données de référence.
+
+Les modèles RF de `models/` sont entraînés sur les lignes des CSV de `data/`
+(Groupes × Cultures × Année). Ce module évalue chaque `rf_model_*` sur toute
+sa grille en un seul appel vectorisé, stocke le résultat dans une table
+Parquet indexée et répond ensuite aux requêtes exactes en O(1).
+
+Usage hors-ligne :
+    python -m sgai.ml.prediction_table
+"""
+import os
+import math
+import threading
+import pandas as pd
+from sgai.ml import models, datasets
+from sgai.services import metrics
+
+BASE_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+DATA_DIR = datasets.DATA_DIR
+PROD_CSV, SURF_CSV, PRIX_CSV = datasets.PROD_CSV, datasets.SURF_CSV, datasets.PRIX_CSV
+TABLE_PATH = os.path.join(BASE_DIR, 'models', 'prediction_table.parquet')
+
+
+def _normalize_value(value):
+    """Forme canonique d'une valeur de feature (2016, '2016' et 2016.0 sont équivalents)"""
+    if value is None:
+        return ''
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return str(value).strip()
+    if math.isnan(number):
+        return ''
+    return repr(number)
+
+
+def grid_key(values):
+    """Clé de la table pour un vecteur de features brutes (dans l'ordre meta['features'])"""
+    return '|'.join(_normalize_value(v) for v in values)
+
+
+def training_frame(name, data_dir=DATA_DIR):
+    """Jeu d'entraînement d'un modèle RF avec sa cible : (DataFrame, cible), ou None si inconnu"""
+    engine = datasets.engine if data_dir == datasets.engine.data_dir else datasets.DatasetEngine(data_dir)
+    if '.csv_' in name:
+        csv_file, target = name.rsplit('_', 1)
+        if not os.path.exists(engine.path(csv_file)):
+            return None
+        return engine.raw(csv_file), target
+    if name not in datasets.FUSIONS or not engine.available(name):
+        return None
+    return engine.fusion(name)
+
+
+def source_frame(name, data_dir=DATA_DIR):
+    """Reconstruit le jeu d'entraînement d'un modèle RF, sans la cible (None si inconnu)"""
+    frame = training_frame(name, data_dir)
+    if frame is None:
+        return None
+    df, target = frame
+    return df.drop(columns=[target])
+
+
+def model_rows(name, data_dir=DATA_DIR):
+    """Prédictions du modèle RF servi sur toute sa grille : DataFrame (model, key, prediction), ou None"""
+    grid = source_frame(name, data_dir)
+    if grid is None:
+        return None
+    features = models.load_rf_bundle(name)['meta']['features']
+    grid = grid[features].drop_duplicates()
+    return pd.DataFrame({
+        'model': name,
+        'key': [grid_key(row) for row in grid.itertuples(index=False)],
+        'prediction': models.predict_rf(name, grid),
+    })
+
+
+def _write(tables, path):
+    table = pd.concat(tables, ignore_index=True).drop_duplicates(['model', 'key'])
+    table['model'] = table['model'].astype('category')
+    table = table.set_index(['model', 'key']).sort_index()
+    tmp_path = f'{path}.tmp'
+    table.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+    return table
+
+
+def materialize(data_dir=DATA_DIR, path=TABLE_PATH):
+    """Évalue chaque modèle RF sur sa grille complète et écrit la table Parquet"""
+    tables = []
+    for name in models.list_rf_models():
+        rows = model_rows(name, data_dir)
+        if rows is None:
+            print(f"[INFO] Pas de grille connue pour {name}, ignoré.")
+            continue
+        tables.append(rows)
+        print(f"[INFO] {name}: {len(rows)} points de grille matérialisés.")
+    table = _write(tables, path)
+    print(f"Table de prédictions sauvegardée : {path} ({len(table)} lignes)")
+    return table
+
+
+class PredictionTable:
+    """Index mémoire (modèle, clé) -> prédiction chargé depuis la table Parquet"""
+
+    def __init__(self, path=TABLE_PATH):
+        self.path = path
+        self.index = {}
+        self.mtime = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Recharge la table si le fichier a changé depuis le dernier chargement"""
+        if not os.path.exists(self.path):
+            self.index, self.mtime = {}, None
+            return
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return
+        table = pd.read_parquet(self.path).reset_index()
+        self.index = dict(zip(
+            zip(table['model'].astype(str), table['key']), table['prediction'].astype(float)
+        ))
+        self.mtime = mtime
+
+    def lookup(self, name, X, features):
+        """Retourne la liste des prédictions précalculées (None pour les points hors grille)"""
+        self.refresh()
+        index = self.index
+        return [
+            index.get((name, grid_key(row)))
+            for row in X.reindex(columns=features).itertuples(index=False)
+        ]
+
+    def forget(self, name, since=None):
+        """
+        Retire les lignes d'un modèle de l'index (servies en live jusqu'à la prochaine réécriture
+        de la table), sauf si la table a déjà été réécrite après `since` (timestamp)
+        """
+        with self._lock:
+            self.refresh()
+            if since is not None and self.mtime is not None and self.mtime > since:
+                return
+            self.index = {key: value for key, value in self.index.items() if key[0] != name}
+
+    def rematerialize(self, name, data_dir=DATA_DIR):
+        """
+        Après le rechargement d'un modèle : ses lignes sont retirées de l'index (servies en live),
+        puis recalculées avec la version servie et réécrites dans la table Parquet.
+        """
+        with self._lock:
+            self.refresh()
+            if not os.path.exists(self.path):
+                return 0
+            self.index = {key: value for key, value in self.index.items() if key[0] != name}
+            rows = model_rows(name, data_dir)
+            if rows is None:
+                rows = pd.DataFrame(columns=['model', 'key', 'prediction'])
+            others = pd.read_parquet(self.path).reset_index()
+            others = others[others['model'].astype(str) != name]
+            others['model'] = others['model'].astype(str)
+            _write([others, rows], self.path)
+            index = dict(self.index)
+            index.update(zip(zip(rows['model'].astype(str), rows['key']), rows['prediction'].astype(float)))
+            self.index, self.mtime = index, os.path.getmtime(self.path)
+            return len(rows)
+
+
+table = PredictionTable()
+
+
+def predict_with_table(name, X, endpoint='predict_rf'):
+    """Prédictions depuis la table, avec inférence live uniquement pour les points hors grille"""
+    features = models.load_rf_bundle(name)['meta']['features']
+    predictions = table.lookup(name, X, features)
+    missing = [i for i, p in enumerate(predictions) if p is None]
+    metrics.record_cache('prediction_table', True, len(predictions) - len(missing))
+    metrics.record_cache('prediction_table', False, len(missing))
+    if missing:
+        live = models.predict_rf(name, X.iloc[missing], endpoint)
+        for i, value in zip(missing, live):
+            predictions[i] = float(value)
+    return predictions, len(predictions) - len(missing)
+
+
+if __name__ == '__main__':
+    materialize()
@@ -0,0 +1,122 @@
+"""
+Modèle Keras de prédiction de la production (train_model.py::save_full_model),
+servi par le moteur d'inférence partagé.
+"""
+import os
+import json
+import logging
+import joblib
+import numpy as np
+import pandas as pd
+from sgai.ml.engine import engine, KerasBackend
+
+logger = logging.getLogger(__name__)
+
+ENGINE_NAME = 'keras/production'
+
+
+class ProductionPredictor(KerasBackend):
+    """Modèle TensorFlow de production avec son scaler, ses encodeurs et ses métadonnées"""
+
+    def __init__(self, model_path='models/production_model_final.h5'):
+        super().__init__(model_path)
+        self.scaler = None
+        self.label_encoders = {}
+        self.feature_names = []
+        self.metadata = {}
+        self.is_loaded = False
+
+    def load(self):
+        """Charge le modèle et tous ses artefacts (lève une exception en cas d'échec)"""
+        super().load()
+        logger.info("Modèle TensorFlow chargé avec succès")
+
+        scaler_path = 'models/scaler.pkl'
+        if not os.path.exists(scaler_path):
+            raise FileNotFoundError(f"Scaler non trouvé: {scaler_path}")
+        self.scaler = joblib.load(scaler_path)
+        logger.info("Scaler chargé avec succès")
+
+        metadata_path = 'models/model_metadata.json'
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r') as f:
+                self.metadata = json.load(f)
+            self.feature_names = self.metadata.get('feature_names', [])
+            logger.info("Métadonnées chargées avec succès")
+
+        for feature in self.feature_names:
+            encoder_path = f'models/{feature}_encoder.pkl'
+            if os.path.exists(encoder_path):
+                self.label_encoders[feature] = joblib.load(encoder_path)
+
+        self.is_loaded = True
+        logger.info("Tous les artefacts du modèle sont chargés")
+        return self
+
+    def load_model(self):
+        """Compatibilité avec l'ancienne API : retourne True/False"""
+        try:
+            self.load()
+            return True
+        except Exception as e:
+            logger.error(f"Erreur lors du chargement du modèle: {str(e)}")
+            return False
+
+    def preprocess(self, rows):
+        """Prétraite une liste d'enregistrements (dict) ou un DataFrame en une seule matrice"""
+        if isinstance(rows, pd.DataFrame):
+            df = rows.copy(deep=False)
+        else:
+            df = pd.DataFrame(list(rows))
+
+        # S'assurer que toutes les colonnes nécessaires sont présentes
+        for feature in self.feature_names:
+            if feature not in df.columns:
+                df[feature] = 0  # Valeur par défaut
+
+        # Réorganiser les colonnes selon l'ordre d'entraînement
+        df = df[self.feature_names]
+
+        # Appliquer les encodeurs de labels ; valeur inconnue -> première classe
+        for feature, encoder in self.label_encoders.items():
+            if feature in df.columns:
+                values = df[feature].astype(str)
+                known = values.isin(encoder.classes_)
+                encoded = np.zeros(len(df), dtype=int)
+                if known.any():
+                    encoded[known.to_numpy()] = encoder.transform(values[known])
+                df[feature] = encoded
+
+        # Appliquer le scaling
+        if self.scaler:
+            numeric_cols = df.select_dtypes(include=np.number).columns
+            if len(numeric_cols) > 0:
+                df[numeric_cols] = self.scaler.transform(df[numeric_cols])
+
+        return df.values
+
+    def smoke_input(self):
+        """Enregistrement neutre pour la prédiction de contrôle d'un remplacement à chaud"""
+        return [{feature: 0 for feature in self.feature_names}]
+
+    def preprocess_input(self, input_data):
+        """Prétraite un enregistrement unique"""
+        return self.preprocess([input_data])
+
+
+engine.register(ENGINE_NAME, ProductionPredictor())
+
+
+def get_predictor():
+    """Prédicteur chargé (chargement unique partagé par toutes les routes)"""
+    return engine.model(ENGINE_NAME)
+
+
+def predict_many(rows):
+    """Prédictions vectorisées pour une liste d'enregistrements"""
+    return engine.predict(ENGINE_NAME, rows)
+
+
+def reload(wait=False):
+    """Recharge à chaud le modèle et ses artefacts (voir InferenceEngine.swap)"""
+    return engine.swap(ENGINE_NAME, wait=wait)
@@ -0,0 +1,117 @@
+"""
+Balayages « what-if » et dépendance partielle des modèles RF.
+
+Au lieu d'une requête par point, le plan d'expérience complet est construit
+côté serveur et évalué en un seul appel vectorisé au modèle :
+- courbe / surface : un vecteur de base dont une ou deux features varient
+  sur une grille ;
+- dépendance partielle : pour chaque point de la grille, moyenne des
+  prédictions sur un échantillon de fond (lignes fournies ou échantillon des
+  données d'entraînement), calculée en une passe sur le produit fond x grille.
+"""
+import numpy as np
+import pandas as pd
+from sgai.ml import models, prediction_table
+
+# Taille maximale du plan d'expérience évalué en une requête
+MAX_DESIGN_ROWS = 200_000
+MAX_GRID_POINTS = 1_000
+DEFAULT_BACKGROUND_SIZE = 200
+
+
+def grid_values(spec):
+    """Valeurs d'une grille : liste explicite ou {'start', 'stop', 'num', 'log'}"""
+    if isinstance(spec, dict):
+        try:
+            num = int(spec.get('num', 50))
+            start, stop = float(spec['start']), float(spec['stop'])
+        except TypeError:
+            raise ValueError(f"Grille invalide: {spec} (start, stop et num numériques)")
+        if not 1 <= num <= MAX_GRID_POINTS:
+            raise ValueError(f"num doit être compris entre 1 et {MAX_GRID_POINTS}")
+        space = np.geomspace if spec.get('log') else np.linspace
+        return space(start, stop, num)
+    values = np.asarray(spec) if isinstance(spec, (list, tuple)) else np.asarray([])
+    if values.ndim != 1 or not 1 <= len(values) <= MAX_GRID_POINTS:
+        raise ValueError(f"Une grille est une liste de 1 à {MAX_GRID_POINTS} valeurs")
+    return values
+
+
+def _grids(name, grids):
+    features = models.load_rf_bundle(name)['meta']['features']
+    if not isinstance(grids, dict):
+        raise ValueError('grid doit être un objet {feature: grille}, ex : {"Superficie": {"start": 0, "stop": 1e5}}')
+    if not 1 <= len(grids) <= 2:
+        raise ValueError("Une ou deux features à faire varier")
+    unknown = [f for f in grids if f not in features]
+    if unknown:
+        raise ValueError(f"Features inconnues: {unknown}. Features du modèle: {features}")
+    return features, {feature: grid_values(spec) for feature, spec in grids.items()}
+
+
+def _grid_frame(grids):
+    """Produit cartésien des grilles, dans l'ordre C (la dernière feature varie le plus vite)"""
+    mesh = np.meshgrid(*grids.values(), indexing='ij')
+    return pd.DataFrame({feature: axis.ravel() for feature, axis in zip(grids, mesh)})
+
+
+def _check_size(rows):
+    if rows > MAX_DESIGN_ROWS:
+        raise ValueError(f"Plan d'expérience de {rows} lignes, maximum {MAX_DESIGN_ROWS}")
+
+
+def sweep(name, base, grids):
+    """Courbe (1 feature) ou surface (2 features) autour du vecteur `base`"""
+    features, grids = _grids(name, grids)
+    if not isinstance(base, dict):
+        raise ValueError("base doit être un objet {feature: valeur}")
+    missing = [f for f in features if f not in base and f not in grids]
+    if missing:
+        raise ValueError(f"Features manquantes dans base: {missing}")
+    design = _grid_frame(grids)
+    _check_size(len(design))
+    for feature in features:
+        if feature not in grids:
+            design[feature] = base[feature]
+    y = np.asarray(models.predict_rf(name, design[features], 'sweep_rf'), dtype=float)
+    return grids, y.reshape([len(values) for values in grids.values()])
+
+
+def background_sample(name, size=DEFAULT_BACKGROUND_SIZE, seed=0):
+    """Échantillon de fond tiré des données d'entraînement du modèle"""
+    source = prediction_table.source_frame(name)
+    if source is None:
+        raise ValueError(f"Pas de données de référence pour {name} : fournissez un fond")
+    source = source.dropna()
+    if len(source) > size:
+        source = source.sample(n=size, random_state=seed)
+    return source.reset_index(drop=True)
+
+
+def partial_dependence(name, grids, background=None, size=DEFAULT_BACKGROUND_SIZE, ice=False):
+    """
+    Dépendance partielle : moyenne sur le fond des prédictions à chaque point de grille.
+    Avec ice=True, retourne aussi les courbes individuelles (fond x grille).
+    """
+    features, grids = _grids(name, grids)
+    if background is None:
+        if size < 1:
+            raise ValueError(f"sample doit être un entier strictement positif (reçu : {size})")
+        background = background_sample(name, size)
+    if len(background) == 0:
+        raise ValueError("Fond vide : la dépendance partielle est une moyenne sur au moins une ligne")
+    missing = [f for f in features if f not in background.columns and f not in grids]
+    if missing:
+        raise ValueError(f"Features manquantes dans le fond: {missing}")
+    points = _grid_frame(grids)
+    _check_size(len(background) * len(points))
+    # Fond répété pour chaque point de grille (bloc par ligne de fond), features balayées remplacées
+    design = background.loc[np.repeat(np.arange(len(background)), len(points)), [
+        f for f in features if f not in grids
+    ]].reset_index(drop=True)
+    for feature in grids:
+        design[feature] = np.tile(points[feature].to_numpy(), len(background))
+    y = np.asarray(models.predict_rf(name, design[features], 'sweep_rf'), dtype=float)
+    shape = [len(values) for values in grids.values()]
+    curves = y.reshape([len(background)] + shape)
+    return grids, curves.mean(axis=0), (curves if ice else None), len(background)
@@ -1,15 +1,17 @@
-def merge_and_train(csv_paths, target_col, merge_on, model_name=None):
-    # Fusionne plusieurs CSV sur une ou plusieurs colonnes, puis entraîne un modèle
-    dfs = [pd.read_csv(p) for p in csv_paths]
-    df_merged = dfs[0]
-    for df in dfs[1:]:
-        df_merged = pd.merge(df_merged, df, on=merge_on, how='inner')
-    print(f"\n[INFO] Fusion de {len(csv_paths)} fichiers sur {merge_on} pour la cible '{target_col}'")
+def merge_and_train(csv_paths, target_col, merge_on, model_name=None, how='inner'):
+    # Fusionne plusieurs CSV sur une ou plusieurs colonnes (lus une fois, jointure indexée), puis entraîne un modèle ;
+    # merge_on=None : clés de jointure choisies par le catalogue de data/
+    df_merged = datasets.engine.merge_files(csv_paths, merge_on, how=how)
+    print(f"\n[INFO] Fusion de {len(csv_paths)} fichiers sur {merge_on or 'les clés du catalogue'} pour la cible '{target_col}'")
     return train_rf_model(None, target_col, model_name=model_name, df=df_merged)
 
 import os
 import sys
 import argparse
+import copy
+import json
+import time
+import numpy as np
 import joblib
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
@@ -17,10 +19,16 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import PowerTransformer, LabelEncoder
 from sklearn.metrics import mean_squared_error, r2_score
 
+# Rendre le package sgai importable quand ce fichier est lancé directement (python models/train_model.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sgai.ml import datasets, catalog
+
 
 def train_rf_model(abs_csv_path, target_col, model_name=None, df=None):
-    if df is None:
-        df = pd.read_csv(abs_csv_path)
+    if abs_csv_path:
+        # CSV lu une seule fois pour toutes ses colonnes cibles
+        df = datasets.raw(abs_csv_path) if df is None else df
         name_hint = os.path.basename(abs_csv_path)
     else:
         name_hint = model_name or 'merged_dataset'
@@ -86,11 +94,217 @@ def train_rf_model(abs_csv_path, target_col, model_name=None, df=None):
     return True
 
 
+YEAR_COL = 'Année'
+INCREMENTAL_REPORT = os.path.join('results', 'rf_incremental.json')
+
+
+def _fill_missing(df, target_col):
+    # Mêmes imputations que train_rf_model (moyenne de la cible et des features)
+    df = df.copy()
+    df[target_col] = df[target_col].fillna(df[target_col].mean())
+    for col in df.columns:
+        if col != target_col and df[col].isnull().any() and pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].fillna(df[col].mean())
+    return df
+
+
+def extend_encoders(encoders, X):
+    """
+    Encoders étendus aux catégories jamais vues (ex : une nouvelle année) : les nouvelles
+    classes sont ajoutées après les anciennes, les codes déjà appris par les arbres ne changent pas.
+    """
+    extended, added = {}, {}
+    for col, le in encoders.items():
+        values = pd.unique(X[col].astype(str)) if col in X.columns else []
+        unseen = sorted(set(values) - set(le.classes_))
+        if unseen:
+            le = LabelEncoder()
+            le.classes_ = np.array(list(encoders[col].classes_) + unseen, dtype=object)
+            added[col] = unseen
+        extended[col] = le
+    return extended, added
+
+
+def encode_features(X, encoders):
+    X = X.copy()
+    for col, le in encoders.items():
+        if col in X.columns:
+            X[col] = le.transform(X[col].astype(str))
+    return X
+
+
+def grow_forest(model, X, y, add_trees, retire_trees, seed):
+    """
+    Ajoute `add_trees` arbres entraînés sur (X, y) (warm_start) puis retire les `retire_trees`
+    plus anciens ; retourne le nombre d'arbres retirés.
+    """
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + add_trees, random_state=seed)
+    model.fit(X, y)
+    retired = max(min(retire_trees, len(model.estimators_) - add_trees), 0)
+    if retired:
+        # Les plus anciens arbres sont en tête de estimators_
+        model.estimators_ = model.estimators_[retired:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+    return retired
+
+
+def update_rf_model(target_col, model_name, df, add_trees=50, retire_trees=0, recent_years=1, compare=False):
+    """
+    Mise à jour incrémentale d'un modèle RF existant quand de nouvelles années arrivent :
+    `add_trees` arbres sont ajoutés (warm_start), entraînés sur les années nouvelles et les
+    `recent_years` dernières années déjà connues ; les `retire_trees` plus anciens sont retirés.
+    Le scaler est conservé, les encoders sont étendus aux catégories nouvelles. Avec `compare`,
+    le modèle incrémental (sur une copie) et un réentraînement complet sont évalués sur les
+    mêmes lignes nouvelles mises de côté (précision et temps dans results/rf_incremental.json) ;
+    le modèle enregistré est ensuite entraîné sur toutes les lignes nouvelles.
+    Retourne le rapport, ou None si un réentraînement complet est nécessaire.
+    """
+    model_path = os.path.join('models', model_name)
+    scaler_path = os.path.join('models', model_name.replace('rf_model_', 'scaler_'))
+    meta_path = os.path.join('models', model_name.replace('rf_model_', 'meta_').replace('.pkl', '.joblib'))
+    if not os.path.exists(model_path):
+        print(f"[INFO] {model_name} absent : entraînement complet.")
+        return None
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
+    meta = joblib.load(meta_path)
+    features = meta['features']
+    if target_col not in df.columns or set(df.columns) - {target_col} != set(features):
+        # Nouvelle colonne (ex : une année en colonne dans un CSV large) : les arbres existants ne l'utilisent pas
+        print(f"[INFO] Colonnes modifiées pour {model_name} : entraînement complet.")
+        return None
+    encoders = meta.get('encoders') or {}
+    if YEAR_COL not in encoders:
+        print(f"[INFO] {model_name} n'a pas de colonne '{YEAR_COL}' : entraînement complet.")
+        return None
+
+    df = _fill_missing(df, target_col)
+    years = df[YEAR_COL].astype(str)
+    known = sorted(encoders[YEAR_COL].classes_)
+    new_years = sorted(set(years) - set(known))
+    if not new_years:
+        print(f"[INFO] Aucune année nouvelle pour {model_name}.")
+        return {'model': model_name, 'new_years': [], 'added_trees': 0, 'retired_trees': 0}
+    window = set(new_years) | set(known[-recent_years:] if recent_years else [])
+
+    recent_df = df[years.isin(window)]
+    encoders, added = extend_encoders(encoders, df[features])
+    generation = meta.get('generation', 0) + 1
+    seed = 42 + generation
+
+    # Lignes nouvelles mises de côté pour la comparaison (jamais vues par aucun des deux modèles
+    # comparés) ; la comparaison porte sur une copie, le modèle enregistré les utilise toutes
+    new_index = df.index[years.isin(new_years)]
+    holdout = pd.Index([])
+    if compare and len(new_index) >= 5:
+        _, holdout = train_test_split(new_index, test_size=0.2, random_state=42)
+    comparison = {}
+    if len(holdout):
+        train_df = df.drop(index=holdout)
+        fit_df = recent_df.drop(index=holdout)
+        X_holdout = df.loc[holdout, features]
+        y_holdout = df.loc[holdout, target_col]
+        started = time.perf_counter()
+        evaluated = copy.deepcopy(model)
+        grow_forest(evaluated, scaler.transform(encode_features(fit_df[features], encoders)), fit_df[target_col],
+                    add_trees, retire_trees, seed)
+        compared_seconds = time.perf_counter() - started
+        y_incremental = evaluated.predict(scaler.transform(encode_features(X_holdout, encoders)))
+        started = time.perf_counter()
+        full_encoders = {}
+        X_full = train_df[features].copy()
+        for col in encoders:
+            full_encoders[col] = LabelEncoder().fit(X_full[col].astype(str))
+            X_full[col] = full_encoders[col].transform(X_full[col].astype(str))
+        full_scaler = PowerTransformer().fit(X_full)
+        full_model = RandomForestRegressor(n_estimators=200, random_state=42).fit(
+            full_scaler.transform(X_full), train_df[target_col])
+        full_seconds = time.perf_counter() - started
+        y_full = full_model.predict(full_scaler.transform(encode_features(X_holdout, full_encoders)))
+        comparison = {
+            'holdout_rows': len(holdout),
+            'full_seconds': round(full_seconds, 3),
+            'time_saved_ratio': round(1 - compared_seconds / full_seconds, 3) if full_seconds else None,
+            'incremental_mse': float(mean_squared_error(y_holdout, y_incremental)),
+            'full_mse': float(mean_squared_error(y_holdout, y_full)),
+            'incremental_r2': float(r2_score(y_holdout, y_incremental)),
+            'full_r2': float(r2_score(y_holdout, y_full)),
+        }
+
+    started = time.perf_counter()
+    X_recent = scaler.transform(encode_features(recent_df[features], encoders))
+    retired = grow_forest(model, X_recent, recent_df[target_col], add_trees, retire_trees, seed)
+    incremental_seconds = time.perf_counter() - started
+
+    report = {
+        'model': model_name,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'new_years': new_years,
+        'window_years': sorted(window),
+        'new_categories': added,
+        'rows_used': len(recent_df),
+        'rows_total': len(df),
+        'added_trees': add_trees,
+        'retired_trees': retired,
+        'n_trees': len(model.estimators_),
+        'incremental_seconds': round(incremental_seconds, 3),
+        **comparison,
+    }
+
+    meta = dict(meta, encoders=encoders, generation=generation)
+    meta.setdefault('history', []).append({k: report[k] for k in ('timestamp', 'new_years', 'added_trees', 'retired_trees')})
+    joblib.dump(model, model_path)
+    joblib.dump(meta, meta_path)
+    print(f"\nMise à jour incrémentale de {model_name} (années {', '.join(new_years)}) : "
+          f"+{add_trees} arbres, -{report['retired_trees']}, {report['n_trees']} au total, "
+          f"{report['rows_used']}/{report['rows_total']} lignes, {incremental_seconds:.2f} s")
+    if 'full_seconds' in report:
+        print(f"  Réentraînement complet : {report['full_seconds']:.2f} s "
+              f"(temps gagné : {report['time_saved_ratio']:.0%})")
+        print(f"  MSE incrémental {report['incremental_mse']:.4g} / complet {report['full_mse']:.4g}, "
+              f"R2 {report['incremental_r2']:.3f} / {report['full_r2']:.3f}")
+    _write_incremental_report(report)
+    return report
+
+
+def _write_incremental_report(report):
+    reports = {}
+    if os.path.exists(INCREMENTAL_REPORT):
+        with open(INCREMENTAL_REPORT) as f:
+            reports = json.load(f)
+    reports[report['model']] = report
+    os.makedirs(os.path.dirname(INCREMENTAL_REPORT), exist_ok=True)
+    with open(INCREMENTAL_REPORT, 'w') as f:
+        json.dump(reports, f, indent=2, ensure_ascii=False)
+
+
 def list_csv_files(data_dir):
-    return [f for f in os.listdir(data_dir) if f.endswith('.csv')]
+    # Fichiers connus du catalogue de schémas (mis à jour sans rouvrir les fichiers inchangés)
+    return catalog.for_dir(data_dir).names()
+
+
+def train_or_update(args, target_col, model_name, df, abs_csv_path=None):
+    """Mise à jour incrémentale si demandée et possible, sinon entraînement complet"""
+    if args.incremental:
+        report = update_rf_model(target_col, model_name, df, add_trees=args.add_trees,
+                                 retire_trees=args.retire_trees, recent_years=args.recent_years,
+                                 compare=args.compare)
+        if report is not None:
+            return True
+    return train_rf_model(abs_csv_path, target_col, model_name=model_name, df=df)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Entraînement des modèles RF sur les CSV de data/')
+    parser.add_argument('--incremental', action='store_true',
+                        help="ajoute des arbres aux modèles existants pour les années nouvelles au lieu de tout réentraîner")
+    parser.add_argument('--add-trees', type=int, default=50, help="arbres ajoutés par mise à jour incrémentale")
+    parser.add_argument('--retire-trees', type=int, default=0, help="plus anciens arbres retirés par mise à jour")
+    parser.add_argument('--recent-years', type=int, default=1,
+                        help="années déjà connues reprises avec les nouvelles pour entraîner les arbres ajoutés")
+    parser.add_argument('--compare', action='store_true',
+                        help="compare précision et temps avec un réentraînement complet (results/rf_incremental.json)")
+    args = parser.parse_args()
     base_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.normpath(os.path.join(base_dir, '..', 'data'))
     csv_files = list_csv_files(data_dir)
@@ -114,58 +328,22 @@ if __name__ == '__main__':
         if not targets:
             print(f"[INFO] Fichier ignoré (pas de mapping automatique de colonne cible) : {csv_file}")
             continue
+        absent = catalog.for_dir(data_dir).missing_columns([csv_file], targets).get(csv_file, [])
+        if absent:
+            print(f"[INFO] Colonnes cibles absentes du catalogue pour {csv_file} : {absent}")
+            targets = [t for t in targets if t not in absent]
         for target_col in targets:
             print(f"\n--- Entraînement modèle pour {csv_file} (cible: {target_col}) ---")
-            train_rf_model(abs_csv_path, target_col)
+            train_or_update(args, target_col, f"rf_model_{csv_file}_{target_col}.pkl",
+                            datasets.raw(abs_csv_path), abs_csv_path)
 
     # --- FUSIONS INNOVANTES ---
-    prod_path = os.path.join(data_dir, 'Production des principales cultures (2015-2018).csv')
-    surf_path = os.path.join(data_dir, 'Superficie des cultures (2014-2018).csv')
-    prix_path = os.path.join(data_dir, 'Prix moyens (2014-2016).csv')
-
-    # 1. Superficie + Production (déjà présent)
-    if os.path.exists(prod_path) and os.path.exists(surf_path):
-        prod = pd.read_csv(prod_path)
-        surf = pd.read_csv(surf_path)
-        prod_melt = prod.melt(id_vars=['Groupes','Cultures'], var_name='Année', value_name='Production')
-        surf_melt = surf.melt(id_vars=['Groupes','Cultures'], var_name='Année', value_name='Superficie')
-        merged = pd.merge(prod_melt, surf_melt, on=['Groupes','Cultures','Année'])
-        print("\n--- Entraînement modèle fusionné (Superficie -> Production) ---")
-        train_rf_model(None, 'Production', model_name='rf_model_superficie_production.pkl', df=merged)
-
-    # 2. Production + Prix moyens (prédire la production en fonction du prix)
-    if os.path.exists(prod_path) and os.path.exists(prix_path):
-        prod = pd.read_csv(prod_path)
-        prix = pd.read_csv(prix_path)
-        prod_melt = prod.melt(id_vars=['Groupes','Cultures'], var_name='Année', value_name='Production')
-        prix_melt = prix.melt(id_vars=['Groupes de produits','Cultures'], var_name='Année', value_name='Prix')
-        # Harmoniser les noms de colonnes pour la fusion
-        prix_melt = prix_melt.rename(columns={'Groupes de produits':'Groupes'})
-        merged = pd.merge(prod_melt, prix_melt, on=['Groupes','Cultures','Année'])
-        print("\n--- Entraînement modèle fusionné (Prix -> Production) ---")
-        train_rf_model(None, 'Production', model_name='rf_model_prix_production.pkl', df=merged)
-
-    # 3. Superficie + Prix moyens (prédire la superficie en fonction du prix)
-    if os.path.exists(surf_path) and os.path.exists(prix_path):
-        surf = pd.read_csv(surf_path)
-        prix = pd.read_csv(prix_path)
-        surf_melt = surf.melt(id_vars=['Groupes','Cultures'], var_name='Année', value_name='Superficie')
-        prix_melt = prix.melt(id_vars=['Groupes de produits','Cultures'], var_name='Année', value_name='Prix')
-        prix_melt = prix_melt.rename(columns={'Groupes de produits':'Groupes'})
-        merged = pd.merge(surf_melt, prix_melt, on=['Groupes','Cultures','Année'])
-        print("\n--- Entraînement modèle fusionné (Prix -> Superficie) ---")
-        train_rf_model(None, 'Superficie', model_name='rf_model_prix_superficie.pkl', df=merged)
-
-    # 4. Superficie + Production + Prix moyens (prédire la production à partir de la superficie et du prix)
-    if os.path.exists(prod_path) and os.path.exists(surf_path) and os.path.exists(prix_path):
-        prod = pd.read_csv(prod_path)
-        surf = pd.read_csv(surf_path)
-        prix = pd.read_csv(prix_path)
-        prod_melt = prod.melt(id_vars=['Groupes','Cultures'], var_name='Année', value_name='Production')
-        surf_melt = surf.melt(id_vars=['Groupes','Cultures'], var_name='Année', value_name='Superficie')
-        prix_melt = prix.melt(id_vars=['Groupes de produits','Cultures'], var_name='Année', value_name='Prix')
-        prix_melt = prix_melt.rename(columns={'Groupes de produits':'Groupes'})
-        merged = prod_melt.merge(surf_melt, on=['Groupes','Cultures','Année'])
-        merged = merged.merge(prix_melt, on=['Groupes','Cultures','Année'])
-        print("\n--- Entraînement modèle fusionné (Superficie + Prix -> Production) ---")
-        train_rf_model(None, 'Production', model_name='rf_model_superficie_prix_production.pkl', df=merged)
+    # Déclarées dans ml/datasets.py (FUSIONS) : chaque source est dépivotée une seule fois
+    for name, spec in datasets.FUSIONS.items():
+        if not datasets.engine.available(name):
+            print(f"[INFO] Fusion ignorée (fichiers sources absents) : {name}")
+            continue
+        merged, target = datasets.engine.fusion(name)
+        predictors = ' + '.join(source for source in spec.sources if source != target)
+        print(f"\n--- Entraînement modèle fusionné ({predictors} -> {target}) ---")
+        train_or_update(args, target, f'rf_model_{name}.pkl', merged)
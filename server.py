@@ -0,0 +1,211 @@
+"""
+Serveur de production préforké (gunicorn) avec partage copy-on-write des modèles.
+
+Le processus maître charge les artefacts sklearn/XGBoost (modèles RF et leurs
+scalers, table de prédictions), puis appelle gc.freeze() avant de forker : les
+pages mémoire de ces modèles, en lecture seule, restent partagées avec les
+workers au lieu d'être dupliquées ; gc.freeze() évite que le ramasse-miettes
+ne les réécrive (et ne les copie) en parcourant les objets hérités du maître.
+
+TensorFlow n'est pas fork-safe : le maître n'importe ni l'application
+(main.py construit MobileNetV2 à l'import) ni TensorFlow. Chaque worker
+importe l'application et charge les modèles Keras après le fork.
+
+L'état partagé entre workers passe par le disque, et une requête peut être
+servie par n'importe quel worker :
+- suivi et téléchargement des rapports en tâche de fond (results/report_jobs/,
+  services/report_jobs.py) ;
+- rendu unique des rapports identiques (verrou par empreinte,
+  services/report_cache.py) ;
+- /metrics, qui agrège les instantanés de tous les workers (METRICS_DIR,
+  services/metrics.py) ;
+- rechargements à chaud, signalés aux autres workers (results/reloads/,
+  ml/models.py).
+Restent propres à chaque worker, sans besoin de routage persistant : les
+limites d'admission (à multiplier par le nombre de workers), le cache des
+images, et l'état de /api/predict/rf/<modèle>/status (champ pid).
+
+Configuration (arguments ou variables d'environnement) :
+    --workers / SGAI_WORKERS   nombre de workers (défaut : nombre de cœurs)
+    --threads / SGAI_THREADS   threads par worker (défaut : 4)
+    --bind    / SGAI_BIND      adresse d'écoute (défaut : 0.0.0.0:5000)
+    --timeout / SGAI_TIMEOUT   délai maximal d'une requête en secondes (défaut : 120)
+    SGAI_MEMORY_REPORT_DELAY   délai avant le rapport mémoire (défaut : 30 s, 0 = désactivé)
+
+Le rapport mémoire (RSS, PSS et pages partagées par worker) est journalisé et
+écrit dans results/worker_memory.json ; il peut aussi être produit à la
+demande pour des processus en cours :
+    python -m sgai.server --report PID_MAITRE
+
+Usage :
+    python -m sgai.server [--workers 4] [--threads 4] [--bind 0.0.0.0:5000]
+"""
+import os
+import gc
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+
+from sgai.services import metrics, threads
+
+logger = logging.getLogger(__name__)
+
+REPORT_PATH = os.path.join('results', 'worker_memory.json')
+MEMORY_REPORT_DELAY = float(os.environ.get('SGAI_MEMORY_REPORT_DELAY', '30'))
+# Instantanés des métriques des workers, agrégés par /metrics
+METRICS_DIR = os.path.join('results', 'metrics')
+# Familles chargées par le maître avant le fork ; les modèles Keras le sont dans chaque worker
+FORK_SAFE_FAMILIES = ('sklearn',)
+
+
+def preload_models(families=None):
+    """
+    Charge les artefacts des familles données (toutes par défaut) dans le processus courant ;
+    retourne {modèle: erreur} pour les échecs
+    """
+    from sgai.ml import models, production, prediction_table
+    from sgai.ml.engine import engine
+    models.register_rf_models()
+    errors = engine.preload(families=families)
+    if families is None or 'sklearn' in families:
+        prediction_table.table.refresh()
+    for name in engine.names():
+        if families is not None and engine.family(name) not in families:
+            continue
+        status = f'ÉCHEC ({errors[name]})' if name in errors else 'chargé'
+        logger.info(f"[PRELOAD] {name} : {status}")
+    return errors
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def memory_report(master_pid, worker_pids=None):
+    """RSS/PSS du maître et de chaque worker, et mémoire économisée par le partage"""
+    worker_pids = worker_pids if worker_pids is not None else _children(master_pid)
+    processes = {'master': metrics.memory_rollup(master_pid)}
+    processes.update({f'worker-{pid}': metrics.memory_rollup(pid) for pid in worker_pids})
+    workers = [processes[f'worker-{pid}'] for pid in worker_pids if processes[f'worker-{pid}']]
+    rss = sum(p.get('Rss', 0) for p in processes.values())
+    pss = sum(p.get('Pss', 0) for p in processes.values())
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'workers': len(workers),
+        'processes': processes,
+        # Somme des RSS : ce que coûteraient des processus indépendants chargeant chacun les modèles
+        'total_rss_bytes': rss,
+        # Somme des PSS : mémoire physique réellement occupée, pages partagées comptées une fois
+        'total_pss_bytes': pss,
+        'shared_saving_bytes': rss - pss,
+        'mean_worker_private_bytes': (
+            sum(p.get('Private_Clean', 0) + p.get('Private_Dirty', 0) for p in workers) // len(workers)
+            if workers else 0
+        ),
+    }
+
+
+def _log_report(report):
+    mb = 1024 * 1024
+    for name, rollup in report['processes'].items():
+        logger.info(
+            f"[MEMORY] {name} : RSS {rollup.get('Rss', 0) / mb:.1f} Mo, PSS {rollup.get('Pss', 0) / mb:.1f} Mo, "
+            f"partagé {(rollup.get('Shared_Clean', 0) + rollup.get('Shared_Dirty', 0)) / mb:.1f} Mo"
+        )
+    logger.info(
+        f"[MEMORY] total RSS {report['total_rss_bytes'] / mb:.1f} Mo, PSS {report['total_pss_bytes'] / mb:.1f} Mo, "
+        f"économie par partage {report['shared_saving_bytes'] / mb:.1f} Mo"
+    )
+
+
+def write_report(report, path=REPORT_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def _schedule_report(arbiter, delay):
+    """Rapport mémoire une fois les workers démarrés et chauds"""
+    def run():
+        time.sleep(delay)
+        report = memory_report(os.getpid(), list(arbiter.WORKERS))
+        _log_report(report)
+        write_report(report)
+    threading.Thread(target=run, daemon=True).start()
+
+
+def build_server(workers, request_threads, bind, timeout):
+    from gunicorn.app.base import BaseApplication
+
+    class PreforkServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', bind)
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', request_threads)
+            self.cfg.set('worker_class', 'gthread' if request_threads > 1 else 'sync')
+            self.cfg.set('timeout', timeout)
+            # L'application (TensorFlow) est importée dans le worker, après le fork
+            self.cfg.set('preload_app', False)
+            self.cfg.set('on_starting', self.on_starting)
+            self.cfg.set('when_ready', self.when_ready)
+
+        @staticmethod
+        def on_starting(arbiter):
+            # Maître : artefacts sklearn/XGBoost seulement, partagés en copy-on-write avec les workers
+            preload_models(FORK_SAFE_FAMILIES)
+            # Les objets existants passent en génération permanente : le GC des workers ne les touche plus
+            gc.collect()
+            gc.freeze()
+
+        def load(self):
+            # Worker : budget de threads, TensorFlow et MobileNetV2 (import de main.py), modèles Keras
+            from sgai.main import app
+            preload_models(('keras',))
+            logger.info(f"[THREADS] {threads.report()}")
+            return app
+
+        @staticmethod
+        def when_ready(arbiter):
+            logger.info(f"[SERVER] {workers} workers x {request_threads} threads sur {bind} ; "
+                        f"{gc.get_freeze_count()} objets gelés")
+            if MEMORY_REPORT_DELAY > 0:
+                _schedule_report(arbiter, MEMORY_REPORT_DELAY)
+
+    return PreforkServer()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serveur de production SGAI (préfork, modèles partagés)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SGAI_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SGAI_THREADS', '4')))
+    parser.add_argument('--bind', default=os.environ.get('SGAI_BIND', '0.0.0.0:5000'))
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('SGAI_TIMEOUT', '120')))
+    parser.add_argument('--report', type=int, metavar='PID_MAITRE',
+                        help='affiche le rapport mémoire des workers d\'un serveur en cours et quitte')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.report:
+        report = memory_report(args.report)
+        _log_report(report)
+        print(json.dumps(report, indent=2))
+        return report
+    if args.workers > 1 and metrics.ENABLED:
+        # Avant le fork : chaque worker hérite du répertoire, vidé des instantanés d'un lancement précédent
+        metrics.use_multiprocess_dir(os.environ.get('SGAI_METRICS_DIR') or METRICS_DIR)
+    # Lus par services/threads.py pour répartir les cœurs entre workers et threads
+    os.environ['SGAI_WORKERS'] = str(args.workers)
+    os.environ['SGAI_THREADS'] = str(args.threads)
+    build_server(args.workers, args.threads, args.bind, args.timeout).run()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
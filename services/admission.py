@@ -0,0 +1,230 @@
+"""
+Contrôle d'admission des endpoints coûteux.
+
+Chaque endpoint limité a un nombre de requêtes simultanées, une file d'attente
+bornée et un délai (deadline) : une requête qui ne peut pas démarrer avant sa
+deadline reçoit immédiatement un 503 avec Retry-After, au lieu d'occuper un
+thread du worker. Les routes de prédiction légères (/api/predict/*) ne sont
+pas mises en file et restent servies pendant une rafale d'images ou de
+grosses matrices.
+
+La taille des corps est plafonnée par endpoint, à partir du nombre de
+cellules (lignes x features) ou de pixels acceptés : Content-Length est
+vérifié avant la lecture du corps (413), et les routes contrôlent la taille
+réelle avec check_cells()/check_pixels().
+
+Réglages :
+    SGAI_ADMISSION=0                                  désactive le contrôle
+    SGAI_ADMISSION="cluster=4:8:5,detect_disease=1:2:2"
+        concurrence:file:deadline_secondes par endpoint (nom de la vue)
+    En-tête X-SGAI-Deadline-Ms                        deadline propre à la requête
+"""
+import os
+import math
+import time
+import logging
+import threading
+from werkzeug.exceptions import RequestEntityTooLarge
+from sgai.services import metrics
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('SGAI_ADMISSION', '1') != '0'
+
+# Octets par cellule d'une matrice JSON (nombre, séparateur, crochets) et marge pour le reste du corps
+JSON_BYTES_PER_CELL = 32
+BODY_OVERHEAD_BYTES = 64 * 1024
+
+
+class Limit:
+    """Limites d'un endpoint ; None = pas de limite"""
+
+    def __init__(self, concurrency=None, queue=0, deadline=None, max_cells=None, max_pixels=None, max_bytes=None):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.deadline = deadline
+        self.max_cells = max_cells
+        self.max_pixels = max_pixels
+        if max_bytes is None and max_cells:
+            max_bytes = max_cells * JSON_BYTES_PER_CELL + BODY_OVERHEAD_BYTES
+        self.max_bytes = max_bytes
+
+
+LIMITS = {
+    'detect_disease': Limit(concurrency=2, queue=4, deadline=2.0,
+                            max_pixels=25_000_000, max_bytes=20 * 1024 * 1024),
+    'cluster': Limit(concurrency=2, queue=4, deadline=5.0, max_cells=5_000_000),
+    'optimize': Limit(concurrency=2, queue=4, deadline=5.0, max_cells=2_000_000),
+    'predict_batch': Limit(concurrency=4, queue=8, deadline=2.0, max_cells=2_000_000),
+    'generate_csv': Limit(concurrency=2, queue=4, deadline=10.0, max_cells=5_000_000),
+    'generate_stream': Limit(concurrency=2, queue=2, deadline=10.0),
+    'sweep_rf': Limit(concurrency=4, queue=8, deadline=5.0, max_cells=200_000),
+    # Routes légères : pas de file, seulement un plafond de taille
+    'predict_rf': Limit(max_cells=2_000_000),
+    'predict_rf_family': Limit(max_cells=2_000_000),
+    'explain_rf': Limit(max_cells=500_000),
+    'predict_rendement': Limit(max_cells=10_000),
+}
+
+
+def _parse_limit(values):
+    """'concurrence[:file[:deadline]]' -> (concurrence, file, deadline) ; ValueError si mal formé"""
+    parts = values.split(':')
+    if len(parts) > 3:
+        raise ValueError('au plus concurrence:file:deadline')
+    concurrency = int(parts[0])
+    queue = int(parts[1]) if len(parts) > 1 else None
+    deadline = float(parts[2]) if len(parts) > 2 else None
+    if concurrency < 0 or (queue is not None and queue < 0) or (deadline is not None and not deadline > 0):
+        raise ValueError('valeurs positives attendues')
+    return concurrency, queue, deadline
+
+
+def _apply_overrides(spec):
+    """Applique SGAI_ADMISSION ; une entrée mal formée est ignorée (avertissement), pas fatale au démarrage"""
+    for item in spec.split(','):
+        name, _, values = item.partition('=')
+        if not name.strip() or not values.strip():
+            continue
+        try:
+            concurrency, queue, deadline = _parse_limit(values)
+        except ValueError as e:
+            logger.warning(f"[ADMISSION] Entrée SGAI_ADMISSION ignorée: {item.strip()!r} ({e})")
+            continue
+        limit = LIMITS.setdefault(name.strip(), Limit())
+        limit.concurrency = concurrency or None
+        if queue is not None:
+            limit.queue = queue
+        if deadline is not None:
+            limit.deadline = deadline
+
+
+if ENABLED and os.environ.get('SGAI_ADMISSION', '1') != '1':
+    _apply_overrides(os.environ['SGAI_ADMISSION'])
+
+
+class Gate:
+    """Sémaphore avec file bornée, estimation de l'attente et abandon à la deadline"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        # Durée moyenne de traitement (moyenne mobile exponentielle), pour estimer l'attente
+        self.service_time = (limit.deadline or 1.0) / 4
+        self._cond = threading.Condition()
+
+    def _estimated_wait(self):
+        return (self.waiting + 1) * self.service_time / self.limit.concurrency
+
+    def enter(self, deadline):
+        """Retourne (admis, attente estimée en secondes)"""
+        with self._cond:
+            if self.active < self.limit.concurrency and not self.waiting:
+                self.active += 1
+                return True, 0.0
+            estimate = self._estimated_wait()
+            # File pleine, ou démarrage impossible avant la deadline : rejet immédiat
+            if self.waiting >= self.limit.queue or (deadline is not None and estimate > deadline):
+                return False, estimate
+            self.waiting += 1
+            end = time.monotonic() + deadline if deadline is not None else None
+            try:
+                while self.active >= self.limit.concurrency:
+                    remaining = end - time.monotonic() if end is not None else None
+                    if remaining is not None and remaining <= 0:
+                        return False, self._estimated_wait()
+                    self._cond.wait(remaining)
+                self.active += 1
+                return True, 0.0
+            finally:
+                self.waiting -= 1
+
+    def leave(self, elapsed):
+        with self._cond:
+            self.active -= 1
+            self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+            self._cond.notify()
+
+
+_gates = {name: Gate(limit) for name, limit in LIMITS.items() if limit.concurrency}
+
+
+def _view(endpoint):
+    return endpoint.rsplit('.', 1)[-1] if endpoint else None
+
+
+def current_limit():
+    from flask import request
+    return LIMITS.get(_view(request.endpoint)) if ENABLED else None
+
+
+def check_cells(n_cells):
+    """Lève 413 si la matrice reçue dépasse le plafond de cellules de l'endpoint"""
+    limit = current_limit()
+    if limit and limit.max_cells and n_cells > limit.max_cells:
+        raise RequestEntityTooLarge(
+            f"{n_cells} cellules (lignes x features) reçues, maximum {limit.max_cells} pour cet endpoint"
+        )
+
+
+def check_pixels(image):
+    """Lève 413 si l'image dépasse le plafond de pixels (lu dans l'en-tête, avant décodage)"""
+    limit = current_limit()
+    width, height = image.size
+    if limit and limit.max_pixels and width * height > limit.max_pixels:
+        raise RequestEntityTooLarge(
+            f"Image de {width}x{height} pixels, maximum {limit.max_pixels} pixels"
+        )
+
+
+def _deadline(request, limit):
+    header = request.headers.get('X-SGAI-Deadline-Ms')
+    if header:
+        try:
+            return max(0.0, float(header) / 1000.0)
+        except ValueError:
+            pass
+    return limit.deadline
+
+
+def init_app(app):
+    """Branche la limite de taille des corps et l'admission par endpoint"""
+    from flask import g, request, jsonify
+
+    if not ENABLED:
+        return app
+
+    @app.before_request
+    def _admit():
+        view = _view(request.endpoint)
+        limit = LIMITS.get(view)
+        if limit is None:
+            return
+        if limit.max_bytes and request.content_length and request.content_length > limit.max_bytes:
+            metrics.record_admission(view, 'too_large')
+            return jsonify({
+                'error': f"Corps de {request.content_length} octets, maximum {limit.max_bytes} pour cet endpoint"
+            }), 413
+        gate = _gates.get(view)
+        if gate is None:
+            return
+        start = time.perf_counter()
+        admitted, estimate = gate.enter(_deadline(request, limit))
+        if not admitted:
+            metrics.record_admission(view, 'shed')
+            response = jsonify({'error': 'Serveur saturé pour cet endpoint, réessayez plus tard'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(max(1, math.ceil(estimate)))
+            return response
+        metrics.record_admission(view, 'admitted', time.perf_counter() - start)
+        g._sgai_admission = (gate, time.perf_counter())
+
+    @app.teardown_request
+    def _release(exc=None):
+        admission = g.pop('_sgai_admission', None)
+        if admission is not None:
+            gate, start = admission
+            gate.leave(time.perf_counter() - start)
+
+    return app
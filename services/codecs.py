@@ -0,0 +1,233 @@
+"""
+Négociation de contenu des endpoints numériques.
+
+JSON reste le format par défaut. Formats binaires acceptés en entrée
+(Content-Type) et en sortie (Accept) :
+- application/vnd.apache.arrow.stream : flux Arrow IPC contenant une table ;
+- application/msgpack : dictionnaire MessagePack, les tableaux NumPy étant
+  encodés {'nd': True, 'type': dtype, 'shape': forme, 'data': octets}
+  (convention msgpack-numpy) ;
+- application/x-npy : un tableau .npy unique.
+
+Les corps binaires sont enveloppés sans copie (np.frombuffer, buffers Arrow).
+Une table Arrow ou un .npy ne porte que le champ principal de l'endpoint
+(ex: `features`) ; les autres paramètres passent par la query string ou, en
+Arrow, par la métadonnée de schéma `sgai` (objet JSON). En réponse, les
+champs autres que le champ principal sont placés dans la métadonnée `sgai`
+(Arrow) ou dans l'en-tête X-SGAI-Meta (.npy). Sans en-tête Accept, la
+réponse reprend le format de la requête.
+"""
+import io
+import json
+import numpy as np
+import pandas as pd
+from flask import request, jsonify, Response
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
+from sgai.services import metrics
+
+JSON = 'application/json'
+ARROW = 'application/vnd.apache.arrow.stream'
+MSGPACK = 'application/msgpack'
+NPY = 'application/x-npy'
+
+ALIASES = {
+    'application/x-msgpack': MSGPACK,
+    'application/vnd.msgpack': MSGPACK,
+    'application/octet-stream+npy': NPY,
+}
+
+META_KEY = b'sgai'
+META_HEADER = 'X-SGAI-Meta'
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise UnsupportedMediaType("MessagePack indisponible sur ce serveur (paquet msgpack manquant)")
+    return msgpack
+
+
+def _scalar(value):
+    """Paramètre de query string : nombre/booléen/liste JSON si possible, sinon chaîne"""
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def _check_dtype(dtype):
+    if dtype.hasobject:
+        raise BadRequest("Les tableaux de type objet ne sont pas acceptés")
+    return dtype
+
+
+# --- Décodage ------------------------------------------------------------
+
+def _decode_npy(body, primary):
+    stream = io.BytesIO(body)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    else:
+        return {primary: np.load(io.BytesIO(body), allow_pickle=False)}
+    _check_dtype(dtype)
+    count = int(np.prod(shape)) if shape else 1
+    array = np.frombuffer(body, dtype=dtype, count=count, offset=stream.tell())
+    return {primary: array.reshape(shape, order='F' if fortran_order else 'C')}
+
+
+def _table_value(table):
+    """Colonne unique fixed_size_list -> matrice sans copie ; sinon DataFrame (une colonne par feature)"""
+    import pyarrow as pa
+    if table.num_columns == 1 and pa.types.is_fixed_size_list(table.schema.field(0).type):
+        column = table.column(0).combine_chunks()
+        width = column.type.list_size
+        values = column.flatten().to_numpy(zero_copy_only=False)
+        return values.reshape(-1, width)
+    return table.to_pandas()
+
+
+def _decode_arrow(body, primary):
+    import pyarrow as pa
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    metadata = table.schema.metadata or {}
+    payload = json.loads(metadata[META_KEY]) if META_KEY in metadata else {}
+    payload[primary] = _table_value(table)
+    return payload
+
+
+def _msgpack_hook(obj):
+    def field(key):
+        return obj[key] if key in obj else obj.get(key.encode())
+    if field('nd') is not True:
+        return obj
+    dtype = field('type')
+    dtype = _check_dtype(np.dtype(dtype.decode() if isinstance(dtype, bytes) else dtype))
+    return np.frombuffer(field('data'), dtype=dtype).reshape(field('shape'))
+
+
+def _decode_msgpack(body, primary):
+    payload = _msgpack().unpackb(body, raw=False, object_hook=_msgpack_hook)
+    if not isinstance(payload, dict):
+        payload = {primary: payload}
+    return payload
+
+
+DECODERS = {NPY: _decode_npy, ARROW: _decode_arrow, MSGPACK: _decode_msgpack}
+
+
+def request_format():
+    mimetype = ALIASES.get(request.mimetype, request.mimetype)
+    return mimetype if mimetype in DECODERS else JSON
+
+
+def read_payload(primary='features'):
+    """
+    Corps de la requête sous forme de dict, quel que soit son format.
+    En binaire, `primary` reçoit le tableau (ou la table) transmis.
+    """
+    fmt = request_format()
+    if fmt == JSON:
+        return request.get_json()
+    with metrics.phase('parse'):
+        try:
+            payload = DECODERS[fmt](request.get_data(cache=False), primary)
+        except (BadRequest, UnsupportedMediaType):
+            raise
+        except Exception as e:
+            raise BadRequest(f"Corps {fmt} invalide: {e}")
+    for key, value in request.args.items():
+        payload.setdefault(key, _scalar(value))
+    return payload
+
+
+def to_frame(value, columns=None):
+    """DataFrame de features depuis un dict, une liste, une table ou une matrice"""
+    if isinstance(value, pd.DataFrame):
+        return value
+    if isinstance(value, dict):
+        return pd.DataFrame([value])
+    if isinstance(value, np.ndarray):
+        return pd.DataFrame(np.atleast_2d(value), columns=columns)
+    if value and not isinstance(value[0], dict):
+        return pd.DataFrame(value, columns=columns)
+    return pd.DataFrame(value)
+
+
+# --- Encodage ------------------------------------------------------------
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def _split(payload, primary):
+    value = payload.get(primary)
+    array = np.asarray(value) if value is not None else np.empty(0)
+    return array, _jsonable({k: v for k, v in payload.items() if k != primary})
+
+
+def _encode_npy(payload, primary):
+    array, meta = _split(payload, primary)
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue(), {META_HEADER: json.dumps(meta)}
+
+
+def _encode_arrow(payload, primary):
+    import pyarrow as pa
+    array, meta = _split(payload, primary)
+    if array.ndim == 2:
+        column = pa.FixedSizeListArray.from_arrays(pa.array(np.ascontiguousarray(array).ravel()), array.shape[1])
+    else:
+        column = pa.array(np.atleast_1d(array))
+    table = pa.table({primary: column}).replace_schema_metadata({META_KEY: json.dumps(meta)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes(), {}
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, np.ndarray):
+        array = np.ascontiguousarray(obj)
+        _check_dtype(array.dtype)
+        return {'nd': True, 'type': array.dtype.str, 'shape': list(array.shape), 'data': array.data}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Type non sérialisable en MessagePack: {type(obj).__name__}")
+
+
+def _encode_msgpack(payload, primary):
+    return _msgpack().packb(payload, default=_msgpack_default, use_bin_type=True), {}
+
+
+ENCODERS = {NPY: _encode_npy, ARROW: _encode_arrow, MSGPACK: _encode_msgpack}
+
+
+def response_format():
+    """Format demandé par Accept ; à défaut, celui de la requête"""
+    offered = request_format()
+    candidates = [offered] + [fmt for fmt in (JSON, ARROW, MSGPACK, NPY) if fmt != offered] + list(ALIASES)
+    best = request.accept_mimetypes.best_match(candidates, default=offered)
+    return ALIASES.get(best, best)
+
+
+def respond(payload, primary, status=200):
+    """Réponse dans le format négocié ; `primary` est le champ tabulaire du payload"""
+    fmt = response_format()
+    if fmt == JSON:
+        return jsonify(_jsonable(payload)), status
+    with metrics.phase('serialize'):
+        body, headers = ENCODERS[fmt](payload, primary)
+    return Response(body, status=status, mimetype=fmt, headers=headers)
@@ -0,0 +1,130 @@
+"""
+Cache des résultats de /detect_disease pour les images déjà vues.
+
+Les applications terrain renvoient souvent la même photo (nouvel essai,
+nouvelle soumission) ou des photos presque identiques de la même plante.
+Chaque résultat est indexé par :
+- l'empreinte SHA-256 des octets reçus : doublon exact, trouvé avant tout décodage ;
+- un hash perceptuel (pHash 64 bits : DCT de la vignette 32x32 en niveaux de
+  gris) : une image recompressée, redimensionnée ou légèrement retouchée est
+  reconnue si la distance de Hamming entre les hash reste sous le seuil.
+
+Le nombre d'entrées est borné (éviction LRU). Le cache est propre à chaque
+worker.
+
+Réglages :
+    SGAI_IMAGE_CACHE_SIZE        nombre maximal d'entrées (défaut : 1024, 0 = désactivé)
+    SGAI_IMAGE_CACHE_DISTANCE    distance de Hamming maximale du pHash (défaut : 6, -1 = hash exact seulement)
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.fft import dctn
+from PIL import Image
+from sgai.services import metrics
+
+MAX_ENTRIES = int(os.environ.get('SGAI_IMAGE_CACHE_SIZE', '1024'))
+MAX_DISTANCE = int(os.environ.get('SGAI_IMAGE_CACHE_DISTANCE', '6'))
+
+HASH_SIZE = 8
+THUMBNAIL_SIZE = 32
+
+
+def content_key(data):
+    """Empreinte exacte des octets de l'image"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(img):
+    """
+    pHash 64 bits : basses fréquences (8x8, hors composante continue) de la DCT
+    de la vignette en niveaux de gris, comparées à leur médiane.
+    """
+    thumbnail = img.convert('L').resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+    low = dctn(np.asarray(thumbnail, dtype=float), norm='ortho')[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low[1:])
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+class ImageCache:
+    """Résultats indexés par empreinte exacte et par pHash, éviction LRU"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_distance=MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # empreinte -> (pHash, résultat)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get_exact(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def get_similar(self, phash):
+        """Résultat de l'image la plus proche à distance <= max_distance, sinon None"""
+        if not self.enabled or self.max_distance < 0:
+            return None
+        with self._lock:
+            best_key, best_distance = None, self.max_distance + 1
+            for key, (other, _) in self._entries.items():
+                if other is None:
+                    continue
+                distance = (phash ^ other).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+                    if distance == 0:
+                        break
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][1]
+
+    def put(self, key, phash, result):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (phash, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+cache = ImageCache()
+
+
+def lookup_exact(key):
+    """Résultat d'une image déjà reçue à l'identique (avant décodage)"""
+    result = cache.get_exact(key)
+    if result is not None:
+        metrics.record_cache('disease_image', True)
+    return result
+
+
+def lookup_similar(img):
+    """Résultat d'une image quasi identique ; retourne (résultat ou None, pHash de l'image)"""
+    phash = perceptual_hash(img) if cache.enabled and cache.max_distance >= 0 else None
+    result = cache.get_similar(phash) if phash is not None else None
+    metrics.record_cache('disease_image', result is not None)
+    return result, phash
+
+
+def put(key, phash, result):
+    cache.put(key, phash, result)
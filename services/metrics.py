@@ -0,0 +1,362 @@
+"""
+Instrumentation des API : histogrammes de latence par route et par phase
+(parse, load, preprocess, infer, serialize), temps et taille de chargement des
+modèles, taux de succès des caches et mémoire résidente du worker.
+
+Les mesures sont exposées au format texte Prometheus sur /metrics.
+SGAI_METRICS=0 désactive toute collecte (les appels deviennent des no-op).
+
+Serveur préforké : avec SGAI_METRICS_DIR (positionné par server.py), chaque
+worker y écrit l'instantané de ses mesures (<pid>.json, toutes les
+SGAI_METRICS_FLUSH_S secondes et à chaque /metrics) ; /metrics agrège les
+fichiers de tous les workers, quel que soit celui qui répond. Histogrammes et
+compteurs sont sommés ; les jauges gardent un label pid et celles des workers
+arrêtés sont écartées.
+"""
+import os
+import json
+import time
+import uuid
+import bisect
+import resource
+import threading
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('SGAI_METRICS', '1') != '0'
+
+MULTIPROCESS_DIR = os.environ.get('SGAI_METRICS_DIR') or None
+FLUSH_INTERVAL = float(os.environ.get('SGAI_METRICS_FLUSH_S', '5'))
+
+# Bornes des histogrammes de latence (secondes)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Histogrammes, compteurs et jauges indexés par (nom, labels)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.help = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def snapshot(self):
+        """État sérialisable en JSON, pour l'agrégation entre workers"""
+        with self._lock:
+            return {
+                'histograms': [
+                    [name, labels, list(h.buckets), list(h.counts), h.sum, h.count]
+                    for (name, labels), h in self.histograms.items()
+                ],
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self.gauges.items()],
+            }
+
+    def merge(self, snapshot, gauges=True, pid=None):
+        """Ajoute l'instantané d'un autre registre ; ses jauges reçoivent le label pid s'il manque"""
+        with self._lock:
+            for name, labels, buckets, counts, total, count in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(tuple(buckets))
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+            if not gauges:
+                return
+            for name, labels, value in snapshot['gauges']:
+                labels = dict(tuple(label) for label in labels)
+                if pid is not None:
+                    labels.setdefault('pid', str(pid))
+                self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def render(self):
+        """Sérialisation au format d'exposition texte de Prometheus"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in histograms]
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self.help:
+                    lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), counts, total, count, buckets in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{_labels(labels)} {value}')
+        for (name, labels), value in gauges:
+            header(name, 'gauge')
+            lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for k, v in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+registry = Registry()
+registry.help.update({
+    'sgai_http_request_duration_seconds': 'Durée totale des requêtes HTTP par route',
+    'sgai_request_phase_seconds': 'Durée des phases de traitement (parse, load, preprocess, infer, serialize)',
+    'sgai_model_load_seconds': 'Durée du dernier chargement de chaque modèle',
+    'sgai_model_size_bytes': 'Taille sur disque des artefacts de chaque modèle',
+    'sgai_cache_requests_total': 'Accès aux caches par résultat (hit/miss)',
+    'sgai_process_resident_memory_bytes': 'Mémoire résidente (RSS) du worker',
+    'sgai_process_peak_resident_memory_bytes': 'Pic de mémoire résidente du worker',
+})
+
+
+def _current_route():
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return '-'
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return '-'
+
+
+@contextmanager
+def phase(name, route=None):
+    """Chronomètre une phase de traitement de la requête courante"""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe('sgai_request_phase_seconds', time.perf_counter() - start,
+                         route=route or _current_route(), phase=name)
+
+
+def path_size(path):
+    """Taille d'un fichier ou d'un répertoire (SavedModel) en octets"""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk(path) for f in files
+        )
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def record_model_load(model, seconds, size_bytes, version=None):
+    if ENABLED:
+        registry.set('sgai_model_load_seconds', seconds, model=model)
+        registry.set('sgai_model_size_bytes', size_bytes, model=model)
+        if version is not None:
+            registry.set('sgai_model_version', version, model=model)
+
+
+def record_cache(cache, hit, amount=1):
+    if ENABLED and amount:
+        registry.inc('sgai_cache_requests_total', amount, cache=cache, result='hit' if hit else 'miss')
+
+
+def record_admission(endpoint, result, wait_seconds=None):
+    if ENABLED:
+        registry.inc('sgai_admission_total', endpoint=endpoint, result=result)
+        if wait_seconds is not None:
+            registry.observe('sgai_admission_wait_seconds', wait_seconds, endpoint=endpoint)
+
+
+def rss_bytes():
+    """Mémoire résidente courante (Linux : /proc/self/statm)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def memory_rollup(pid='self'):
+    """
+    Rss/Pss et pages partagées/privées d'un processus (Linux : /proc/<pid>/smaps_rollup), en octets.
+    Le PSS répartit les pages partagées entre les processus qui les référencent.
+    """
+    fields = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+    rollup = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in fields:
+                    rollup[key] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        return {}
+    return rollup
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def use_multiprocess_dir(path):
+    """Active l'agrégation entre workers (à appeler dans le maître, avant le fork) ; vide les anciens instantanés"""
+    global MULTIPROCESS_DIR
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith('.json'):
+            os.remove(os.path.join(path, name))
+    MULTIPROCESS_DIR = path
+    os.environ['SGAI_METRICS_DIR'] = path
+
+
+def write_snapshot():
+    """Écrit l'instantané du worker dans MULTIPROCESS_DIR (écriture atomique)"""
+    path = os.path.join(MULTIPROCESS_DIR, f'{os.getpid()}.json')
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+
+def render_multiprocess():
+    """Somme des instantanés de tous les workers (celui du worker courant est réécrit d'abord)"""
+    write_snapshot()
+    merged = Registry()
+    merged.help = registry.help
+    for name in os.listdir(MULTIPROCESS_DIR):
+        if not name.endswith('.json'):
+            continue
+        pid = int(name[:-len('.json')])
+        try:
+            with open(os.path.join(MULTIPROCESS_DIR, name)) as f:
+                snapshot = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue
+        # Les compteurs d'un worker arrêté restent acquis ; ses jauges (mémoire, modèles) ne valent plus
+        merged.merge(snapshot, gauges=_alive(pid), pid=pid)
+    return merged.render()
+
+
+def render():
+    pid = str(os.getpid())
+    registry.set('sgai_process_resident_memory_bytes', rss_bytes(), pid=pid)
+    pss = memory_rollup().get('Pss')
+    if pss is not None:
+        registry.set('sgai_process_proportional_memory_bytes', pss, pid=pid)
+    registry.set('sgai_process_peak_resident_memory_bytes', peak_rss_bytes(), pid=pid)
+    if MULTIPROCESS_DIR:
+        return render_multiprocess()
+    return registry.render()
+
+
+def init_app(app):
+    """Branche la mesure des requêtes, du parsing JSON et de la sérialisation, et la route /metrics"""
+    from flask import Response, g, request
+
+    @app.route('/metrics')
+    def metrics():
+        if not ENABLED:
+            return Response('metrics disabled\n', status=404, mimetype='text/plain')
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    if not ENABLED:
+        return app
+
+    if MULTIPROCESS_DIR:
+        threading.Thread(target=_flush_loop, daemon=True).start()
+
+    class TimedRequest(app.request_class):
+        def get_json(self, *args, **kwargs):
+            with phase('parse'):
+                return super().get_json(*args, **kwargs)
+
+    class TimedJSONProvider(type(app.json)):
+        def response(self, *args, **kwargs):
+            with phase('serialize'):
+                return super().response(*args, **kwargs)
+
+    app.request_class = TimedRequest
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def _start_timer():
+        g._sgai_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop('_sgai_start', None)
+        if start is not None and request.url_rule is not None and request.url_rule.rule != '/metrics':
+            registry.observe('sgai_http_request_duration_seconds', time.perf_counter() - start,
+                             route=request.url_rule.rule, method=request.method,
+                             status=str(response.status_code))
+        return response
+
+    return app
@@ -0,0 +1,164 @@
+"""
+Profilage à la demande des requêtes API.
+
+- Par requête : en-tête `X-SGAI-Profile: sample|cprofile` ou `?profile=sample|cprofile`,
+  accepté uniquement pour une identité JWT administrateur (claim `role: admin`
+  ou identité listée dans SGAI_ADMIN_IDENTITIES).
+- En continu : SGAI_PROFILE_SAMPLE_RATE (ex: 0.01) profile une fraction des requêtes
+  avec l'échantillonneur de piles, quel que soit l'appelant.
+
+Les profils sont écrits dans results/profiles/ (piles repliées au format
+flamegraph.pl / speedscope, ou sortie pstats) ; l'en-tête de réponse
+X-SGAI-Profile-Id permet de les récupérer sur /admin/profiles/<id>.
+"""
+import os
+import io
+import sys
+import uuid
+import random
+import pstats
+import cProfile
+import threading
+from collections import Counter
+
+PROFILES_DIR = os.path.join('results', 'profiles')
+SAMPLE_RATE = float(os.environ.get('SGAI_PROFILE_SAMPLE_RATE', '0'))
+SAMPLE_INTERVAL = float(os.environ.get('SGAI_PROFILE_INTERVAL_MS', '5')) / 1000.0
+ADMIN_IDENTITIES = {i.strip() for i in os.environ.get('SGAI_ADMIN_IDENTITIES', '').split(',') if i.strip()}
+# Nombre de profils conservés sur disque
+MAX_PROFILES = int(os.environ.get('SGAI_PROFILE_KEEP', '200'))
+
+
+class StackSampler:
+    """Échantillonne la pile d'un thread à intervalle fixe (sys._current_frames)"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def output(self):
+        """Piles repliées : une ligne `f1;f2;f3 nb_échantillons`"""
+        return ''.join(f'{stack} {n}\n' for stack, n in self.counts.most_common())
+
+
+class CProfileRunner:
+    """cProfile sur le thread courant, sortie pstats triée par temps cumulé"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+        return self
+
+    def stop(self):
+        self.profile.disable()
+
+    def output(self):
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(60)
+        return stream.getvalue()
+
+
+PROFILERS = {
+    'sample': (lambda: StackSampler(threading.get_ident()), 'collapsed'),
+    'cprofile': (CProfileRunner, 'pstats.txt'),
+}
+
+
+def is_admin():
+    """Vrai si la requête porte un JWT valide d'administrateur"""
+    from flask_jwt_extended import verify_jwt_in_request, get_jwt, get_jwt_identity
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:
+        return False
+    identity = get_jwt_identity()
+    if identity is None:
+        return False
+    claims = get_jwt()
+    return claims.get('role') == 'admin' or bool(claims.get('is_admin')) or str(identity) in ADMIN_IDENTITIES
+
+
+def _save(profile_id, extension, content):
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    path = os.path.join(PROFILES_DIR, f'{profile_id}.{extension}')
+    with open(path, 'w') as f:
+        f.write(content)
+    files = sorted(
+        (os.path.join(PROFILES_DIR, name) for name in os.listdir(PROFILES_DIR)),
+        key=os.path.getmtime,
+    )
+    for old in files[:-MAX_PROFILES]:
+        os.remove(old)
+    return path
+
+
+def init_app(app):
+    """Branche le profilage autour des handlers et la route de consultation /admin/profiles/<id>"""
+    from flask import g, request, jsonify, send_file
+
+    @app.before_request
+    def _start_profiler():
+        mode = request.headers.get('X-SGAI-Profile') or request.args.get('profile')
+        if mode:
+            if mode not in PROFILERS or not is_admin():
+                return
+        elif SAMPLE_RATE and random.random() < SAMPLE_RATE:
+            mode = 'sample'
+        else:
+            return
+        factory, extension = PROFILERS[mode]
+        g._sgai_profiler = (factory().start(), extension, uuid.uuid4().hex)
+
+    @app.after_request
+    def _profile_header(response):
+        profiler = g.get('_sgai_profiler')
+        if profiler is not None:
+            response.headers['X-SGAI-Profile-Id'] = profiler[2]
+        return response
+
+    @app.teardown_request
+    def _stop_profiler(exc):
+        # teardown_request s'exécute aussi quand la vue lève une exception (after_request non) :
+        # l'échantillonneur ou cProfile ne restent jamais actifs après la requête
+        profiler = g.pop('_sgai_profiler', None)
+        if profiler is None:
+            return
+        profiler, extension, profile_id = profiler
+        profiler.stop()
+        _save(profile_id, extension, profiler.output())
+
+    @app.route('/admin/profiles/<profile_id>')
+    def get_profile(profile_id):
+        if not is_admin():
+            return jsonify({'error': 'Réservé aux administrateurs'}), 403
+        for extension in ('collapsed', 'pstats.txt'):
+            path = os.path.join(PROFILES_DIR, f'{os.path.basename(profile_id)}.{extension}')
+            if os.path.exists(path):
+                return send_file(os.path.abspath(path), mimetype='text/plain')
+        return jsonify({'error': 'Profil inconnu'}), 404
+
+    return app
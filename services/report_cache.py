@@ -0,0 +1,124 @@
+"""
+Stockage adressé par contenu des rapports générés.
+
+Un rapport est identifié par l'empreinte SHA-256 de son contenu (données,
+résumé, interprétation, graphiques) : deux requêtes identiques partagent le
+même fichier, et des requêtes identiques simultanées ne déclenchent qu'un
+seul rendu, y compris réparties sur plusieurs workers (verrou fcntl.flock par
+empreinte dans <cache>/.locks/). La taille totale du cache est bornée
+(éviction LRU par mtime).
+"""
+import os
+import json
+import uuid
+import fcntl
+import hashlib
+from stat import S_ISREG
+from sgai.services import metrics
+
+CACHE_DIR = os.path.join('results', 'cache')
+LOCKS_DIR = '.locks'
+MAX_BYTES = int(os.environ.get('SGAI_REPORT_CACHE_BYTES', 512 * 1024 * 1024))
+
+
+def report_key(kind, data, summary='', interpretation='', plots=None, charts=None):
+    """Empreinte d'un rapport ; le contenu des images de `plots` est inclus, pas seulement leur chemin"""
+    digest = hashlib.sha256(kind.encode('utf-8'))
+    payload = {
+        'data': data, 'summary': summary, 'interpretation': interpretation,
+        'plots': plots or [], 'charts': charts or [],
+    }
+    digest.update(json.dumps(payload, sort_keys=True, default=str).encode('utf-8'))
+    for plot_path in plots or []:
+        if os.path.exists(plot_path):
+            with open(plot_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+class ReportStore:
+    """Répertoire de rapports <empreinte>.<extension> avec rendu unique par empreinte"""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path_for(self, key, ext):
+        return os.path.join(self.root, f'{key}.{ext}')
+
+    def lock_path(self, key, ext):
+        return os.path.join(self.root, LOCKS_DIR, f'{key}.{ext}.lock')
+
+    def lookup(self, key, ext):
+        """Chemin du rapport s'il existe déjà (et le marque comme récemment utilisé)"""
+        path = self.path_for(key, ext)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_or_render(self, key, ext, render):
+        """
+        Retourne (chemin, trouvé_en_cache). `render(tmp_path)` n'est appelé qu'une fois
+        par empreinte, même si plusieurs requêtes identiques arrivent en même temps
+        dans un ou plusieurs workers.
+        """
+        path = self.lookup(key, ext)
+        metrics.record_cache('report', bool(path))
+        if path:
+            return path, True
+        os.makedirs(os.path.join(self.root, LOCKS_DIR), exist_ok=True)
+        # Chaque open() a sa propre description de fichier : le verrou exclut aussi les threads du worker
+        with open(self.lock_path(key, ext), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Rendu terminé par le détenteur précédent du verrou ; s'il a échoué, on le refait nous-mêmes
+            path = self.lookup(key, ext)
+            if path:
+                return path, True
+            path = self.path_for(key, ext)
+            tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+            try:
+                render(tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        self.evict(keep=path)
+        return path, False
+
+    def evict(self, keep=None):
+        """Supprime les rapports les moins récemment utilisés au-delà de max_bytes"""
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            # Seuls les rapports sont évincés : un sous-répertoire n'appartient pas au cache
+            if not S_ISREG(stat.st_mode):
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            # Verrou du rapport évincé (au pire, un rendu en attente sur l'ancien fichier est refait)
+            try:
+                os.remove(os.path.join(self.root, LOCKS_DIR, f'{os.path.basename(path)}.lock'))
+            except FileNotFoundError:
+                pass
+
+
+store = ReportStore()
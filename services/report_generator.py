@@ -1,11 +1,72 @@
 import pandas as pd
 from docx import Document
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import io
+import json
+import hashlib
+import zlib
+
+# Formats de rapport en flux : format -> (extension, type MIME)
+STREAM_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# Au-delà, le tableau Word devient illisible et coûteux à générer
+MAX_TABLE_ROWS = 5000
 
 def generate_csv_report(df, path):
     df.to_csv(path, index=False)
 
+def _add_data_table(doc, df, max_rows=MAX_TABLE_ROWS):
+    """Ajoute les données sous forme de vrai tableau Word"""
+    df = df.head(max_rows)
+    n_cols = len(df.columns)
+    table = doc.add_table(rows=len(df) + 1, cols=n_cols)
+    table.style = 'Table Grid'
+    # Parcours ligne par ligne : table.cell(i, j) recalcule toute la grille à chaque appel
+    rows = iter(table.rows)
+    for cell, col in zip(next(rows).cells, df.columns):
+        cell.text = str(col)
+    for table_row, values in zip(rows, df.astype(str).itertuples(index=False)):
+        for cell, value in zip(table_row.cells, values):
+            cell.text = value
+    return table
+
+def plot_cache_key(df, spec):
+    """Empreinte du contenu d'un graphique : spécification + colonnes de données utilisées"""
+    columns = [c for c in (spec.get('x'), spec.get('y')) if c in df.columns]
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df[columns], index=False).values.tobytes())
+    return digest.hexdigest()
+
+def render_plot(df, spec, path):
+    """Rend un graphique (line, bar, scatter, hist) avec le backend Agg, sans l'état global de pyplot"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=(8, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    kind = spec.get('kind', 'line')
+    x = df[spec['x']] if spec.get('x') else df.index
+    if kind == 'hist':
+        ax.hist(df[spec['y']].dropna(), bins=spec.get('bins', 20))
+    elif kind == 'bar':
+        ax.bar(x.astype(str), df[spec['y']])
+    elif kind == 'scatter':
+        ax.scatter(x, df[spec['y']], alpha=0.6)
+    else:
+        ax.plot(x, df[spec['y']])
+    ax.set_title(spec.get('title', ''))
+    ax.set_xlabel(spec.get('x', ''))
+    ax.set_ylabel(spec.get('y', ''))
+    fig.tight_layout()
+    fig.savefig(path, dpi=spec.get('dpi', 100))
+    return path
+
 def generate_docx_report(df, path, summary=None, plots=None, interpretation=None):
     doc = Document()
     doc.add_heading('Rapport IA SGAI', 0)
@@ -13,7 +74,9 @@ def generate_docx_report(df, path, summary=None, plots=None, interpretation=None
         doc.add_heading('Résumé', level=1)
         doc.add_paragraph(summary)
     doc.add_heading('Données', level=1)
-    doc.add_paragraph(df.head().to_string())
+    if len(df) > MAX_TABLE_ROWS:
+        doc.add_paragraph(f"{MAX_TABLE_ROWS} premières lignes sur {len(df)}.")
+    _add_data_table(doc, df)
     if plots:
         for plot_path in plots:
             doc.add_picture(plot_path, width=None)
@@ -21,3 +84,141 @@ def generate_docx_report(df, path, summary=None, plots=None, interpretation=None
         doc.add_heading('Interprétation', level=1)
         doc.add_paragraph(interpretation)
     doc.save(path)
+
+def iter_ndjson_chunks(lines, chunk_size=10000):
+    """
+    Regroupe un flux NDJSON (un enregistrement JSON par ligne) en DataFrames de chunk_size lignes ;
+    ValueError avec le numéro de la ligne invalide
+    """
+    batch = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Ligne {number} : JSON invalide ({e})")
+        if not isinstance(record, dict):
+            raise ValueError(f"Ligne {number} : objet JSON attendu, reçu {type(record).__name__}")
+        batch.append(record)
+        if len(batch) >= chunk_size:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+def iter_record_chunks(records, chunk_size=10000):
+    """Découpe une liste d'enregistrements JSON déjà décodée en DataFrames de chunk_size lignes"""
+    for start in range(0, len(records), chunk_size):
+        yield pd.DataFrame(records[start:start + chunk_size])
+
+class _ByteSink(io.RawIOBase):
+    """Fichier en écriture seule dont on vide le contenu au fil de l'eau"""
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer.extend(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def _check_columns(chunk, columns, first_row):
+    """Les colonnes du rapport sont celles du premier chunk : une colonne apparue ensuite est refusée"""
+    unknown = [c for c in chunk.columns if c not in columns]
+    if unknown:
+        raise ValueError(
+            f"Colonnes absentes des premiers enregistrements : {unknown} (enregistrement {first_row} et "
+            f"suivants) ; toutes les colonnes doivent figurer dans le premier bloc ({columns})"
+        )
+
+def _stream_type(pa, field):
+    """
+    Type Parquet d'une colonne, fixé au premier chunk : les entiers passent en float64
+    (un chunk suivant peut contenir 1.5), une colonne entièrement vide en chaîne
+    """
+    if pa.types.is_null(field.type):
+        return pa.large_string()
+    if pa.types.is_integer(field.type):
+        return pa.float64()
+    return field.type
+
+def _iter_parquet_bytes(chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _ByteSink()
+    writer = None
+    columns = None
+    rows = 0
+    for chunk in chunks:
+        if writer is None:
+            columns = list(chunk.columns)
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            schema = pa.schema([field.with_type(_stream_type(pa, field)) for field in table.schema],
+                               metadata=table.schema.metadata)
+            table = table.cast(schema)
+            writer = pq.ParquetWriter(sink, schema)
+        else:
+            _check_columns(chunk, columns, rows + 1)
+            table = pa.Table.from_pandas(chunk.reindex(columns=columns), preserve_index=False)
+            try:
+                table = table.cast(writer.schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                raise ValueError(f"Types incompatibles avec les premiers enregistrements "
+                                 f"(enregistrement {rows + 1} et suivants) : {e}")
+        rows += len(chunk)
+        # Un row group par chunk : la mémoire reste bornée par la taille du chunk
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+def iter_report_bytes(chunks, fmt='csv'):
+    """Sérialise incrémentalement des DataFrames en CSV, CSV gzip ou Parquet"""
+    if fmt == 'parquet':
+        yield from _iter_parquet_bytes(chunks)
+        return
+    compressor = zlib.compressobj(wbits=31) if fmt == 'csv.gz' else None
+    columns = None
+    rows = 0
+    for chunk in chunks:
+        header = columns is None
+        if header:
+            columns = list(chunk.columns)
+        else:
+            _check_columns(chunk, columns, rows + 1)
+        rows += len(chunk)
+        data = chunk.reindex(columns=columns).to_csv(index=False, header=header).encode('utf-8')
+        yield compressor.compress(data) if compressor else data
+    if compressor:
+        yield compressor.flush()
+
+def write_streaming_report(chunks, path, fmt='csv'):
+    """Écrit un rapport chunk par chunk sur disque et retourne le nombre de lignes écrites"""
+    rows = 0
+
+    def counted(chunks):
+        nonlocal rows
+        for chunk in chunks:
+            rows += len(chunk)
+            yield chunk
+
+    with open(path, 'wb') as f:
+        for data in iter_report_bytes(counted(chunks), fmt):
+            f.write(data)
+    return rows
@@ -0,0 +1,255 @@
+"""
+Génération des rapports DOCX en tâche de fond.
+
+Les graphiques sont rendus en parallèle dans un pool de processus (backend Agg)
+et mis en cache par empreinte de contenu dans results/plots/ ; le document est
+ensuite assemblé dans le même pool et stocké dans le cache des rapports
+(services/report_cache.py).
+
+Le suivi des tâches est sur disque (results/report_jobs/<job_id>.json, écrit
+de façon atomique) : avec un serveur préforké, l'état et le téléchargement
+d'une tâche sont servis par n'importe quel worker, et une requête identique en
+cours dans un autre worker est réutilisée (pending/<empreinte>). Une tâche
+dont le worker s'est arrêté passe en erreur. Une tâche terminée est oubliée
+après JOB_TTL secondes, et au-delà de MAX_JOBS tâches les plus anciennes
+terminées sont oubliées en premier.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from sgai.services import report_generator, report_cache, metrics
+
+PLOTS_DIR = os.path.join('results', 'plots')
+JOBS_DIR = os.path.join('results', 'report_jobs')
+PENDING_DIR = os.path.join(JOBS_DIR, 'pending')
+MAX_WORKERS = int(os.environ.get('SGAI_REPORT_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+JOB_TTL = float(os.environ.get('SGAI_REPORT_JOB_TTL', 3600))
+MAX_JOBS = int(os.environ.get('SGAI_REPORT_MAX_JOBS', 1000))
+FINISHED = ('done', 'error')
+
+_executor = None
+_executor_lock = threading.Lock()
+_jobs_lock = threading.Lock()
+
+
+def get_executor():
+    """Pool de processus créé à la première utilisation"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+        return _executor
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f'{job_id}.json')
+
+
+def _write_job(job_id, job):
+    """Écriture atomique (fichier temporaire + os.replace) : un lecteur ne voit jamais d'état partiel"""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    tmp_path = f'{_job_path(job_id)}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, _job_path(job_id))
+
+
+def _read_job(job_id):
+    try:
+        with open(_job_path(job_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _update(job_id, **fields):
+    # Seul le worker qui exécute la tâche la modifie
+    with _jobs_lock:
+        if fields.get('status') in FINISHED:
+            fields['finished_at'] = time.time()
+        job = _read_job(job_id)
+        if job is not None:
+            job.update(fields)
+            _write_job(job_id, job)
+
+
+def _evict_finished():
+    """Oublie les tâches terminées expirées, puis les plus anciennes au-delà de MAX_JOBS"""
+    try:
+        names = [name for name in os.listdir(JOBS_DIR) if name.endswith('.json')]
+    except FileNotFoundError:
+        return
+    entries = []
+    for name in names:
+        try:
+            entries.append((os.path.getmtime(os.path.join(JOBS_DIR, name)), name[:-len('.json')]))
+        except FileNotFoundError:
+            continue
+    now = time.time()
+    excess = len(entries) - MAX_JOBS
+    for mtime, job_id in sorted(entries):
+        if now - mtime <= JOB_TTL and excess <= 0:
+            break
+        job = get_job(job_id)
+        if job is None or job['status'] not in FINISHED:
+            continue
+        try:
+            os.remove(_job_path(job_id))
+        except FileNotFoundError:
+            pass
+        excess -= 1
+
+
+def get_job(job_id):
+    """État d'une tâche (None si inconnue), quel que soit le worker qui l'exécute"""
+    if not job_id.isalnum():
+        return None
+    job = _read_job(job_id)
+    if job is None:
+        return None
+    pid = job.pop('pid', None)
+    if job['status'] not in FINISHED and pid is not None and not _alive(pid):
+        job.update(status='error', error='Worker arrêté avant la fin de la tâche')
+    return job
+
+
+def _claim(cache_key, job_id):
+    """
+    Associe l'empreinte à la tâche, sauf si une tâche en cours (de ce worker ou d'un autre)
+    la rend déjà ; retourne l'identifiant de la tâche retenue
+    """
+    os.makedirs(PENDING_DIR, exist_ok=True)
+    path = os.path.join(PENDING_DIR, cache_key)
+    tmp_path = f'{path}.{job_id}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(job_id)
+    try:
+        for _ in range(3):
+            try:
+                # Création atomique avec son contenu : échoue si l'empreinte est déjà prise
+                os.link(tmp_path, path)
+                return job_id
+            except FileExistsError:
+                pass
+            try:
+                with open(path) as f:
+                    other = f.read()
+            except FileNotFoundError:
+                continue
+            job = get_job(other)
+            if job is not None and job['status'] not in FINISHED:
+                return other
+            # Tâche terminée ou abandonnée : l'empreinte est libérée
+            _release(cache_key, other)
+        return job_id
+    finally:
+        os.remove(tmp_path)
+
+
+def _release(cache_key, job_id):
+    path = os.path.join(PENDING_DIR, cache_key)
+    try:
+        with open(path) as f:
+            if f.read() != job_id:
+                return
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def render_plots(df, charts):
+    """Rend les graphiques manquants en parallèle et retourne leurs chemins dans l'ordre"""
+    os.makedirs(PLOTS_DIR, exist_ok=True)
+    paths, pending = [], []
+    for spec in charts:
+        path = os.path.join(PLOTS_DIR, f'{report_generator.plot_cache_key(df, spec)}.png')
+        paths.append(path)
+        metrics.record_cache('plot', os.path.exists(path))
+        if not os.path.exists(path):
+            columns = [c for c in (spec.get('x'), spec.get('y')) if c in df.columns]
+            tmp_path = f'{path}.{uuid.uuid4().hex}.tmp.png'
+            pending.append((tmp_path, path, get_executor().submit(
+                report_generator.render_plot, df[columns], spec, tmp_path
+            )))
+    for tmp_path, path, future in pending:
+        future.result()
+        os.replace(tmp_path, path)
+    return paths
+
+
+def _build_docx(tmp_path, df, summary, plots, interpretation, charts):
+    plot_paths = list(plots) + render_plots(df, charts)
+    get_executor().submit(
+        report_generator.generate_docx_report,
+        df, tmp_path, summary, plot_paths, interpretation
+    ).result()
+
+
+def _run(job_id, df, output_path, summary, plots, interpretation, charts, cache_key):
+    try:
+        _update(job_id, status='running')
+        if cache_key:
+            path, cached = report_cache.store.get_or_render(
+                cache_key, 'docx',
+                lambda tmp_path: _build_docx(tmp_path, df, summary, plots, interpretation, charts),
+            )
+            _update(job_id, path=path, cached=cached)
+        else:
+            _build_docx(output_path, df, summary, plots, interpretation, charts)
+        _update(job_id, status='done')
+    except Exception as e:
+        _update(job_id, status='error', error=str(e))
+    finally:
+        if cache_key:
+            _release(cache_key, job_id)
+
+
+def submit_docx(df, summary='', plots=None, interpretation='', charts=None, output_path=None, cache_key=None):
+    """
+    Planifie la génération d'un rapport DOCX et retourne l'identifiant de la tâche.
+    Sans output_path, le rapport est stocké dans le cache adressé par contenu (cache_key) :
+    un rapport déjà généré donne une tâche immédiatement terminée, et une requête identique
+    en cours réutilise la tâche existante.
+    """
+    if output_path is not None:
+        cache_key = None
+    elif cache_key is None:
+        cache_key = report_cache.report_key('docx', df.to_dict('records'), summary, interpretation, plots, charts)
+    _evict_finished()
+    job_id = uuid.uuid4().hex
+    cached_path = report_cache.store.lookup(cache_key, 'docx') if cache_key else None
+    if cache_key:
+        metrics.record_cache('report', bool(cached_path))
+    if cached_path:
+        _write_job(job_id, {
+            'status': 'done', 'path': cached_path, 'error': None, 'cached': True, 'finished_at': time.time(),
+        })
+        return job_id
+    _write_job(job_id, {'status': 'pending', 'path': output_path, 'error': None, 'cached': False,
+                        'pid': os.getpid()})
+    if cache_key:
+        claimed = _claim(cache_key, job_id)
+        if claimed != job_id:
+            os.remove(_job_path(job_id))
+            return claimed
+    if output_path is not None:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    threading.Thread(
+        target=_run,
+        args=(job_id, df, output_path, summary, plots or [], interpretation, charts or [], cache_key),
+        daemon=True,
+    ).start()
+    return job_id
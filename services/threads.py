@@ -0,0 +1,173 @@
+"""
+Budget de threads CPU par worker, coordonné entre TensorFlow, OpenMP/BLAS et sklearn.
+
+Sans réglage, chaque bibliothèque dimensionne ses pools sur tous les cœurs :
+avec plusieurs workers (server.py) la machine est sursouscrite. Un seul
+réglage fixe tout :
+
+    SGAI_CPU_THREADS   threads CPU par worker (défaut : cœurs disponibles / SGAI_WORKERS)
+
+Dérivés :
+- TensorFlow : intra-op = budget, inter-op = SGAI_TF_INTER_OP (défaut : min(2, budget)) ;
+- OpenMP/BLAS (threadpoolctl et variables OMP_NUM_THREADS...) et `n_jobs` des
+  estimateurs sklearn : budget / SGAI_THREADS (threads de requêtes par worker),
+  pour que les requêtes concurrentes d'un worker restent dans le budget.
+
+SGAI_THREAD_OVERRIDES ajuste OpenMP par endpoint, ex : "cluster=4,detect_disease=1"
+(nom de la vue ou `blueprint.vue`). La limite OpenMP est propre au thread qui
+traite la requête ; les pools BLAS et TensorFlow sont globaux au processus et
+ne sont donc pas surchargés par endpoint.
+
+configure() doit être appelé avant l'import de TensorFlow et des modèles
+(en tête de main.py) ; report() décrit les réglages effectifs.
+"""
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+BLAS_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _int_env(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def cpu_budget():
+    """Threads CPU alloués à ce worker"""
+    workers = max(1, _int_env('SGAI_WORKERS', 1))
+    return max(1, _int_env('SGAI_CPU_THREADS', available_cpus() // workers))
+
+
+def per_call_threads():
+    """Threads OpenMP/BLAS et n_jobs d'un appel, partagés entre les threads de requêtes du worker"""
+    return max(1, cpu_budget() // max(1, _int_env('SGAI_THREADS', 1)))
+
+
+def n_jobs():
+    """`n_jobs` des estimateurs sklearn"""
+    return per_call_threads()
+
+
+def _parse_overrides(spec):
+    """'vue=n,...' -> {vue: n} ; une entrée mal formée est ignorée (avertissement), pas fatale au démarrage"""
+    overrides = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        name, _, value = item.partition('=')
+        try:
+            if not name.strip():
+                raise ValueError('nom de vue manquant')
+            overrides[name.strip()] = max(1, int(value))
+        except ValueError as e:
+            logger.warning(f"[THREADS] Entrée SGAI_THREAD_OVERRIDES ignorée: {item.strip()!r} ({e})")
+    return overrides
+
+
+OVERRIDES = _parse_overrides(os.environ.get('SGAI_THREAD_OVERRIDES', ''))
+
+_settings = {}
+
+
+def _configure_tensorflow(budget):
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return None
+    inter_op = _int_env('SGAI_TF_INTER_OP', min(2, budget))
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(budget)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    except RuntimeError as e:
+        # Le runtime TF est déjà initialisé : les pools existants sont conservés
+        logger.warning(f"[THREADS] TensorFlow déjà initialisé, budget non appliqué: {e}")
+    return {
+        'intra_op': tf.config.threading.get_intra_op_parallelism_threads(),
+        'inter_op': tf.config.threading.get_inter_op_parallelism_threads(),
+    }
+
+
+def configure():
+    """Applique le budget au processus (idempotent) et journalise le rapport"""
+    if _settings:
+        return report()
+    budget = cpu_budget()
+    per_call = per_call_threads()
+    # Lues au chargement des bibliothèques natives (valeur initiale d'OpenMP pour chaque
+    # thread de requête) ; un réglage explicite est respecté
+    for var in BLAS_ENV_VARS:
+        os.environ.setdefault(var, str(per_call))
+    # Bibliothèques déjà chargées par un import antérieur
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=per_call)
+    _settings.update({
+        'budget': budget,
+        'per_call': per_call,
+        'tensorflow': _configure_tensorflow(budget),
+    })
+    info = report()
+    print(f"[INFO] Budget de threads : {info['budget']} par worker "
+          f"(OpenMP/BLAS et n_jobs : {info['per_call']}, TensorFlow : {info['tensorflow']}, "
+          f"surcharges : {info['overrides'] or 'aucune'})")
+    return info
+
+
+def report():
+    """Réglages effectifs : budget, pools natifs chargés (threadpoolctl), TensorFlow, surcharges"""
+    from threadpoolctl import threadpool_info
+    return {
+        'cpus': available_cpus(),
+        'workers': max(1, _int_env('SGAI_WORKERS', 1)),
+        'request_threads': max(1, _int_env('SGAI_THREADS', 1)),
+        'budget': _settings.get('budget', cpu_budget()),
+        'per_call': _settings.get('per_call', per_call_threads()),
+        'sklearn_n_jobs': n_jobs(),
+        'tensorflow': _settings.get('tensorflow'),
+        'native_pools': [
+            {'api': pool['internal_api'], 'library': os.path.basename(pool['filepath']),
+             'threads': pool['num_threads']}
+            for pool in threadpool_info()
+        ],
+        'env': {var: os.environ.get(var) for var in BLAS_ENV_VARS},
+        'overrides': dict(OVERRIDES),
+    }
+
+
+def endpoint_threads(endpoint):
+    """Threads OpenMP pour un endpoint Flask (`blueprint.vue`), None sans surcharge"""
+    if not endpoint:
+        return None
+    return OVERRIDES.get(endpoint, OVERRIDES.get(endpoint.rsplit('.', 1)[-1]))
+
+
+def init_app(app):
+    """Applique les surcharges OpenMP par endpoint pendant le traitement de la requête"""
+    from flask import g, request
+
+    if not OVERRIDES:
+        return app
+
+    @app.before_request
+    def _limit_threads():
+        limit = endpoint_threads(request.endpoint)
+        if limit is not None:
+            from threadpoolctl import threadpool_limits
+            g._sgai_thread_limits = threadpool_limits(limits=limit, user_api='openmp')
+
+    @app.teardown_request
+    def _restore_threads(exc=None):
+        limits = g.pop('_sgai_thread_limits', None)
+        if limits is not None:
+            limits.restore_original_limits()
+
+    return app
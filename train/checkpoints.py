@@ -0,0 +1,214 @@
+"""
+Points de reprise par étape pour les pipelines d'entraînement (train_model.py).
+
+Chaque étape déclare les valeurs qu'elle lit et celles qu'elle produit. Sa
+sortie est enregistrée dans results/checkpoints/<étape>-<empreinte>/ ; l'empreinte
+combine le code de l'étape, la configuration, les fichiers d'entrée éventuels
+et les empreintes des étapes précédentes. Les empreintes ne dépendent pas des
+sorties : elles sont toutes calculables avant d'exécuter quoi que ce soit, et
+un nouveau lancement reprend à la première étape dont le point de reprise
+n'existe pas (ou plus). Seules les sorties des étapes antérieures réellement
+lues par la suite sont rechargées.
+
+Les durées et le pic de mémoire résidente de chaque étape sont écrits dans
+results/pipeline_stages.json.
+"""
+import os
+import json
+import time
+import shutil
+import inspect
+import hashlib
+import threading
+import joblib
+from sgai.services import metrics
+
+CHECKPOINT_DIR = os.path.join('results', 'checkpoints')
+REPORT_PATH = os.path.join('results', 'pipeline_stages.json')
+OUTPUT_FILE = 'outputs.joblib'
+
+
+class Stage:
+    """
+    Étape du pipeline : `run(**entrées)` retourne un dict {sortie: valeur}.
+    `code` liste les fonctions dont le source entre dans l'empreinte, `files` retourne
+    les fichiers lus (empreinte par taille et date), `save`/`load` remplacent
+    joblib pour les sorties non sérialisables (modèles Keras).
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), code=(), files=None, save=None, load=None):
+        self.name = name
+        self.run = run
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.code = (run,) + tuple(code)
+        self.files = files
+        self.save = save
+        self.load = load
+
+
+def files_signature(paths):
+    """Nom, taille et date de modification de chaque fichier (sans lire le contenu)"""
+    signature = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        signature.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+    return signature
+
+
+def _source(func):
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return getattr(func, '__qualname__', repr(func))
+
+
+class _PeakRss:
+    """Échantillonne la mémoire résidente pendant une étape"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start = self.peak = metrics.rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, metrics.rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, metrics.rss_bytes())
+
+
+class Pipeline:
+    """Suite d'étapes avec points de reprise indexés par empreinte"""
+
+    def __init__(self, stages, config, root=CHECKPOINT_DIR, report_path=REPORT_PATH):
+        self.stages = list(stages)
+        self.config = config
+        self.root = root
+        self.report_path = report_path
+
+    def names(self):
+        return [stage.name for stage in self.stages]
+
+    def index(self, name):
+        if name not in self.names():
+            raise ValueError(f"Étape inconnue: {name}. Étapes : {', '.join(self.names())}")
+        return self.names().index(name)
+
+    def keys(self):
+        """Empreinte de chaque étape, chaînée avec celle de l'étape précédente"""
+        keys = []
+        previous = ''
+        for stage in self.stages:
+            digest = hashlib.sha256()
+            digest.update(stage.name.encode('utf-8'))
+            digest.update(previous.encode('utf-8'))
+            digest.update(json.dumps(self.config, sort_keys=True, default=str).encode('utf-8'))
+            for func in stage.code:
+                digest.update(_source(func).encode('utf-8'))
+            if stage.files is not None:
+                digest.update(json.dumps(files_signature(stage.files())).encode('utf-8'))
+            previous = digest.hexdigest()[:16]
+            keys.append(previous)
+        return keys
+
+    def path(self, stage, key):
+        return os.path.join(self.root, f'{stage.name}-{key}')
+
+    def exists(self, stage, key):
+        return os.path.exists(os.path.join(self.path(stage, key), OUTPUT_FILE))
+
+    def _save(self, stage, key, outputs):
+        final = self.path(stage, key)
+        tmp = f'{final}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        values = dict(outputs)
+        if stage.save is not None:
+            values = stage.save(values, tmp)
+        joblib.dump(values, os.path.join(tmp, OUTPUT_FILE))
+        # Les anciennes versions de l'étape sont remplacées (une seule empreinte conservée par étape)
+        for entry in os.listdir(self.root):
+            if entry.startswith(f'{stage.name}-') and '.tmp-' not in entry:
+                shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+        os.replace(tmp, final)
+
+    def _load(self, stage, key):
+        path = self.path(stage, key)
+        values = joblib.load(os.path.join(path, OUTPUT_FILE))
+        if stage.load is not None:
+            values = stage.load(values, path)
+        return values
+
+    def status(self):
+        """[(étape, empreinte, point de reprise présent)]"""
+        return [(stage.name, key, self.exists(stage, key)) for stage, key in zip(self.stages, self.keys())]
+
+    def run(self, start=None, only=None, force=False):
+        """
+        Exécute le pipeline. Sans argument, reprend à la première étape sans point de
+        reprise valide ; `start` force la reprise à une étape donnée, `only` exécute
+        une seule étape (les étapes amont invalidées sont d'abord recalculées) et
+        `force` recalcule tout.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        keys = self.keys()
+        last = self.index(only) if only else len(self.stages) - 1
+        first = next((i for i in range(last + 1) if force or not self.exists(self.stages[i], keys[i])), last + 1)
+        if start is not None:
+            first = min(first, self.index(start))
+        if only and first > last:
+            first = last
+
+        # Valeurs des étapes antérieures lues à partir de `first`, chargées depuis leur point de reprise
+        state = {}
+        needed = {name for stage in self.stages[first:last + 1] for name in stage.inputs}
+        if first > last:
+            # Tout est à jour : les résultats de la dernière étape sont relus
+            needed = set(self.stages[last].outputs)
+        for i in range(first - 1, -1, -1):
+            stage = self.stages[i]
+            wanted = needed.intersection(stage.outputs) - state.keys()
+            if wanted:
+                outputs = self._load(stage, keys[i])
+                state.update({name: outputs[name] for name in wanted})
+
+        report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': []}
+        for stage, key in zip(self.stages[:first], keys[:first]):
+            report['stages'].append({'stage': stage.name, 'key': key, 'status': 'checkpoint'})
+        try:
+            for i in range(first, last + 1):
+                stage = self.stages[i]
+                print(f"\n[PIPELINE] Étape {i + 1}/{len(self.stages)} : {stage.name} ({keys[i]})")
+                started = time.perf_counter()
+                with _PeakRss() as memory:
+                    outputs = stage.run(**{name: state[name] for name in stage.inputs}) or {}
+                seconds = time.perf_counter() - started
+                state.update(outputs)
+                self._save(stage, keys[i], {name: outputs[name] for name in stage.outputs})
+                report['stages'].append({
+                    'stage': stage.name, 'key': keys[i], 'status': 'ran',
+                    'seconds': round(seconds, 3),
+                    'rss_start_bytes': memory.start,
+                    'peak_rss_bytes': memory.peak,
+                    'peak_rss_increase_bytes': memory.peak - memory.start,
+                })
+                print(f"[PIPELINE] {stage.name} : {seconds:.2f} s, pic RSS {memory.peak / 2**20:.1f} Mo")
+        finally:
+            self._write_report(report)
+        return state
+
+    def _write_report(self, report):
+        os.makedirs(os.path.dirname(self.report_path), exist_ok=True)
+        with open(self.report_path, 'w') as f:
+            json.dump(report, f, indent=2)
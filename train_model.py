@@ -22,7 +22,6 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import (
     StandardScaler, LabelEncoder, PowerTransformer
 )
-from sklearn.impute import SimpleImputer
 from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.feature_selection import mutual_info_regression
 import joblib
@@ -33,6 +32,15 @@ import warnings
 import shutil
 import unicodedata
 from collections import defaultdict
+from types import SimpleNamespace
+import argparse
+import sys
+
+# Rendre le package sgai importable quand ce fichier est lancé directement (python train_model.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sgai.train import checkpoints
+from sgai.ml import catalog, distill
 
 # Désactiver les warnings
 warnings.filterwarnings('ignore')
@@ -54,6 +62,13 @@ class Config:
     MODEL_SAVE_PATH = 'models/production_model_final.h5'
     TARGET_KEYWORDS = ['production', 'prod', 'output', 'yield', 'quantite', 'volume', 'rendement']
     NUMERIC_FALLBACKS = ['production', 'prod', 'yield']
+    # Représentation mémoire du jeu combiné (voir load_all_data)
+    COMPACT_DTYPES = True
+    DATA_LAYOUT = 'wide'  # 'wide' : une colonne par année/région (creuse) ; 'long' : (Année | Région, Valeur)
+    SPARSE_NAN_RATIO = 0.5
+    CATEGORY_MAX_RATIO = 0.5
+    REGIONS = ['ADAMAOUA', 'CENTRE', 'EST', 'EXTREME NORD', 'LITTORAL', 'NORD',
+               'NORD OUEST', 'OUEST', 'SUD', 'SUD OUEST', 'Total']
 
 config = Config()
 np.random.seed(config.SEED)
@@ -70,12 +85,15 @@ def normalize_string(s):
     return s
 
 # 2. Inspection des fichiers CSV
-def inspect_csv_files():
-    """Inspecte tous les fichiers CSV pour identifier les colonnes disponibles"""
-    data_dir = "data"
-    all_files = glob.glob(os.path.join(data_dir, "*.csv"))
-    
-    if not all_files:
+def inspect_csv_files(data_dir="data"):
+    """
+    Colonnes disponibles dans chaque fichier CSV, lues dans le catalogue de schémas
+    (ml/catalog.py) : seuls les fichiers nouveaux ou modifiés sont ouverts.
+    """
+    schemas = catalog.for_dir(data_dir)
+    changed = schemas.refresh()
+    
+    if not schemas.names():
         raise FileNotFoundError(f"Aucun fichier CSV trouvé dans {data_dir}")
     
     column_report = defaultdict(list)
@@ -83,31 +101,82 @@ def inspect_csv_files():
     print("\n" + "="*80)
     print("INSPECTION DES FICHIERS CSV")
     print("="*80)
+    print(f"Catalogue : {len(schemas.names())} fichiers, {len(changed)} reprofilés")
     
-    for file in all_files:
-        try:
-            # Lire juste l'en-tête
-            with open(file, 'r', encoding='utf-8', errors='replace') as f:
-                header = f.readline().strip()
-            
-            columns = header.split(',')
-            filename = os.path.basename(file)
-            
-            print(f"\nFichier: {filename}")
-            print(f"Colonnes: {columns}")
-            
-            for col in columns:
-                column_report[col].append(filename)
-                
-        except Exception as e:
-            print(f"Erreur avec {file}: {str(e)}")
+    for filename in schemas.names():
+        entry = schemas.entry(filename)
+        columns = schemas.columns(filename)
+        print(f"\nFichier: {filename} ({entry['rows']} lignes, encodage {entry['encoding']}, séparateur {entry['sep']!r})")
+        print(f"Colonnes: {columns}")
+        
+        for col in columns:
+            column_report[col].append(filename)
     
     return column_report
 
 # 3. Chargement des fichiers CSV
-def load_all_data():
-    """Charge tous les fichiers CSV disponibles sans cible spécifique"""
-    data_dir = "data"
+YEAR_COLUMN = re.compile(r'^(19|20)\d{2}$')
+
+def pivot_kind(col):
+    """'annee' ou 'region' pour une colonne de tableau croisé (une colonne par année ou par région)"""
+    col = str(col).strip()
+    if YEAR_COLUMN.match(col):
+        return 'annee'
+    if normalize_string(col) in {normalize_string(region) for region in config.REGIONS}:
+        return 'region'
+    return None
+
+def to_long_format(df):
+    """Dépivote les colonnes année/région : (identifiants..., Année | Région, Valeur)"""
+    for kind, var_name in (('annee', 'Année'), ('region', 'Région')):
+        pivots = [col for col in df.columns if pivot_kind(col) == kind]
+        if not pivots or var_name in df.columns:
+            continue
+        id_vars = [col for col in df.columns if col not in pivots]
+        df = df.melt(id_vars=id_vars, value_vars=pivots, var_name=var_name, value_name='Valeur')
+        # Cellules vides ou non numériques ('-') : pas de ligne
+        df['Valeur'] = pd.to_numeric(df['Valeur'].astype(object), errors='coerce')
+        df = df.dropna(subset=['Valeur'])
+        df[var_name] = pd.to_numeric(df[var_name]) if kind == 'annee' else df[var_name].astype('category')
+    return df
+
+def downcast_numeric(series):
+    """Entiers au plus petit type entier, flottants en float32 si la conversion est exacte"""
+    values = series.sparse.to_dense() if isinstance(series.dtype, pd.SparseDtype) else series
+    if values.notna().all() and (values % 1 == 0).all():
+        return pd.to_numeric(values, downcast='integer')
+    as_float32 = values.astype('float32')
+    if ((as_float32.astype('float64') == values) | values.isna()).all():
+        return as_float32
+    return values
+
+def compact_frame(df):
+    """
+    Types compacts pour le jeu combiné : colonnes numériques surtout vides en creux
+    (seules les valeurs présentes sont stockées), autres colonnes numériques réduites,
+    chaînes répétées en catégories.
+    """
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series.dtype) or isinstance(series.dtype, pd.SparseDtype):
+            values = downcast_numeric(series)
+            if values.isna().mean() > config.SPARSE_NAN_RATIO:
+                values = values.astype(pd.SparseDtype(values.dtype, np.nan))
+            df[col] = values
+        elif col == 'source_file' or series.nunique() <= config.CATEGORY_MAX_RATIO * max(len(series), 1):
+            df[col] = series.astype('category')
+    return df
+
+def load_all_data(data_dir="data", compact=None, layout=None):
+    """
+    Charge tous les fichiers CSV disponibles sans cible spécifique.
+    Avec compact (Config.COMPACT_DTYPES), les colonnes numériques de chaque fichier
+    sont creuses avant l'union, ce qui évite de matérialiser la table large remplie
+    de NaN ; avec layout='long', les colonnes année/région sont dépivotées.
+    """
+    compact = config.COMPACT_DTYPES if compact is None else compact
+    layout = layout or config.DATA_LAYOUT
+    schemas = catalog.for_dir(data_dir)
     all_files = glob.glob(os.path.join(data_dir, "*.csv"))
     
     if not all_files:
@@ -116,19 +185,22 @@ def load_all_data():
     dfs = []
     for file in all_files:
         try:
-            # Essayer plusieurs encodages
-            for encoding in ['utf-8', 'latin1', 'ISO-8859-1']:
-                try:
-                    df = pd.read_csv(file, encoding=encoding, on_bad_lines='skip')
-                    print(f"Chargé: {file} (encodage: {encoding})")
-                    break
-                except UnicodeDecodeError:
-                    continue
-                except Exception as e:
-                    print(f"Erreur avec {file} ({encoding}): {str(e)}")
+            # Encodage et séparateur détectés une fois pour toutes par le catalogue
+            options = schemas.read_options(file)
+            df = pd.read_csv(file, on_bad_lines='skip', **options)
+            print(f"Chargé: {file} (encodage: {options['encoding']}, séparateur: {options['sep']!r})")
             
+            if compact:
+                # Libellés répétés (produits, régions...) en catégories dès la lecture
+                for col in df.columns:
+                    if not pd.api.types.is_numeric_dtype(df[col]):
+                        df[col] = df[col].astype('category')
+            if layout == 'long':
+                df = to_long_format(df)
             # Ajouter le nom du fichier comme colonne
             df['source_file'] = os.path.basename(file)
+            if compact:
+                df['source_file'] = df['source_file'].astype('category')
             dfs.append(df)
         except Exception as e:
             print(f"Erreur avec {file}: {str(e)}")
@@ -137,8 +209,28 @@ def load_all_data():
     if not dfs:
         raise ValueError("Aucun DataFrame valide n'a pu être chargé")
     
+    if compact:
+        # Colonnes numériques dans tous les fichiers qui les contiennent : creuses avant l'union
+        # (une colonne numérique ici et textuelle ailleurs reste telle quelle)
+        mixed = {col for df in dfs for col in df.columns if not pd.api.types.is_numeric_dtype(df[col])}
+        for df in dfs:
+            for col in df.select_dtypes(include=np.number).columns.difference(mixed):
+                df[col] = df[col].astype(pd.SparseDtype('float64', np.nan))
+        # Catégories communes à tous les fichiers : l'union reste catégorielle
+        columns = {col for df in dfs for col in df.columns}
+        for col in columns:
+            series = [df[col] for df in dfs if col in df.columns]
+            if len(series) < 2 or not all(isinstance(s.dtype, pd.CategoricalDtype) for s in series):
+                continue
+            union = series[0].cat.categories.append([s.cat.categories for s in series[1:]]).unique()
+            for df in dfs:
+                if col in df.columns:
+                    df[col] = df[col].cat.set_categories(union)
     combined_df = pd.concat(dfs, ignore_index=True, sort=False)
-    print(f"\nTotal des données combinées: {len(combined_df)} lignes, {len(combined_df.columns)} colonnes")
+    if compact:
+        combined_df = compact_frame(combined_df)
+    print(f"\nTotal des données combinées: {len(combined_df)} lignes, {len(combined_df.columns)} colonnes"
+          f" ({combined_df.memory_usage(deep=True).sum() / 2**20:.2f} Mo)")
     
     return combined_df
 
@@ -184,6 +276,14 @@ def select_target_column(df):
     raise ValueError("Aucune colonne numérique valide trouvée pour la cible")
 
 # 5. Nettoyage des données
+def column_median(series):
+    """Médiane des valeurs présentes, calculée sur les seules valeurs stockées d'une colonne creuse"""
+    if isinstance(series.dtype, pd.SparseDtype):
+        if pd.isna(series.sparse.fill_value):
+            return pd.Series(series.sparse.sp_values).median()
+        series = series.sparse.to_dense()
+    return series.median()
+
 def clean_data(df, target_col):
     """Nettoie et prépare le DataFrame avec validation de la cible"""
     # Supprimer les colonnes vides
@@ -197,9 +297,11 @@ def clean_data(df, target_col):
     if target_col not in df.columns:
         available_cols = "\n".join(df.columns)
         raise ValueError(f"Colonne cible '{target_col}' non trouvée après nettoyage. Colonnes disponibles:\n{available_cols}")
+    if isinstance(df[target_col].dtype, pd.SparseDtype):
+        df[target_col] = df[target_col].sparse.to_dense()
     
     # Vérifier le type de la cible
-    if not np.issubdtype(df[target_col].dtype, np.number):
+    if not pd.api.types.is_numeric_dtype(df[target_col]):
         print(f"Conversion de la cible en numérique: '{target_col}'")
         try:
             # Tenter la conversion numérique
@@ -236,19 +338,23 @@ def clean_data(df, target_col):
     print(f"Colonnes catégorielles: {len(categorical_cols)}")
     print(f"Colonne cible: '{target_col}'")
     
-    # Gestion des valeurs manquantes
-    imputer_num = SimpleImputer(strategy='median')
-    imputer_cat = SimpleImputer(strategy='most_frequent')
-    
-    if numeric_cols:
-        df[numeric_cols] = imputer_num.fit_transform(df[numeric_cols])
-    if categorical_cols:
-        df[categorical_cols] = imputer_cat.fit_transform(df[categorical_cols])
+    # Gestion des valeurs manquantes, colonne par colonne (médiane / valeur la plus fréquente,
+    # comme SimpleImputer) pour conserver les types compacts sans copie de toute la table.
+    # Colonne creuse : la médiane devient sa valeur de remplissage, elle reste creuse
+    for col in numeric_cols:
+        if df[col].isna().any():
+            df[col] = df[col].fillna(column_median(df[col]))
+    for col in categorical_cols:
+        if df[col].isna().any():
+            mode = df[col].mode()
+            # Colonne sans aucune valeur : rien à imputer
+            if not mode.empty:
+                df[col] = df[col].fillna(mode.iloc[0])
     
     # Remplacer les valeurs manquantes dans la cible par la médiane
     if df[target_col].isnull().any():
         median_target = df[target_col].median()
-        df[target_col].fillna(median_target, inplace=True)
+        df[target_col] = df[target_col].fillna(median_target)
         print(f"Valeurs manquantes dans la cible remplacées par la médiane: {median_target}")
     
     # Supprimer les colonnes avec peu de variance
@@ -301,12 +407,13 @@ def feature_engineering(df, target_col):
     
     # Encoder les variables catégorielles pour MI
     X_encoded = X.copy()
-    for col in X_encoded.select_dtypes(include='object').columns:
+    for col in X_encoded.select_dtypes(exclude=np.number).columns:
         le = LabelEncoder()
         X_encoded[col] = le.fit_transform(X_encoded[col].astype(str))
     
     # Calculer les scores MI
-    mi_scores = mutual_info_regression(X_encoded, y, random_state=config.SEED)
+    # En float64 : scores identiques quel que soit le type compact des colonnes
+    mi_scores = mutual_info_regression(X_encoded.astype(np.float64), y.astype(np.float64), random_state=config.SEED)
     mi_scores = pd.Series(mi_scores, index=X_encoded.columns)
     mi_scores = mi_scores.sort_values(ascending=False)
     
@@ -555,8 +662,136 @@ def save_full_model(model, target_col, X_train):
     
     return feature_names
 
-# 12. Pipeline principal
-def main():
+# 12. Étapes du pipeline (points de reprise : train/checkpoints.py)
+def data_files():
+    """Fichiers CSV lus par le pipeline (leur taille et date entrent dans l'empreinte)"""
+    return glob.glob(os.path.join("data", "*.csv"))
+
+def stage_inspect():
+    return {'column_report': dict(inspect_csv_files())}
+
+def stage_load():
+    return {'df': load_all_data()}
+
+def stage_target(df):
+    target_col = select_target_column(df)
+    print(f"Colonne cible sélectionnée: '{target_col}'")
+    # select_target_column peut convertir une colonne de df en numérique
+    return {'df': df, 'target_col': target_col}
+
+def stage_clean(df, target_col):
+    df_clean, target_col = clean_data(df, target_col)
+    print("\nAperçu des données nettoyées:")
+    print(df_clean.head())
+    return {'df_clean': df_clean, 'target_col': target_col}
+
+def stage_features(df_clean, target_col):
+    df_fe, target_col = feature_engineering(df_clean, target_col)
+    print("\nAperçu des données transformées:")
+    print(df_fe.head())
+    return {'df_fe': df_fe, 'target_col': target_col}
+
+def stage_prepare(df_fe, target_col):
+    X_train, X_val, X_test, y_train, y_val, y_test = prepare_data(df_fe, target_col)
+    return {'X_train': X_train, 'X_val': X_val, 'X_test': X_test,
+            'y_train': y_train, 'y_val': y_val, 'y_test': y_test}
+
+def stage_build(X_train):
+    model = create_advanced_model(X_train.shape[1])
+    model.summary()
+    return {'model': model}
+
+def stage_train(model, X_train, y_train, X_val, y_val):
+    history = train_model(model, X_train, y_train, X_val, y_val)
+    # Seules les courbes sont conservées (l'objet History référence le modèle)
+    return {'model': model, 'history': SimpleNamespace(history=history.history)}
+
+def stage_evaluate(model, X_test, y_test, history):
+    return {'metrics': evaluate_model(model, X_test, y_test, history)}
+
+def stage_save(model, target_col, X_train):
+    return {'feature_names': save_full_model(model, target_col, X_train)}
+
+def keras_predict(model):
+    """Prédiction 1D du MLP (appel direct pour les petits lots, comme KerasBackend)"""
+    def predict(X):
+        X = np.asarray(X, dtype='float32')
+        y = model(X, training=False).numpy() if len(X) <= 256 else model.predict(X, verbose=0)
+        return y.ravel()
+    return predict
+
+def stage_distill(model, X_train, X_test, y_test):
+    """Élèves du MLP (ml/distill.py) : compromis précision / latence et élève retenu"""
+    students, record = distill.distill(keras_predict(model), X_train, X_test, y_test, seed=config.SEED)
+    selected = distill.select_student(record)
+    record['selected'] = selected
+    name = os.path.splitext(os.path.basename(config.MODEL_SAVE_PATH))[0]
+    if selected:
+        joblib.dump(students[selected], os.path.join('models', f'student_{name}.pkl'))
+        print(f"Élève retenu ({selected}) : models/student_{name}.pkl")
+    distill.write_record(name, record, os.path.join('results', 'distillation.json'))
+    return {'distillation': record}
+
+def save_keras_output(values, path):
+    """Le modèle Keras est enregistré au format .keras à côté des autres sorties"""
+    values = dict(values)
+    values.pop('model').save(os.path.join(path, 'model.keras'))
+    return values
+
+def load_keras_output(values, path):
+    values = dict(values)
+    values['model'] = tf.keras.models.load_model(os.path.join(path, 'model.keras'))
+    return values
+
+STAGES = [
+    checkpoints.Stage('inspect', stage_inspect, outputs=['column_report'],
+                      code=[inspect_csv_files, catalog.profile_file], files=data_files),
+    checkpoints.Stage('load', stage_load, outputs=['df'], code=[load_all_data, catalog.profile_file],
+                      files=data_files),
+    checkpoints.Stage('target', stage_target, inputs=['df'], outputs=['df', 'target_col'],
+                      code=[select_target_column, normalize_string]),
+    checkpoints.Stage('clean', stage_clean, inputs=['df', 'target_col'], outputs=['df_clean', 'target_col'],
+                      code=[clean_data, normalize_string]),
+    checkpoints.Stage('features', stage_features, inputs=['df_clean', 'target_col'],
+                      outputs=['df_fe', 'target_col'], code=[feature_engineering]),
+    checkpoints.Stage('prepare', stage_prepare, inputs=['df_fe', 'target_col'],
+                      outputs=['X_train', 'X_val', 'X_test', 'y_train', 'y_val', 'y_test'], code=[prepare_data]),
+    checkpoints.Stage('build', stage_build, inputs=['X_train'], outputs=['model'],
+                      code=[create_advanced_model], save=save_keras_output, load=load_keras_output),
+    checkpoints.Stage('train', stage_train, inputs=['model', 'X_train', 'y_train', 'X_val', 'y_val'],
+                      outputs=['model', 'history'], code=[train_model],
+                      save=save_keras_output, load=load_keras_output),
+    checkpoints.Stage('evaluate', stage_evaluate, inputs=['model', 'X_test', 'y_test', 'history'],
+                      outputs=['metrics'], code=[evaluate_model]),
+    checkpoints.Stage('save', stage_save, inputs=['model', 'target_col', 'X_train'],
+                      outputs=['feature_names'], code=[save_full_model]),
+    checkpoints.Stage('distill', stage_distill, inputs=['model', 'X_train', 'X_test', 'y_test'],
+                      outputs=['distillation'],
+                      code=[keras_predict, distill.distill, distill.student_candidates, distill.synthetic_samples,
+                            distill.prune_forest, distill.measure_latency, distill.select_student]),
+]
+
+def config_fingerprint():
+    """Paramètres de Config pris en compte dans l'empreinte des étapes"""
+    return {key: value for key, value in vars(Config).items() if not key.startswith('_')}
+
+# 13. Pipeline principal
+def main(argv=None):
+    pipeline = checkpoints.Pipeline(STAGES, config_fingerprint())
+    parser = argparse.ArgumentParser(description="Pipeline d'entraînement avec points de reprise par étape")
+    parser.add_argument('--stage', choices=pipeline.names(),
+                        help="exécute uniquement cette étape (les étapes amont invalidées sont recalculées)")
+    parser.add_argument('--from', dest='start', choices=pipeline.names(),
+                        help="reprend à cette étape même si son point de reprise est valide")
+    parser.add_argument('--force', action='store_true', help="recalcule toutes les étapes")
+    parser.add_argument('--list', action='store_true', help="affiche l'état des points de reprise et quitte")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, key, present in pipeline.status():
+            print(f"{name:<10} {key}  {'à jour' if present else 'à recalculer'}")
+        return
+
     print("="*80)
     print("🚀 DÉMARRAGE DU PIPELINE DE DEEP LEARNING AVANCÉ")
     print("="*80)
@@ -567,77 +802,18 @@ def main():
     os.makedirs("data", exist_ok=True)
     
     try:
-        # Étape 1: Inspection des fichiers
-        print("\n" + "="*80)
-        print("ÉTAPE 1: INSPECTION DES FICHIERS CSV")
-        print("="*80)
-        column_report = inspect_csv_files()
-        
-        # Étape 2: Chargement des données
-        print("\n" + "="*80)
-        print("ÉTAPE 2: CHARGEMENT DES DONNÉES")
-        print("="*80)
-        df = load_all_data()
-        
-        # Étape 3: Sélection de la cible
-        print("\n" + "="*80)
-        print("ÉTAPE 3: SÉLECTION DE LA COLONNE CIBLE")
-        print("="*80)
-        target_col = select_target_column(df)
-        print(f"Colonne cible sélectionnée: '{target_col}'")
-        
-        # Étape 4: Nettoyage des données
-        print("\n" + "="*80)
-        print("ÉTAPE 4: NETTOYAGE DES DONNÉES")
-        print("="*80)
-        df_clean, target_col = clean_data(df, target_col)
-        print("\nAperçu des données nettoyées:")
-        print(df_clean.head())
-        
-        # Étape 5: Feature Engineering
-        print("\n" + "="*80)
-        print("ÉTAPE 5: FEATURE ENGINEERING")
-        print("="*80)
-        df_fe, target_col = feature_engineering(df_clean, target_col)
-        print("\nAperçu des données transformées:")
-        print(df_fe.head())
-        
-        # Étape 6: Préparation des données
-        print("\n" + "="*80)
-        print("ÉTAPE 6: PRÉPARATION DES DONNÉES")
-        print("="*80)
-        X_train, X_val, X_test, y_train, y_val, y_test = prepare_data(df_fe, target_col)
-        
-        # Étape 7: Construction du modèle
-        print("\n" + "="*80)
-        print("ÉTAPE 7: CONSTRUCTION DU MODÈLE")
-        print("="*80)
-        model = create_advanced_model(X_train.shape[1])
-        model.summary()
-        
-        # Étape 8: Entraînement
-        print("\n" + "="*80)
-        print("ÉTAPE 8: ENTRAÎNEMENT DU MODÈLE")
-        print("="*80)
-        history = train_model(model, X_train, y_train, X_val, y_val)
-        
-        # Étape 9: Évaluation
-        print("\n" + "="*80)
-        print("ÉTAPE 9: ÉVALUATION DU MODÈLE")
-        print("="*80)
-        metrics = evaluate_model(model, X_test, y_test, history)
-        
-        # Étape 10: Sauvegarde finale
-        print("\n" + "="*80)
-        print("ÉTAPE 10: SAUVEGARDE FINALE")
-        print("="*80)
-        feature_names = save_full_model(model, target_col, X_train)
+        state = pipeline.run(start=args.start, only=args.stage, force=args.force)
+        print(f"\nDurées et pic mémoire des étapes : {pipeline.report_path}")
+        if args.stage or 'distillation' not in state:
+            return
         
         print("\n" + "="*80)
         print("✅ PIPELINE TERMINÉ AVEC SUCCÈS!")
         print("="*80)
         print(f"Le modèle est prêt à être utilisé dans le dossier: {os.path.abspath('models')}")
-        print(f"Caractéristiques utilisées: {feature_names}")
+        if 'feature_names' in state:
+            print(f"Caractéristiques utilisées: {state['feature_names']}")
+        print(f"Élève distillé: {state['distillation']['selected'] or 'aucun assez fidèle'} (results/distillation.json)")
         
     except Exception as e:
         print(f"\n❌ ERREUR CRITIQUE: {str(e)}")